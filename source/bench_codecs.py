@@ -0,0 +1,137 @@
+"""
+Parity check and throughput benchmark of the table-driven codecs.
+
+Decodes random payloads for every DID in the codec schema ('json/codec/codecs.json') with the
+compiled table codec and the hand-written reference class, reports any difference in the states
+or decoded strings, then measures the decodes per second of both.  The decode and debug log done
+for each response is measured with debug logging off and on, the decoded strings are only built
+when the debug log is written.
+
+    python3 bench_codecs.py [payloads=1000] [decodes=100000]
+"""
+
+import sys
+import os
+import logging
+import random
+from time import perf_counter
+
+import logfiles
+import version
+from config import config_from_dict
+from codec_manager import CodecManager
+from exceptions import FailedInitialization, RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+def random_payloads(codec, count: int) -> list:
+    if codec.did_name == 'VehicleID':
+        return [bytes(random.choice(b'0123456789ABCDEFGHJKLMNPRSTUVWXYZ') for _ in range(len(codec))) for _ in range(count)]
+    return [random.randbytes(len(codec)) for _ in range(count)]
+
+
+def parity(codec_manager: CodecManager, payload_count: int) -> int:
+    failures = 0
+    for did_id, table_codec in CodecManager._compiled_codecs.items():
+        reference_codec = codec_manager.reference_codec(did_id)
+        for payload in random_payloads(table_codec, payload_count):
+            expected = reference_codec.decode(payload)
+            actual = table_codec.decode(payload)
+            if expected.get('states') != actual.get('states') or str(expected.get('decoded')) != str(actual.get('decoded')):
+                failures += 1
+                if failures <= 10:
+                    _LOGGER.error(f"{did_id:04X} {table_codec.did_name} payload {payload.hex()}: expected {expected.get('states')} '{expected.get('decoded')}', "
+                                  f"decoded {actual.get('states')} '{actual.get('decoded')}'")
+    return failures
+
+
+def throughput(codec_manager: CodecManager, decodes: int) -> None:
+    decode_list = []
+    for did_id, table_codec in CodecManager._compiled_codecs.items():
+        decode_list += [(did_id, payload) for payload in random_payloads(table_codec, 16)]
+    random.shuffle(decode_list)
+    decode_list = (decode_list * (decodes // len(decode_list) + 1))[:decodes]
+
+    reference_codecs = {did_id: codec_manager.reference_codec(did_id) for did_id, _ in decode_list}
+    start = perf_counter()
+    for did_id, payload in decode_list:
+        reference_codecs[did_id].decode(payload)
+    reference = perf_counter() - start
+
+    table_codecs = CodecManager._compiled_codecs
+    start = perf_counter()
+    for did_id, payload in decode_list:
+        table_codecs[did_id].decode(payload)
+    table = perf_counter() - start
+
+    start = perf_counter()
+    for did_id, payload in decode_list:
+        table_codecs[did_id].decode_values(payload)
+    values = perf_counter() - start
+
+    for name, elapsed in [('reference classes', reference), ('table decode()', table), ('table decode_values()', values)]:
+        _LOGGER.info(f"{name:22s}: {decodes / elapsed:9.0f} decodes/s, {elapsed / decodes * 1e9:5.0f} ns/decode, {reference / elapsed:.2f}x")
+
+    # decode and log as Record does for each new response, the log file handler is left out of the measurement
+    handlers = _LOGGER.handlers
+    level = _LOGGER.level
+    results = []
+    _LOGGER.handlers = [logging.NullHandler()]
+    _LOGGER.propagate = False
+    try:
+        for log_level in [logging.INFO, logging.DEBUG]:
+            _LOGGER.setLevel(log_level)
+            for name, codecs, decode in [('reference classes', reference_codecs, lambda codec, payload: codec.decode(payload)),
+                                         ('table codecs', table_codecs, lambda codec, payload: codec.decode(payload))]:
+                start = perf_counter()
+                for did_id, payload in decode_list:
+                    response_packet = decode(codecs[did_id], payload)
+                    if _LOGGER.isEnabledFor(logging.DEBUG):
+                        _LOGGER.debug(f"07E4/{did_id:04X}: {response_packet.get('decoded')}")
+                elapsed = perf_counter() - start
+                results.append(f"{name:17s} {logging.getLevelName(log_level):5s} logging: {elapsed / decodes * 1e9:5.0f} ns/decode")
+    finally:
+        _LOGGER.handlers = handlers
+        _LOGGER.setLevel(level)
+        _LOGGER.propagate = True
+    for result in results:
+        _LOGGER.info(result)
+
+
+def main() -> None:
+    logfiles.start('log/bench_codecs.log')
+    _LOGGER.info(f"Mustang Mach E Codec Benchmark version {version.get_version()} PID is {os.getpid()}")
+    try:
+        payload_count = 1000
+        decodes = 100000
+        for arg in sys.argv[1:]:
+            if arg.find('payloads=') == 0:
+                payload_count = int(arg[len('payloads='):])
+            elif arg.find('decodes=') == 0:
+                decodes = int(arg[len('decodes='):])
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+
+        random.seed(0)
+        codec_manager = CodecManager(config_from_dict({}))
+        failures = parity(codec_manager, payload_count)
+        _LOGGER.info(f"Parity: {len(CodecManager._compiled_codecs)} codecs, {payload_count} payloads each, {failures} differences")
+        throughput(codec_manager, decodes)
+
+    except KeyboardInterrupt:
+        print()
+    except RuntimeError as e:
+        _LOGGER.error(f"Run time error: {e}")
+    except FailedInitialization as e:
+        _LOGGER.error(f"{e}")
+    except Exception as e:
+        _LOGGER.exception(f"Unexpected exception: {e}")
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        main()
+    else:
+        print("python 3.10 or better required")
@@ -0,0 +1,108 @@
+"""
+Microbenchmark of the Record DID cache lookup done for every DID in every response.
+
+Replays a set of responses built from the enabled DIDs in 'dids.json' and the modules in
+'modules.json' through the string-keyed cache Record used to have and the integer-keyed cache.
+
+    python3 bench_did_cache.py [responses=200000] [changed=10]
+
+'changed' is the percentage of responses with a payload that differs from the cached one.
+"""
+
+import sys
+import os
+import logging
+import random
+from time import perf_counter
+
+import logfiles
+import version
+from did_manager import DIDManager
+from module_manager import ModuleManager
+from state_engine import initialize_did_cache, did_cache_key, update_did_cache
+from exceptions import FailedInitialization, RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+def string_keyed(responses: list) -> float:
+    did_cache = {}
+    start = perf_counter()
+    for arbitration_id, did_id, payload in responses:
+        key = f"{arbitration_id:04X}:{did_id:04X}"
+        new_data_point = did_cache.get(key, None) is None or did_cache.get(key, None) != payload
+        if new_data_point:
+            did_cache[key] = payload
+    return perf_counter() - start
+
+
+def integer_keyed(responses: list) -> float:
+    initialize_did_cache()
+    start = perf_counter()
+    for arbitration_id, did_id, payload in responses:
+        key = did_cache_key(arbitration_id, did_id)
+        update_did_cache(key, payload)
+    elapsed = perf_counter() - start
+    initialize_did_cache()
+    return elapsed
+
+
+def build_responses(count: int, changed: int) -> tuple:
+    did_manager = DIDManager()
+    module_manager = ModuleManager()
+    dids = []
+    for did in did_manager.dids():
+        if did.get('enable', False):
+            for module_name in did.get('modules', []):
+                if module_record := module_manager.module(module_name):
+                    dids.append((module_record.get('arbitration_id'), did.get('did_id')))
+    if len(dids) == 0:
+        raise FailedInitialization(f"No enabled DIDs found in the DID file")
+
+    random.seed(0)
+    payloads = {did: bytes([0x00, 0x01]) for did in dids}
+    responses = []
+    for _ in range(count):
+        did = random.choice(dids)
+        if random.randrange(100) < changed:
+            payloads[did] = random.randbytes(2)
+        responses.append((did[0], did[1], payloads[did]))
+    return responses, len(dids)
+
+
+def main() -> None:
+    logfiles.start('log/bench_did_cache.log')
+    _LOGGER.info(f"Mustang Mach E DID Cache Benchmark version {version.get_version()} PID is {os.getpid()}")
+    try:
+        count = 200000
+        changed = 10
+        for arg in sys.argv[1:]:
+            if arg.find('responses=') == 0:
+                count = int(arg[len('responses='):])
+            elif arg.find('changed=') == 0:
+                changed = int(arg[len('changed='):])
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+
+        responses, did_count = build_responses(count, changed)
+        _LOGGER.info(f"{count} responses over {did_count} module DIDs, {changed}% changed")
+        baseline = string_keyed(responses)
+        for name, elapsed in [('string key', baseline), ('integer key', integer_keyed(responses))]:
+            _LOGGER.info(f"{name:12s}: {elapsed / count * 1e9:6.0f} ns/response, {baseline / elapsed:.2f}x")
+
+    except KeyboardInterrupt:
+        print()
+    except RuntimeError as e:
+        _LOGGER.error(f"Run time error: {e}")
+    except FailedInitialization as e:
+        _LOGGER.error(f"{e}")
+    except Exception as e:
+        _LOGGER.exception(f"Unexpected exception: {e}")
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        main()
+    else:
+        print("python 3.10 or better required")
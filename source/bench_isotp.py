@@ -0,0 +1,143 @@
+"""
+Benchmark of the Record ISO-TP backends on a virtual CAN bus.
+
+Reads the multi-frame VIN (F190) and GPS (8012) DIDs from a simulated APIM/BCM
+using the Python ISO-TP stack and the kernel ISO-TP sockets and reports the
+transactions per second for each backend.
+
+    sudo modprobe vcan can-isotp
+    sudo ip link add dev vcan0 type vcan && sudo ip link set vcan0 up
+    python3 bench_isotp.py [channel=vcan0] [reads=500]
+"""
+
+import sys
+import os
+import logging
+import struct
+from threading import Thread
+from time import perf_counter, sleep
+
+import isotp
+from can.interfaces.socketcan import SocketcanBus
+import udsoncan.configs
+from udsoncan.client import Client
+from config import config_from_dict
+
+import logfiles
+import version
+from codec_manager import CodecVehicleID, CodecNull
+from record_modmgr import RecordModuleManager, kernel_isotp_supported
+from exceptions import FailedInitialization, RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+_BENCHMARK_DIDS = {
+    # module arbitration ID, DID, canned response payload
+    'VIN':  (0x726, 0xF190, b'3FMTK3SU0MMA00000'),
+    'GPS':  (0x7D0, 0x8012, struct.pack('>hllBHH', 150, 2574000, -4578000, 3, 0, 90)),
+}
+
+
+class Responder:
+    """Answers ReadDID requests for one module with a canned payload, uses the kernel socket if available."""
+    def __init__(self, channel: str, arbitration_id: int, did_id: int, payload: bytes) -> None:
+        self._response = struct.pack('>BH', 0x62, did_id) + payload
+        self._exit_requested = False
+        tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=arbitration_id + 0x8, rxid=arbitration_id)
+        if kernel_isotp_supported():
+            self._tpsock = isotp.socket(timeout=0.1)
+            self._tpsock.set_opts(txpad=0x00)
+            self._tpsock.bind(channel, address=tp_addr)
+            self._stack = None
+        else:
+            self._tpsock = None
+            self._bus = SocketcanBus(channel=channel, can_filters=[{'can_id': arbitration_id, 'can_mask': 0x7FF}])
+            self._stack = isotp.CanStack(bus=self._bus, address=tp_addr, params=RecordModuleManager.isotp_params)
+        self._thread = Thread(target=self._responder_task, name=f"responder_{arbitration_id:04X}")
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._exit_requested = True
+        self._thread.join()
+        if self._tpsock:
+            self._tpsock.close()
+        if self._stack:
+            self._bus.shutdown()
+
+    def _responder_task(self) -> None:
+        while self._exit_requested == False:
+            if self._tpsock:
+                try:
+                    request = self._tpsock.recv()
+                except TimeoutError:
+                    continue
+                if request and request[0] == 0x22:
+                    self._tpsock.send(self._response)
+            else:
+                sleep(self._stack.sleep_time())
+                self._stack.process()
+                if self._stack.available():
+                    request = self._stack.recv()
+                    if request[0] == 0x22:
+                        self._stack.send(self._response)
+
+
+def benchmark(backend: str, channel: str, reads: int) -> None:
+    config = config_from_dict({'record': {'isotp_backend': backend}})
+    module_manager = RecordModuleManager(config=config)
+    if module_manager.isotp_backend() != backend:
+        _LOGGER.info(f"Skipping the {backend} backend, it is not available")
+        return
+
+    for name, (arbitration_id, did_id, payload) in _BENCHMARK_DIDS.items():
+        connection = module_manager.create_connection(channel, arbitration_id)
+        client_config = dict(udsoncan.configs.default_client_config)
+        client_config['data_identifiers'] = {did_id: CodecVehicleID if did_id == 0xF190 else CodecNull}
+        with Client(connection, config=client_config) as client:
+            client.read_data_by_identifier([did_id])
+            start = perf_counter()
+            for _ in range(reads):
+                client.read_data_by_identifier([did_id])
+            elapsed = perf_counter() - start
+        _LOGGER.info(f"{backend:6s} {name}: {reads} reads of {len(payload) + 3} bytes in {elapsed:.3f} s, {reads / elapsed:.0f} reads/s, {elapsed / reads * 1000:.2f} ms/read")
+    module_manager.stop()
+
+
+def main() -> None:
+    logfiles.start('log/bench_isotp.log')
+    _LOGGER.info(f"Mustang Mach E ISO-TP Benchmark version {version.get_version()} PID is {os.getpid()}")
+    try:
+        channel = 'vcan0'
+        reads = 500
+        for arg in sys.argv[1:]:
+            if arg.find('channel=') == 0:
+                channel = arg[len('channel='):]
+            elif arg.find('reads=') == 0:
+                reads = int(arg[len('reads='):])
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+
+        responders = [Responder(channel, arbitration_id, did_id, payload) for arbitration_id, did_id, payload in _BENCHMARK_DIDS.values()]
+        try:
+            for backend in ['python', 'kernel']:
+                benchmark(backend, channel, reads)
+        finally:
+            for responder in responders:
+                responder.stop()
+
+    except KeyboardInterrupt:
+        print()
+    except RuntimeError as e:
+        _LOGGER.error(f"Run time error: {e}")
+    except FailedInitialization as e:
+        _LOGGER.error(f"{e}")
+    except Exception as e:
+        _LOGGER.exception(f"Unexpected exception: {e}")
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        main()
+    else:
+        print("python 3.10 or better required")
@@ -0,0 +1,144 @@
+"""
+Benchmark of the InfluxDB line protocol encoders.
+
+Encodes random data points for every Hash with the string concatenation influxdb_write_record
+used to do, one point at a time with the precompiled encoder and as a batch, and checks that the
+encoder writes the same lines for the int, float and str fields.
+
+    python3 bench_line_protocol.py [points=200000] [batch=20]
+
+'batch' is the number of points in each call, about the number of states in a response.
+"""
+
+import sys
+import os
+import logging
+import random
+from time import perf_counter, time_ns
+
+import logfiles
+import version
+from hash import Hash, lookup_hash, get_hash_fields, get_db_fields
+from line_protocol import LineProtocolEncoder
+from exceptions import FailedInitialization, RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+def random_value(field_type: str):
+    if field_type == 'int':
+        return random.randrange(-100000, 100000)
+    if field_type == 'float':
+        return random.uniform(-1000.0, 1000.0)
+    if field_type == 'bool':
+        return random.choice([True, False])
+    return random.choice(['Sleeping', 'On', 'Starting', 'Off', 'Charging', 'Not Ready'])
+
+
+def build_data_points(count: int) -> list:
+    hashes = [hash for hash in Hash if get_db_fields(hash)[1] in ['int', 'float', 'str', 'bool']]
+    data_points = []
+    for _ in range(count):
+        hash = random.choice(hashes)
+        arbitration_id, did_id, name = get_hash_fields(hash)
+        data_points.append({'arbitration_id': arbitration_id, 'did_id': did_id, 'name': name, 'value': random_value(get_db_fields(hash)[1]), 'hash': hash})
+    return data_points
+
+
+def concatenated(batches: list, id: str, vehicle: str, ts: int) -> list:
+    # the encoding influxdb_write_record used before the encoders
+    lines = []
+    id_tag_name, _ = get_db_fields(Hash.DatabaseID)
+    vtag_name, _ = get_db_fields(Hash.Vehicle)
+    for data_points in batches:
+        for data_point in data_points:
+            arb_id = data_point.get('arbitration_id')
+            did_id = data_point.get('did_id')
+            did_name = data_point.get('name')
+            value = data_point.get('value')
+            line_protocol = f"did,{id_tag_name}={id},{vtag_name}={vehicle} {did_name}="
+            if hash := lookup_hash(arb_id, did_id, did_name):
+                _, field_type = get_db_fields(hash)
+                if field_type == 'str':
+                    value = f'"{value}"'
+                line_protocol += str(value)
+                if field_type == 'int':
+                    line_protocol += 'i'
+                line_protocol += f" {ts}"
+                lines.append(line_protocol)
+    return lines
+
+
+def encoded(batches: list, id: str, vehicle: str, ts: int) -> list:
+    encoder = LineProtocolEncoder('did')
+    lines = []
+    for data_points in batches:
+        encoder.set_tags([(Hash.DatabaseID, id), (Hash.Vehicle, vehicle)])
+        for data_point in data_points:
+            lines.append(encoder.encode(data_point.get('hash'), data_point.get('value'), ts))
+    return lines
+
+
+def encoded_batch(batches: list, id: str, vehicle: str, ts: int) -> list:
+    # batches of (Hash, value) points
+    encoder = LineProtocolEncoder('did')
+    lines = []
+    for points in batches:
+        encoder.set_tags([(Hash.DatabaseID, id), (Hash.Vehicle, vehicle)])
+        lines += encoder.encode_batch(points, ts)
+    return lines
+
+
+def main() -> None:
+    logfiles.start('log/bench_line_protocol.log')
+    _LOGGER.info(f"Mustang Mach E Line Protocol Benchmark version {version.get_version()} PID is {os.getpid()}")
+    try:
+        count = 200000
+        batch = 20
+        for arg in sys.argv[1:]:
+            if arg.find('points=') == 0:
+                count = int(arg[len('points='):])
+            elif arg.find('batch=') == 0:
+                batch = int(arg[len('batch='):])
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+
+        random.seed(0)
+        data_points = build_data_points(count)
+        batches = [data_points[index:index + batch] for index in range(0, count, batch)]
+        id, vehicle, ts = 'mme', 'Greta', time_ns()
+
+        results = {}
+        point_batches = [[(data_point.get('hash'), data_point.get('value')) for data_point in data_points] for data_points in batches]
+        for name, encode, encode_batches in [('concatenation', concatenated, batches), ('encode()', encoded, batches), ('encode_batch()', encoded_batch, point_batches)]:
+            start = perf_counter()
+            lines = encode(encode_batches, id, vehicle, ts)
+            results[name] = (perf_counter() - start, lines)
+
+        baseline, expected = results.get('concatenation')
+        differences = 0
+        for data_point, expected_line, line in zip(data_points, expected, results.get('encode_batch()')[1]):
+            if get_db_fields(data_point.get('hash'))[1] != 'bool' and expected_line != line:
+                differences += 1
+                if differences <= 10:
+                    _LOGGER.error(f"expected '{expected_line}', encoded '{line}'")
+        _LOGGER.info(f"Parity: {count} points, {differences} differences in the int, float and str fields")
+        for name, (elapsed, _) in results.items():
+            _LOGGER.info(f"{name:15s}: {elapsed / count * 1e9:5.0f} ns/point, {baseline / elapsed:.2f}x")
+
+    except KeyboardInterrupt:
+        print()
+    except RuntimeError as e:
+        _LOGGER.error(f"Run time error: {e}")
+    except FailedInitialization as e:
+        _LOGGER.error(f"{e}")
+    except Exception as e:
+        _LOGGER.exception(f"Unexpected exception: {e}")
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        main()
+    else:
+        print("python 3.10 or better required")
@@ -0,0 +1,165 @@
+"""
+Benchmark of the PlaybackDID response packing.
+
+Replays the events of a playback file and random payloads for every DID through PlaybackDID and
+through the packing it used to do (the response repacked from the state values on every request),
+checks that both give the same responses and reports the time of new_event() and of a request.
+
+    python3 bench_pb_did.py [input=playback-files/ac_charge.json] [payloads=100] [requests=200000]
+"""
+
+import sys
+import os
+import logging
+import random
+import struct
+from time import perf_counter
+
+from config import config_from_dict
+
+import logfiles
+import version
+from did_manager import DIDManager
+from codec_manager import CodecManager
+from pb_did import PlaybackDID
+from record_writer import load_records
+from exceptions import FailedInitialization, RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+class RepackedDID:
+    # the state values and packing PlaybackDID used before the responses were kept packed
+    def __init__(self, did_id: int, packing: str, bitfield: bool, states: list) -> None:
+        self._did_id = did_id
+        self._packing = packing
+        self._bitfield = bitfield
+        self._states = [state.get('initial_value') for state in states]
+
+    def response(self) -> bytearray:
+        response = bytearray()
+        index = 0
+        for state in self._states:
+            if self._packing[index] == 'T':
+                packing_format = '>L'
+            elif self._packing[index] == 't':
+                packing_format = '>l'
+            elif self._packing[index] == '1':
+                packing_format = self._packing
+                if type(state) != bytes:
+                    state = bytes(state, 'utf-8')
+            else:
+                packing_format = '>' + self._packing[index]
+
+            postfix = struct.pack(packing_format, state)
+            if self._packing[index] == 'T' or self._packing[index] == 't':
+                postfix = postfix[1:4]
+            response = response + postfix
+            index += 1
+            if index == 1 and self._bitfield:
+                break
+        return response
+
+    def new_event(self, event) -> None:
+        payload = bytearray(event.get('payload'))
+        unpacking_format = '>' + self._packing
+        if self._packing.find('T') >= 0:
+            unpacking_format = unpacking_format.replace('T', 'HB')
+        unpacked_values = list(struct.unpack(unpacking_format, payload))
+        if self._packing.find('T') >= 0:
+            unpacked_values[0] = unpacked_values[0] * 256 + unpacked_values[1]
+
+        index = 0
+        for _ in self._states:
+            self._states[index] = unpacked_values[index]
+            index += 1
+            if index == 1 and self._bitfield:
+                break
+
+    def read_response(self) -> bytes:
+        # the single DID request the module used to answer
+        return struct.pack('>B', 0x62) + struct.pack('>H', self._did_id) + self.response()
+
+
+def build_events(input_file: str, dids: dict, payload_count: int) -> list:
+    events = [event for event in load_records(input_file) if event.get('did_id') in dids]
+    for did_id, (did, _) in dids.items():
+        size = struct.calcsize('>' + did.did_packing().replace('T', 'HB'))
+        for _ in range(payload_count):
+            events.append({'time': 0.0, 'arbitration_id': 0, 'did_id': did_id, 'payload': list(random.randbytes(size))})
+    return events
+
+
+def main() -> None:
+    logfiles.start('log/bench_pb_did.log')
+    _LOGGER.info(f"Mustang Mach E PlaybackDID Benchmark version {version.get_version()} PID is {os.getpid()}")
+    try:
+        input_file = 'playback-files/ac_charge.json'
+        payload_count = 100
+        requests = 200000
+        for arg in sys.argv[1:]:
+            if arg.find('input=') == 0:
+                input_file = arg[len('input='):]
+            elif arg.find('payloads=') == 0:
+                payload_count = int(arg[len('payloads='):])
+            elif arg.find('requests=') == 0:
+                requests = int(arg[len('requests='):])
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+
+        random.seed(0)
+        codec_manager = CodecManager(config_from_dict({}))
+        dids = {}
+        for did_item in DIDManager().dids():
+            did_id = did_item.get('did_id')
+            did = PlaybackDID(did_id=did_id, did_name=did_item.get('did_name'), packing=did_item.get('packing'), bitfield=did_item.get('bitfield', False),
+                              modules=did_item.get('modules'), states=did_item.get('states'), codec_manager=codec_manager)
+            repacked = RepackedDID(did_id, did_item.get('packing'), did_item.get('bitfield', False), did_item.get('states'))
+            dids[did_id] = (did, repacked)
+        events = build_events(input_file, dids, payload_count)
+
+        # the debug log of every event would be most of the time
+        _LOGGER.setLevel(logging.INFO)
+        differences = sum([did.read_response() != bytes(repacked.read_response()) for did, repacked in dids.values()])
+        for event in events:
+            did, repacked = dids.get(event.get('did_id'))
+            did.new_event(event)
+            repacked.new_event(event)
+            if did.read_response() != bytes(repacked.read_response()):
+                differences += 1
+                if differences <= 10:
+                    _LOGGER.error(f"DID {event.get('did_id'):04X} payload {event.get('payload')}: {did.read_response().hex()} != {repacked.read_response().hex()}")
+        identities = sum([did._identity for did, _ in dids.values()])
+        _LOGGER.info(f"Parity: {len(dids)} DIDs ({identities} with identity packing), {len(events)} events, {differences} differences")
+
+        targets = [dids.get(event.get('did_id')) for event in events]
+        for name, index in [('repacked', 1), ('packed', 0)]:
+            start = perf_counter()
+            for event, target in zip(events, targets):
+                target[index].new_event(event)
+            event_time = perf_counter() - start
+            handlers = [target[index] for target in targets]
+            handlers = (handlers * (requests // len(handlers) + 1))[:requests]
+            start = perf_counter()
+            for handler in handlers:
+                handler.read_response()
+            request_time = perf_counter() - start
+            _LOGGER.info(f"{name:8s}: new_event {event_time / len(events) * 1e9:6.0f} ns, request {request_time / requests * 1e9:6.0f} ns")
+        _LOGGER.setLevel(logging.DEBUG)
+
+    except KeyboardInterrupt:
+        print()
+    except RuntimeError as e:
+        _LOGGER.error(f"Run time error: {e}")
+    except FailedInitialization as e:
+        _LOGGER.error(f"{e}")
+    except Exception as e:
+        _LOGGER.exception(f"Unexpected exception: {e}")
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        main()
+    else:
+        print("python 3.10 or better required")
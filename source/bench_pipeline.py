@@ -0,0 +1,95 @@
+"""
+Benchmark of the Record in-flight window against Playback.
+
+Runs Record for a fixed time with each in-flight window and reports the vehicle
+state updates per second.  Playback must be running on the same buses, either over
+a loop-back cable or a pair of virtual CAN buses named after the module channels:
+
+    sudo modprobe vcan
+    sudo ip link add dev can0 type vcan && sudo ip link set can0 up
+    sudo ip link add dev can1 type vcan && sudo ip link set can1 up
+    python3 playback.py &
+    python3 bench_pipeline.py [yaml=mme.yaml] [duration=60] [windows=1,2,4,8]
+
+File writes and InfluxDB are disabled so the numbers only include the CAN bus and state processing.
+"""
+
+import sys
+import os
+import logging
+from threading import Thread
+from time import perf_counter, sleep
+
+import logfiles
+import version
+from readconfig import parse_yaml_file
+from config.configuration import Configuration
+
+from record import Record
+from exceptions import FailedInitialization, RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+def benchmark(config: Configuration, window: int, duration: float) -> None:
+    config['mme.record.inflight_window'] = window
+    record = Record(config=config.mme)
+
+    state_manager = record._state_manager
+    update_vehicle_state = state_manager.update_vehicle_state
+    updates = [0]
+    def counted_update_vehicle_state(state_change: dict):
+        updates[0] += 1
+        return update_vehicle_state(state_change)
+    state_manager.update_vehicle_state = counted_update_vehicle_state
+
+    thread = Thread(target=record.start, name='bench_record')
+    start = perf_counter()
+    thread.start()
+    sleep(duration)
+    record.stop()
+    thread.join()
+    elapsed = perf_counter() - start
+    _LOGGER.info(f"inflight_window {window}: {updates[0]} state updates in {elapsed:.1f} s, {updates[0] / elapsed:.1f} updates/s")
+
+
+def main() -> None:
+    logfiles.start('log/bench_pipeline.log')
+    _LOGGER.info(f"Mustang Mach E Pipeline Benchmark version {version.get_version()} PID is {os.getpid()}")
+    try:
+        yaml_file = 'mme.yaml'
+        duration = 60.0
+        windows = [1, 2, 4, 8]
+        for arg in sys.argv[1:]:
+            if arg.find('yaml=') == 0:
+                yaml_file = arg[len('yaml='):]
+            elif arg.find('duration=') == 0:
+                duration = float(arg[len('duration='):])
+            elif arg.find('windows=') == 0:
+                windows = [int(window) for window in arg[len('windows='):].split(',')]
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+
+        if config := parse_yaml_file(yaml_file=yaml_file):
+            config['mme.record.file_writes'] = 0
+            config['mme.record.caching'] = False
+            config['mme.influxdb2.enable'] = False
+            for window in windows:
+                benchmark(config, window, duration)
+
+    except KeyboardInterrupt:
+        print()
+    except RuntimeError as e:
+        _LOGGER.error(f"Run time error: {e}")
+    except FailedInitialization as e:
+        _LOGGER.error(f"{e}")
+    except Exception as e:
+        _LOGGER.exception(f"Unexpected exception: {e}")
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        main()
+    else:
+        print("python 3.10 or better required")
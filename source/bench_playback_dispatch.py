@@ -0,0 +1,195 @@
+"""
+Benchmark of the Playback CAN receive designs on a python-can virtual bus.
+
+Runs the playback modules with a thread, a bus and an ISO-TP stack per module polling on the stack
+sleep time (the way PlaybackModule used to) and with one ChannelDispatcher for all of them, then
+reports the process CPU time while idle and while answering ReadDID requests and the response
+latency.  Every module answers a single frame DID (DD01) and the multi-frame VIN (F190).
+
+    python3 bench_playback_dispatch.py [modules=15] [requests=1000] [idle=2.0]
+"""
+
+import sys
+import os
+import logging
+import struct
+import statistics
+from threading import Thread
+from time import perf_counter, process_time, sleep
+
+import can
+import isotp
+from config import config_from_dict
+
+import logfiles
+import version
+from module_manager import ModuleManager
+from pb_module import PlaybackModule
+from pb_dispatcher import ChannelDispatcher
+from exceptions import FailedInitialization, RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+_CHANNEL = 'bench_playback_dispatch'
+
+
+class CannedDID:
+    def __init__(self, did_id: int, response: bytes) -> None:
+        self._did_id = did_id
+        self._response = response
+        self._record = struct.pack('>H', did_id) + response
+
+    def did_id(self) -> int:
+        return self._did_id
+
+    def response(self) -> bytes:
+        return self._response
+
+    def record(self) -> bytes:
+        return self._record
+
+    def read_response(self) -> bytes:
+        return b'\x62' + self._record
+
+
+class ThreadedModule:
+    # the receive loop PlaybackModule used to run for each module
+    def __init__(self, module: PlaybackModule) -> None:
+        self._module = module
+        self._exit_requested = False
+        self._bus = can.Bus(interface='virtual', channel=_CHANNEL)
+        self._stack = isotp.CanStack(bus=self._bus, address=module.address(), error_handler=module.error_handler, params=PlaybackModule.isotp_params)
+        self._thread = Thread(target=self._did_task, name=module.name())
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._exit_requested = True
+        self._thread.join()
+        self._bus.shutdown()
+
+    def _did_task(self) -> None:
+        while self._exit_requested == False:
+            sleep(self._stack.sleep_time())
+            self._stack.process()
+            if self._stack.available():
+                response = self._module.respond(self._stack.recv())
+                while self._stack.transmitting():
+                    self._stack.process()
+                    sleep(self._stack.sleep_time())
+                self._stack.send(response)
+
+
+class Tester:
+    """Sends the requests and waits for the responses through its own ISO-TP state machine."""
+    def __init__(self) -> None:
+        self._bus = can.Bus(interface='virtual', channel=_CHANNEL)
+        self._stack = isotp.TransportLayerLogic(rxfn=self._rxfn, txfn=self._txfn, address=isotp.Address(isotp.AddressingMode.Normal_11bits, txid=0, rxid=8),
+                                                params={'tx_padding': 0x00, 'tx_data_min_length': 8})
+
+    def request(self, arbitration_id: int, did_id: int) -> tuple:
+        self._stack.set_address(isotp.Address(isotp.AddressingMode.Normal_11bits, txid=arbitration_id, rxid=arbitration_id + 8))
+        start = perf_counter()
+        self._stack.send(struct.pack('>BH', 0x22, did_id))
+        while not self._stack.available():
+            self._stack.process(rx_timeout=0.001)
+            if perf_counter() - start > 2.0:
+                raise RuntimeError(f"no response from {arbitration_id:04X} for DID {did_id:04X}")
+        return self._stack.recv(), perf_counter() - start
+
+    def shutdown(self) -> None:
+        self._bus.shutdown()
+
+    def _rxfn(self, timeout: float) -> isotp.CanMessage:
+        if (message := self._bus.recv(timeout)) is None:
+            return None
+        return isotp.CanMessage(arbitration_id=message.arbitration_id, data=message.data, dlc=message.dlc, extended_id=message.is_extended_id)
+
+    def _txfn(self, message: isotp.CanMessage) -> None:
+        self._bus.send(can.Message(arbitration_id=message.arbitration_id, data=message.data, is_extended_id=message.is_extended_id))
+
+
+def run(name: str, modules: list, requests: int, idle: float) -> None:
+    if name == 'per module':
+        runners = [ThreadedModule(module) for module in modules]
+    else:
+        bus = can.Bus(interface='virtual', channel=_CHANNEL, can_filters=[{'can_id': module.arbitration_id(), 'can_mask': 0x7FF} for module in modules])
+        runners = [ChannelDispatcher(channel=_CHANNEL, modules=modules, bus=bus)]
+    tester = Tester()
+    for runner in runners:
+        runner.start()
+    try:
+        sleep(0.2)
+        start = process_time()
+        sleep(idle)
+        idle_cpu = process_time() - start
+
+        latencies = []
+        start = process_time()
+        for index in range(requests):
+            module = modules[index % len(modules)]
+            did_id = 0xF190 if index % 2 else 0xDD01
+            response, latency = tester.request(module.arbitration_id(), did_id)
+            if response[0] != 0x62 or struct.unpack_from('>H', response, 1)[0] != did_id:
+                raise RuntimeError(f"unexpected response {bytes(response).hex()} from {module.name()}")
+            latencies.append(latency)
+        busy_cpu = process_time() - start
+    finally:
+        for runner in runners:
+            runner.stop()
+        if name != 'per module':
+            bus.shutdown()
+        tester.shutdown()
+
+    latencies.sort()
+    _LOGGER.info(f"{name:10s}: idle {idle_cpu / idle * 100:5.1f}% CPU, {busy_cpu / requests * 1e6:6.0f} us CPU/request, "
+                 f"latency mean {statistics.mean(latencies) * 1000:6.2f} ms, p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.2f} ms")
+
+
+def main() -> None:
+    logfiles.start('log/bench_playback_dispatch.log')
+    _LOGGER.info(f"Mustang Mach E Playback Dispatch Benchmark version {version.get_version()} PID is {os.getpid()}")
+    try:
+        module_count = 15
+        requests = 1000
+        idle = 2.0
+        for arg in sys.argv[1:]:
+            if arg.find('modules=') == 0:
+                module_count = int(arg[len('modules='):])
+            elif arg.find('requests=') == 0:
+                requests = int(arg[len('requests='):])
+            elif arg.find('idle=') == 0:
+                idle = float(arg[len('idle='):])
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+
+        config = config_from_dict({'playback': {'rx_flowcontrol_timeout': 1.0}})
+        module_manager = ModuleManager()
+        modules = []
+        for module_record in module_manager.modules()[:module_count]:
+            module = PlaybackModule(config=config, name=module_record.get('name'), arbitration_id=module_record.get('arbitration_id'), channel=_CHANNEL, module_manager=module_manager)
+            module.add_did(CannedDID(0xDD01, struct.pack('>L', 123456)[1:]))
+            module.add_did(CannedDID(0xF190, b'3FMTK3SU0MMA00000'))
+            modules.append(module)
+
+        _LOGGER.info(f"{len(modules)} modules, {requests} requests")
+        for name in ['per module', 'dispatcher']:
+            run(name, modules, requests, idle)
+
+    except KeyboardInterrupt:
+        print()
+    except RuntimeError as e:
+        _LOGGER.error(f"Run time error: {e}")
+    except FailedInitialization as e:
+        _LOGGER.error(f"{e}")
+    except Exception as e:
+        _LOGGER.exception(f"Unexpected exception: {e}")
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        main()
+    else:
+        print("python 3.10 or better required")
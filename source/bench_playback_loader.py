@@ -0,0 +1,122 @@
+"""
+Benchmark of the playback file loaders.
+
+Writes a large playback file in the JSON array, JSON Lines and binary formats by repeating the records
+of a playback file, then reads each one in a new process with load_records() (the whole file is loaded
+before the first event, as PlaybackEngine used to) and with RecordStream, and reports the time to the
+first event, the time to read all the events and the peak RSS of the process.
+
+    python3 bench_playback_loader.py [input=playback-files/ac_charge.json] [repeat=100]
+"""
+
+import sys
+import os
+import logging
+import resource
+import subprocess
+import tempfile
+from time import perf_counter
+
+import logfiles
+import version
+from record_writer import load_records
+from record_stream import RecordStream
+from convert_records import write_records
+from exceptions import FailedInitialization, RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+def peak_rss() -> int:
+    # ru_maxrss is inherited from the parent across fork and exec, VmHWM isn't
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def read_events(loader: str, file: str) -> None:
+    # run in the child process, the results are printed for the parent
+    start = perf_counter()
+    first_event = None
+    count = 0
+    if loader == 'load':
+        for _ in load_records(file):
+            if first_event is None:
+                first_event = perf_counter() - start
+            count += 1
+    else:
+        stream = RecordStream(file)
+        while stream.next() is not None:
+            if first_event is None:
+                first_event = perf_counter() - start
+            count += 1
+        stream.stop()
+    elapsed = perf_counter() - start
+    print(f"{count} {first_event} {elapsed} {peak_rss()}")
+
+
+def run_child(loader: str, file: str) -> tuple:
+    output = subprocess.run([sys.executable, __file__, f"child={loader}:{file}"], capture_output=True, text=True, check=True).stdout
+    count, first_event, elapsed, max_rss = output.split()
+    return int(count), float(first_event), float(elapsed), int(max_rss)
+
+
+def main() -> None:
+    logfiles.start('log/bench_playback_loader.log')
+    _LOGGER.info(f"Mustang Mach E Playback Loader Benchmark version {version.get_version()} PID is {os.getpid()}")
+    try:
+        input_file = 'playback-files/ac_charge.json'
+        repeat = 100
+        for arg in sys.argv[1:]:
+            if arg.find('input=') == 0:
+                input_file = arg[len('input='):]
+            elif arg.find('repeat=') == 0:
+                repeat = int(arg[len('repeat='):])
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+
+        records = load_records(input_file)
+        duration = records[-1].get('time') - records[0].get('time') + 1.0
+        repeated = []
+        for index in range(repeat):
+            offset = index * duration
+            repeated += [{'time': record.get('time') + offset, 'arbitration_id': record.get('arbitration_id'), 'did_id': record.get('did_id'), 'payload': record.get('payload')} for record in records]
+
+        with tempfile.TemporaryDirectory() as directory:
+            for extension in ['.json', '.jsonl', '.rec']:
+                file = os.path.join(directory, 'playback' + extension)
+                write_records(file, repeated)
+                _LOGGER.info(f"{len(repeated)} events in '{os.path.basename(file)}' ({os.path.getsize(file)} bytes)")
+                for loader in ['load', 'stream']:
+                    count, first_event, elapsed, max_rss = run_child(loader, file)
+                    if count != len(repeated):
+                        raise RuntimeError(f"{loader} read {count} of {len(repeated)} events from '{file}'")
+                    _LOGGER.info(f"    {loader:6s}: first event {first_event * 1000:9.3f} ms, all events {elapsed:6.2f} s, peak RSS {max_rss / 1024:7.1f} MB")
+
+    except KeyboardInterrupt:
+        print()
+    except subprocess.CalledProcessError as e:
+        _LOGGER.error(f"Benchmark process failed: {e.stderr}")
+    except RuntimeError as e:
+        _LOGGER.error(f"Run time error: {e}")
+    except FailedInitialization as e:
+        _LOGGER.error(f"{e}")
+    except Exception as e:
+        _LOGGER.exception(f"Unexpected exception: {e}")
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        if len(sys.argv) == 2 and sys.argv[1].find('child=') == 0:
+            loader, file = sys.argv[1][len('child='):].split(':', 1)
+            read_events(loader, file)
+        else:
+            main()
+    else:
+        print("python 3.10 or better required")
@@ -0,0 +1,112 @@
+"""
+Benchmark of the Record output file writers.
+
+Writes the records of a playback file with the JSON array writer Record used to have (pretty-printed
+batches appended by re-opening the file) and with the JSON Lines and binary RecordWriter, then reports
+the CPU time and the size of each output file and the time to load it back.
+
+    python3 bench_record_writer.py [input=playback-files/ac_charge.json] [repeat=10] [file_writes=200]
+"""
+
+import sys
+import os
+import json
+import logging
+import tempfile
+from time import process_time
+
+import logfiles
+import version
+from record_writer import RecordWriter, load_records
+from exceptions import FailedInitialization, RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+def array_writer(filename: str, records: list, file_writes: int) -> None:
+    # the writes RecordFileManager used to do
+    with open(filename, 'w') as outfile:
+        outfile.write('[\n')
+    writes = 0
+    for index in range(0, len(records), file_writes):
+        json_data = json.dumps(records[index:index + file_writes], indent = 4, sort_keys=False)[2:-2]
+        with open(filename, 'a') as outfile:
+            if writes > 0:
+                outfile.write(',\n')
+            outfile.write(json_data)
+        writes += 1
+    with open(filename, 'a') as outfile:
+        outfile.write('\n]')
+
+
+def lines_writer(filename: str, records: list, file_writes: int) -> None:
+    writer = RecordWriter(filename, flush_records=file_writes)
+    writer.start()
+    for record in records:
+        writer.write(record)
+    writer.stop()
+
+
+def main() -> None:
+    logfiles.start('log/bench_record_writer.log')
+    _LOGGER.info(f"Mustang Mach E Record Writer Benchmark version {version.get_version()} PID is {os.getpid()}")
+    try:
+        input_file = 'playback-files/ac_charge.json'
+        repeat = 10
+        file_writes = 200
+        for arg in sys.argv[1:]:
+            if arg.find('input=') == 0:
+                input_file = arg[len('input='):]
+            elif arg.find('repeat=') == 0:
+                repeat = int(arg[len('repeat='):])
+            elif arg.find('file_writes=') == 0:
+                file_writes = int(arg[len('file_writes='):])
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+
+        records = []
+        for record in load_records(input_file):
+            arbitration_id = record.get('arbitration_id')
+            did_id = record.get('did_id')
+            records.append({'time': record.get('time'), 'arbitration_id': arbitration_id, 'arbitration_id_hex': f"{arbitration_id:04X}",
+                            'did_id': did_id, 'did_id_hex': f"{did_id:04X}", 'payload': record.get('payload')})
+        records = records * repeat
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = []
+            for name, writer, filename in [('JSON array', array_writer, 'array.json'), ('JSON Lines', lines_writer, 'lines.jsonl'), ('Binary', lines_writer, 'records.rec')]:
+                filename = os.path.join(directory, filename)
+                start = process_time()
+                writer(filename, records, file_writes)
+                elapsed = process_time() - start
+                start = process_time()
+                loaded = load_records(filename)
+                load_time = process_time() - start
+                if len(loaded) != len(records):
+                    raise RuntimeError(f"{name} output file has the wrong number of records")
+                if any(list(record.get('payload')) != list(expected.get('payload')) or record.get('time') != expected.get('time') for record, expected in zip(loaded, records)):
+                    raise RuntimeError(f"{name} output file records are different")
+                results.append((name, elapsed, os.path.getsize(filename), load_time))
+
+        _LOGGER.info(f"{len(records)} records from '{input_file}', {file_writes} records per write")
+        _, baseline_time, baseline_size, baseline_load = results[0]
+        for name, elapsed, size, load_time in results:
+            _LOGGER.info(f"{name:10s}: {elapsed / len(records) * 1e6:6.2f} us/record CPU ({baseline_time / elapsed:.1f}x), {size} bytes ({baseline_size / size:.1f}x smaller), "
+                         f"loaded in {load_time / len(records) * 1e6:5.2f} us/record ({baseline_load / load_time:.1f}x)")
+
+    except KeyboardInterrupt:
+        print()
+    except RuntimeError as e:
+        _LOGGER.error(f"Run time error: {e}")
+    except FailedInitialization as e:
+        _LOGGER.error(f"{e}")
+    except Exception as e:
+        _LOGGER.exception(f"Unexpected exception: {e}")
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        main()
+    else:
+        print("python 3.10 or better required")
@@ -1,14 +1,16 @@
 import logging
 import struct
-
-import requests
-from requests.exceptions import ConnectionError, ConnectTimeout, ReadTimeout, HTTPError, InvalidURL
-from requests.exceptions import InvalidSchema, MissingSchema
+import json
+import importlib
+from string import Formatter
+from functools import partial
 
 from udsoncan import DidCodec
 
 from did import DidId
 from config.configuration import Configuration
+from exceptions import FailedInitialization
+from gps_poller import GpsPoller
 
 from state_engine import odometer_km, odometer_miles, speed_kph, speed_mph
 
@@ -186,47 +188,26 @@ class CodecGPS(Codec):
                 CodecGPS._previous_gps_speed = gps_speed
             """
 
-            # Use the external GPS server if available
-            if CodecManager._gps_server_enabled:
-                # if successful modify the payload to reflect the hires GPS data
-                try:
-                    gps_response = requests.get(CodecManager._gps_server, timeout=CodecManager._gps_server_timeout)
-                    phone_gps = gps_response.json()
-                    gps_latitude = round(float(phone_gps.get('latitude')), 6)
-                    gps_longitude = round(float(phone_gps.get('longitude')), 6)
-                    gps_elevation = round(float(phone_gps.get('altitude')), 1)
-
-                    jps_speed = phone_gps.get('speed')
-                    if jps_speed >= 0.0:
-                        gps_speed = int(jps_speed)
-                        gps_speed *= 3.6
-
-                    jps_bearing = phone_gps.get('course')
-                    if jps_bearing >= 0.0:
-                        gps_bearing = int(jps_bearing)
-
-                    gps_elapsed = gps_response.elapsed.seconds + round(gps_response.elapsed.microseconds/1000000, 3)
-                    states = [
-                            {'gps_latitude': gps_latitude},
-                            {'gps_longitude': gps_longitude},
-                            {'gps_elevation': gps_elevation},
-                        ]
-                    if gps_speed >= 0.0:
-                        states.append({'gps_speed': gps_speed})
-                    if gps_bearing >= 0.0:
-                        states.append({'gps_bearing': gps_bearing})
-
-                    gps_data = f"GPS: ({gps_latitude:3.6f}, {gps_longitude:3.6f}), elevation: {gps_elevation:.1f} m, bearing: {gps_bearing}°, speed: {gps_speed:.1f} kph, elapsed: {gps_elapsed:.03f}"
-                    payload = struct.pack('>hffBHH', int(gps_elevation), float(gps_latitude), float(gps_longitude), 255, int(gps_speed / 3.6), int(gps_bearing))
-                    return {'payload': payload, 'states': states, 'decoded': gps_data}
-                except (ReadTimeout, HTTPError, InvalidURL, InvalidSchema, ConnectTimeout, ConnectionError) as e:
-                    _LOGGER.error(f"{e}")
-                    return None
-                except Exception as e:
-                    _LOGGER.exception(f"Unexpected GPS exception: {e}")
-            else:
-                if self != 'pb':
-                    CodecManager._gps_server_enabled = connect_gps_server()
+            # Use the latest fix from the external GPS server if there is a recent one
+            if CodecManager._gps_poller is not None and (fix := CodecManager._gps_poller.latest_fix()) is not None:
+                # modify the payload to reflect the hires GPS data
+                gps_latitude = fix.get('latitude')
+                gps_longitude = fix.get('longitude')
+                gps_elevation = fix.get('elevation')
+                if (fix_speed := fix.get('speed')) is not None:
+                    gps_speed = int(fix_speed) * 3.6
+                if (fix_bearing := fix.get('bearing')) is not None:
+                    gps_bearing = int(fix_bearing)
+
+                states = [
+                        {'gps_latitude': gps_latitude},
+                        {'gps_longitude': gps_longitude},
+                        {'gps_elevation': gps_elevation},
+                        {'gps_speed': gps_speed},
+                        {'gps_bearing': gps_bearing},
+                    ]
+                gps_data = f"GPS: ({gps_latitude:3.6f}, {gps_longitude:3.6f}), elevation: {gps_elevation:.1f} m, bearing: {gps_bearing}°, speed: {gps_speed:.1f} kph, elapsed: {fix.get('elapsed'):.03f}"
+                payload = struct.pack('>hffBHH', int(gps_elevation), float(gps_latitude), float(gps_longitude), 255, int(gps_speed / 3.6), int(gps_bearing))
 
 
         return {'payload': payload, 'states': states, 'decoded': gps_data}
@@ -748,6 +729,222 @@ class CodecHvbContactorOpenLeakResistance(Codec):
         return 2
 
 
+class DeferredDecode(partial):
+    """Human readable decode that is only formatted when it is printed, Record only prints it in debug logs."""
+
+    def __str__(self) -> str:
+        return self()
+
+    def __format__(self, format_spec: str) -> str:
+        return format(str(self), format_spec)
+
+
+class TableCodec(Codec):
+    """
+        Codec compiled from an entry in the declarative codec schema ('json/codec/codecs.json'):
+            format:         struct format of the DID payload
+            states:         one entry per state, the raw value is taken from one struct field ('field', default 0) or
+                            combined from several ('fields' and 'shift'), then converted ('type' float or str),
+                            masked to a bool ('mask') or scaled ('scale', then 'offset'), 'labels' names enumerated values
+            derived:        extra values for the decoded string, a state multiplied by 'scale'
+            decoded:        format string for the human readable decode, the state names, '<state>_label',
+                            the derived names and 'raw[n]' (the unpacked struct fields) can be used
+
+        The schema is turned into a precompiled struct and a closure per state over its field, scale, offset, mask
+        or type, decode_values() returns the flat tuple of the state values: for a single state it is that closure
+        applied to the payload and it is the struct unpack itself when the states are the unpacked fields.  decode()
+        is built on decode_values().  The decoded string is rewritten once into a positional format string over the
+        state values, the labels, the derived values and the unpacked fields, and is only formatted when it is printed,
+        a decoded string of the state values only is the format bound to the values.
+    """
+    _reserved_names = ('raw',)
+
+    def __init__(self, schema: dict) -> None:
+        self.did_id = schema.get('did_id')
+        self.did_name = schema.get('did_name')
+        try:
+            self._struct = struct.Struct(schema.get('format'))
+        except (struct.error, TypeError) as e:
+            raise FailedInitialization(f"Codec schema error for DID {self.did_id:04X}: {e}")
+        self._field_count = len(self._struct.unpack(bytes(self._struct.size)))
+        states = schema.get('states')
+        self.state_names = tuple([state.get('name') for state in states])
+        for name in self.state_names:
+            if not name.isidentifier() or name in TableCodec._reserved_names:
+                raise FailedInitialization(f"Codec schema error for DID {self.did_id:04X}: '{name}' is not a valid state name")
+
+        # the positional arguments of the decoded string: the state values, the labels, the derived values, the unpacked fields
+        arguments = list(self.state_names)
+        labels = []
+        labels_use_raw = False
+        for index, state in enumerate(states):
+            if state_labels := state.get('labels', None):
+                label_default, uses_raw = self._positional_format(state.get('label_default', 'Unknown'), self.state_names)
+                labels_use_raw = labels_use_raw or uses_raw
+                if all([field is None for _, field, _, _ in Formatter().parse(label_default)]):
+                    # a default label without fields is the same string every time
+                    label_default = label_default.format()
+                else:
+                    label_default = label_default.format
+                labels.append((index, {int(key): label for key, label in state_labels.items()}, label_default))
+                arguments.append(f"{state.get('name')}_label")
+        derived_values = []
+        for derived in schema.get('derived', []):
+            if derived.get('state') not in self.state_names or not derived.get('name').isidentifier():
+                raise FailedInitialization(f"Codec schema error for DID {self.did_id:04X}: bad derived value '{derived.get('name')}'")
+            derived_values.append((self.state_names.index(derived.get('state')), float(derived.get('scale'))))
+            arguments.append(derived.get('name'))
+        unpack = self._struct.unpack
+        format_decoded, uses_raw = self._positional_format(schema.get('decoded', ''), arguments)
+        format_decoded = format_decoded.format
+        values_only = len(labels) == 0 and len(derived_values) == 0 and not uses_raw
+        if values_only:
+            decoded = lambda payload, values: format_decoded(*values)
+        elif len(labels) == 0 and len(derived_values) == 0:
+            decoded = lambda payload, values: format_decoded(*values, *unpack(payload))
+        elif len(labels) == 1 and len(derived_values) == 0 and not uses_raw and not labels_use_raw:
+            index, state_labels, label_default = labels[0]
+            if isinstance(label_default, str):
+                decoded = lambda payload, values: format_decoded(*values, state_labels.get(values[index], label_default))
+            else:
+                def decoded(payload, values: tuple) -> str:
+                    if (label := state_labels.get(values[index], None)) is None:
+                        label = label_default(*values)
+                    return format_decoded(*values, label)
+        else:
+            def decoded(payload, values: tuple) -> str:
+                raw = unpack(payload)
+                extra = []
+                for index, state_labels, label_default in labels:
+                    if (label := state_labels.get(values[index], None)) is None:
+                        label = label_default if isinstance(label_default, str) else label_default(*values, *raw)
+                    extra.append(label)
+                for index, scale in derived_values:
+                    extra.append(values[index] * scale)
+                return format_decoded(*values, *extra, *raw)
+
+        if [state.get('fields', state.get('field', 0)) for state in states] == list(range(self._field_count)) and \
+                all([self._plain(state) for state in states]):
+            # every state is its struct field as it is unpacked
+            decode_values = unpack
+        elif len(states) == 1:
+            decode_values = self._state_values(states[0], unpack)
+        else:
+            # the values of the 1-tuples of the states
+            state_values = [self._state_values(state, tuple) for state in states]
+            decode_values = lambda payload: tuple([values(raw)[0] for raw in [unpack(payload)] for values in state_values])
+        self.decode_values = decode_values
+        self._decoded = decoded
+
+        # the decoded string is bound to its arguments without a call through Python, the format itself or the closure
+        if len(states) == 1 and values_only:
+            name = self.state_names[0]
+            def decode(payload) -> dict:
+                values = decode_values(payload)
+                return {'payload': payload, 'states': [{name: values[0]}], 'decoded': DeferredDecode(format_decoded, *values)}
+        elif len(states) == 1:
+            name = self.state_names[0]
+            def decode(payload) -> dict:
+                values = decode_values(payload)
+                return {'payload': payload, 'states': [{name: values[0]}], 'decoded': DeferredDecode(decoded, payload, values)}
+        else:
+            state_names = self.state_names
+            def decode(payload) -> dict:
+                values = decode_values(payload)
+                return {'payload': payload, 'states': [{name: value} for name, value in zip(state_names, values)],
+                        'decoded': DeferredDecode(format_decoded, *values) if values_only else DeferredDecode(decoded, payload, values)}
+        self.decode = decode
+
+    @staticmethod
+    def _plain(state: dict) -> bool:
+        return all([state.get(key, None) is None for key in ['fields', 'type', 'mask', 'scale', 'offset']])
+
+    def _state_values(self, state: dict, source):
+        # a function giving the 1-tuple of the state value from what source() unpacks its argument to
+        fields = state.get('fields', [state.get('field', 0)])
+        if any([not isinstance(field, int) or field < 0 or field >= self._field_count for field in fields]):
+            raise FailedInitialization(f"Codec schema error for DID {self.did_id:04X}: state '{state.get('name')}' uses a missing field")
+        for key in ['scale', 'offset']:
+            if (value := state.get(key, None)) is not None and (not isinstance(value, (int, float)) or isinstance(value, bool)):
+                raise FailedInitialization(f"Codec schema error for DID {self.did_id:04X}: state '{state.get('name')}' {key} is not a number")
+        if len(fields) == 1:
+            return self._field_values(state, fields[0], source)
+
+        # the fields are combined first and converted as a single field
+        shift = int(state.get('shift', 8))
+        def combined(value) -> tuple:
+            raw = source(value)
+            value = raw[fields[0]]
+            for field in fields[1:]:
+                value = (value << shift) + raw[field]
+            return (value,)
+        return self._field_values(state, 0, combined)
+
+    @staticmethod
+    def _field_values(state: dict, field: int, source):
+        if state.get('type', None) == 'str':
+            return lambda value: (source(value)[field].decode('utf-8'),)
+        if (mask := state.get('mask', None)) is not None:
+            mask = int(mask)
+            return lambda value: (bool(source(value)[field] & mask),)
+        scale, offset = state.get('scale', None), state.get('offset', None)
+        if state.get('type', None) == 'float':
+            if scale is not None and offset is not None:
+                return lambda value: (float(source(value)[field]) * scale + offset,)
+            if scale is not None:
+                return lambda value: (float(source(value)[field]) * scale,)
+            if offset is not None:
+                return lambda value: (float(source(value)[field]) + offset,)
+            return lambda value: (float(source(value)[field]),)
+        if scale is not None and offset is not None:
+            return lambda value: (source(value)[field] * scale + offset,)
+        if scale is not None:
+            return lambda value: (source(value)[field] * scale,)
+        if offset is not None:
+            return lambda value: (source(value)[field] + offset,)
+        return lambda value: (source(value)[field],)
+
+    def _positional_format(self, template: str, names: list) -> tuple:
+        # the known names are replaced by their position and 'raw[n]' by n after the names, any other field is an error
+        positional = ''
+        uses_raw = False
+        for literal, field, spec, conversion in Formatter().parse(template):
+            positional += literal.replace('{', '{{').replace('}', '}}')
+            if field is None:
+                continue
+            if field.startswith('raw[') and field.endswith(']') and field[len('raw['):-1].isdigit() and int(field[len('raw['):-1]) < self._field_count:
+                position = len(names) + int(field[len('raw['):-1])
+                uses_raw = True
+            elif field in names:
+                position = names.index(field)
+            else:
+                raise FailedInitialization(f"Codec schema error for DID {self.did_id:04X}: decoded string uses unknown field '{field}'")
+            positional += f"{{{position}{'!' + conversion if conversion else ''}{':' + spec if spec else ''}}}"
+        return positional, uses_raw
+
+    def decoded(self, payload) -> str:
+        return self._decoded(payload, self.decode_values(payload))
+
+    def __len__(self):
+        return self._struct.size
+
+
+def compile_codec_schema(file: str) -> dict:
+    with open(file) as infile:
+        try:
+            schema = json.load(infile)
+        except FileNotFoundError as e:
+            raise FailedInitialization(f"{e}")
+        except json.JSONDecodeError as e:
+            raise FailedInitialization(f"JSON error in '{file}' at line {e.lineno}")
+    compiled_codecs = {}
+    for entry in schema:
+        codec = TableCodec(entry)
+        compiled_codecs[codec.did_id] = codec
+    _LOGGER.debug(f"Compiled {len(compiled_codecs)} codecs from '{file}'")
+    return compiled_codecs
+
+
 class CodecManager:
 
     _codec_lookup = {
@@ -811,39 +1008,78 @@ class CodecManager:
         DidId.EngineRunTime:                    CodecEngineRunTime,
     }
 
-    _gps_server_enabled = False
-    _gps_server = None
-    _gps_server_timeout = 0.5
+    _codec_schema_file = 'json/codec/codecs.json'
+    _compiled_codecs = None
+    _codecs = None
+    _null_codec = CodecNull()
 
-    def __init__(self, config: Configuration) -> None:
-        self._codec_lookup = CodecManager._codec_lookup
-        CodecManager._gps_server = dict(config).get('gps_server', None)
-        CodecManager._gps_server_timeout = dict(config).get('gps_server_timeout', 0.5)
-        if CodecManager._gps_server:
-            CodecManager._gps_server_enabled = connect_gps_server()
+    _gps_poller = None
 
+    def __init__(self, config: Configuration) -> None:
+        if CodecManager._codecs is None:
+            CodecManager._compiled_codecs = compile_codec_schema(CodecManager._codec_schema_file)
+            CodecManager._codecs = build_codec_registry(CodecManager._compiled_codecs)
+        options = dict(config)
+        if gps_server := options.get('gps_server', None):
+            CodecManager._gps_poller = GpsPoller(server=gps_server, timeout=options.get('gps_server_timeout', 0.5),
+                                                 interval=options.get('gps_server_interval', 1.0), maximum_age=options.get('gps_server_maximum_age', 5.0))
+        for plugin in [plugin.strip() for plugin in options.get('codec_plugins', '').split(',')]:
+            if len(plugin):
+                self.load_plugin(plugin)
+
+    def start(self) -> None:
+        if CodecManager._gps_poller is not None:
+            CodecManager._gps_poller.start()
+
+    def stop(self) -> None:
+        if CodecManager._gps_poller is not None:
+            CodecManager._gps_poller.stop()
 
     def codec(self, did_id: int) -> Codec:
+        # codec instance for the DID, unknown DIDs get the null codec
+        return CodecManager._codecs.get(did_id, CodecManager._null_codec)
+
+    def reference_codec(self, did_id: int) -> Codec:
+        # hand-written codec class for the DID, used to check the table-driven codecs
         try:
-            return self._codec_lookup.get(DidId(did_id), CodecNull)
+            return CodecManager._codec_lookup.get(DidId(did_id), CodecNull)()
         except ValueError:
-            return CodecNull
+            return CodecManager._null_codec
+
+    def register_codec(self, did_id: int, codec: Codec) -> None:
+        if isinstance(codec, type) and issubclass(codec, DidCodec):
+            codec = codec()
+        if not isinstance(codec, DidCodec):
+            raise FailedInitialization(f"Codec for DID {did_id} is not a udsoncan DidCodec")
+        if not isinstance(did_id, int) or did_id < 0 or did_id > 0xFFFF:
+            raise FailedInitialization(f"Codec DID '{did_id}' is not a 16 bit DID")
+        if did_id in CodecManager._codecs:
+            _LOGGER.debug(f"Codec for DID {did_id:04X} replaced by {type(codec).__name__}")
+        CodecManager._codecs[did_id] = codec
+
+    def load_plugin(self, plugin: str) -> None:
+        # a plugin is a module with a register_codecs(codec_manager) function that calls register_codec()
+        try:
+            module = importlib.import_module(plugin)
+        except ImportError as e:
+            raise FailedInitialization(f"Unable to import codec plugin '{plugin}': {e}")
+        if not callable(register_codecs := getattr(module, 'register_codecs', None)):
+            raise FailedInitialization(f"Codec plugin '{plugin}' has no register_codecs() function")
+        codec_count = len(CodecManager._codecs)
+        register_codecs(self)
+        _LOGGER.info(f"Loaded codec plugin '{plugin}', {len(CodecManager._codecs) - codec_count} new codecs")
+
+
+def build_codec_registry(compiled_codecs: dict) -> dict:
+    """Codec instances keyed by the integer DID, the table-driven codecs replace the hand-written classes."""
+    codecs = {did_id.value: codec_class() for did_id, codec_class in CodecManager._codec_lookup.items()}
+    codecs.update(compiled_codecs)
+    return codecs
 
 
 def connect_gps_server() -> bool:
-    CodecManager._gps_server_enabled = False
-    for _ in range(3):
-        try:
-            _ = requests.get(CodecManager._gps_server, timeout=CodecManager._gps_server_timeout)
-            CodecManager._gps_server_enabled = True
-            break
-        except (ReadTimeout, HTTPError, InvalidURL, InvalidSchema, ConnectTimeout, ConnectionError, MissingSchema) as e:
-            continue
-        except Exception as e:
-            _LOGGER.exception(f"Unexpected exception testing for GPS server '{CodecManager._gps_server}': {e}")
-
-    if CodecManager._gps_server_enabled:
-        _LOGGER.info(f"Connected to precision GPS server '{CodecManager._gps_server}'")
-    else:
-        _LOGGER.error(f"Unable to connect to precision GPS server '{CodecManager._gps_server}', server is disabled")
-    return CodecManager._gps_server_enabled
+    # the poller reconnects in the background, this only cuts its backoff short
+    if CodecManager._gps_poller is None:
+        return False
+    CodecManager._gps_poller.reconnect()
+    return CodecManager._gps_poller.connected()
@@ -0,0 +1,197 @@
+"""
+Command set scheduler
+"""
+
+import logging
+import heapq
+from copy import copy
+from itertools import count
+from threading import Condition
+from time import time
+
+from typing import List, Tuple
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+class CommandScheduler:
+    """
+        Heap of command sets ordered by their next deadline.
+
+        Periodic command sets are rescheduled from their previous deadline rather than the time they
+        fired so the schedule does not drift, waiters block on a condition variable until the earliest
+        deadline or until a new state loads its command sets.
+    """
+
+    # command sets due within the same tick fire together
+    _tick = 0.010
+
+    def __init__(self) -> None:
+        self._condition = Condition()
+        self._heap = []
+        self._sequence = count()
+        self._statistics = {}
+
+    def load(self, command_sets: List[Tuple[float, int, List[dict]]]) -> None:
+        # command_sets is a list of (offset, period, module_list), replaces any command sets already scheduled
+        now = time()
+        with self._condition:
+            self._heap = []
+            self._statistics = {}
+            for offset, period, module_list in command_sets:
+                name = self._command_set_name(period, module_list)
+                command_set = {'name': name, 'period': period, 'module_list': module_list}
+                self._statistics[name] = {'fired': 0, 'missed': 0, 'lateness_mean': 0.0, 'lateness_m2': 0.0, 'lateness_max': 0.0}
+                heapq.heappush(self._heap, (now + offset, next(self._sequence), command_set))
+            self._condition.notify_all()
+
+    def empty(self) -> bool:
+        with self._condition:
+            return len(self._heap) == 0
+
+    def next_deadline(self) -> float:
+        with self._condition:
+            return self._heap[0][0] if len(self._heap) else None
+
+    def notify(self) -> None:
+        with self._condition:
+            self._condition.notify_all()
+
+    def due(self) -> List[dict]:
+        """Return the command sets that are due without blocking."""
+        with self._condition:
+            return self._pop_due(time())
+
+    def wait_due(self, timeout: float = None) -> List[dict]:
+        """Block until one or more command sets are due and return them, or an empty list after the timeout."""
+        wait_until = None if timeout is None else time() + timeout
+        with self._condition:
+            while True:
+                now = time()
+                if len(self._heap) and self._heap[0][0] <= now + CommandScheduler._tick:
+                    return self._pop_due(now)
+                waits = []
+                if len(self._heap):
+                    waits.append(self._heap[0][0] - now)
+                if wait_until is not None:
+                    if now >= wait_until:
+                        return []
+                    waits.append(wait_until - now)
+                self._condition.wait(min(waits) if len(waits) else None)
+
+    def statistics(self) -> dict:
+        """Lateness and jitter (standard deviation of the lateness) in seconds for each command set."""
+        with self._condition:
+            statistics = {}
+            for name, stats in self._statistics.items():
+                fired = stats.get('fired')
+                jitter = (stats.get('lateness_m2') / (fired - 1)) ** 0.5 if fired > 1 else 0.0
+                statistics[name] = {'fired': fired, 'missed': stats.get('missed'), 'lateness_mean': stats.get('lateness_mean'), 'lateness_max': stats.get('lateness_max'), 'jitter': jitter}
+            return statistics
+
+    def log_statistics(self) -> None:
+        for name, stats in self.statistics().items():
+            if stats.get('fired') > 0:
+                _LOGGER.debug(f"Command set {name}: fired {stats.get('fired')}, missed {stats.get('missed')}, "
+                              f"lateness {stats.get('lateness_mean') * 1000:.1f} ms (max {stats.get('lateness_max') * 1000:.1f} ms), jitter {stats.get('jitter') * 1000:.1f} ms")
+
+    def _pop_due(self, now: float) -> List[dict]:
+        due = []
+        while len(self._heap) and self._heap[0][0] <= now + CommandScheduler._tick:
+            deadline, _, command_set = heapq.heappop(self._heap)
+            self._update_statistics(command_set.get('name'), max(now - deadline, 0.0))
+            due.append(command_set)
+            if (period := command_set.get('period')) > 0:
+                next_deadline = deadline + period
+                if next_deadline <= now:
+                    # fell more than a period behind, skip the missed deadlines instead of firing a burst
+                    missed = int((now - next_deadline) // period) + 1
+                    next_deadline += missed * period
+                    self._statistics[command_set.get('name')]['missed'] += missed
+                heapq.heappush(self._heap, (next_deadline, next(self._sequence), command_set))
+        return due
+
+    def _update_statistics(self, name: str, lateness: float) -> None:
+        # Welford's running mean and variance
+        stats = self._statistics[name]
+        stats['fired'] += 1
+        delta = lateness - stats['lateness_mean']
+        stats['lateness_mean'] += delta / stats['fired']
+        stats['lateness_m2'] += delta * (lateness - stats['lateness_mean'])
+        stats['lateness_max'] = max(stats['lateness_max'], lateness)
+
+    def _command_set_name(self, period: int, module_list: List[dict]) -> str:
+        modules = []
+        for module in module_list:
+            dids = ','.join([f"{did.get('did_id'):04X}" for did in module.get('dids')])
+            modules.append(f"{module.get('module')}[{dids}]")
+        name = f"{' '.join(modules)} every {period}s" if period > 0 else f"{' '.join(modules)} once"
+        while name in self._statistics:
+            name += "'"
+        return name
+
+
+def coalesce_command_sets(command_sets: List[dict]) -> List[dict]:
+    """
+        Merge the modules of command sets that are due together so each module is read once,
+        read_module() then batches the merged DIDs up to the module's DID limit.
+    """
+    module_list = []
+    merged_modules = {}
+    for command_set in command_sets:
+        for module in command_set.get('module_list'):
+            module_name = module.get('module')
+            if (merged_module := merged_modules.get(module_name, None)) is None:
+                merged_module = dict(module)
+                merged_module['dids'] = list(module.get('dids'))
+                merged_modules[module_name] = merged_module
+                module_list.append(merged_module)
+                continue
+            merged_dids = [did.get('did_id') for did in merged_module.get('dids')]
+            for did in module.get('dids'):
+                if did.get('did_id') not in merged_dids:
+                    merged_module['dids'].append(did)
+    return module_list
+
+
+def split_responses(command_sets: List[dict], responses: List[dict]) -> List[List[dict]]:
+    """
+        Split the responses to a coalesced read back into the command sets that asked for them,
+        a DID requested by more than one command set is returned to the first one only.
+    """
+    owners = {}
+    for index, command_set in enumerate(command_sets):
+        for module in command_set.get('module_list'):
+            for did in module.get('dids'):
+                owners.setdefault((module.get('arbitration_id'), did.get('did_id')), index)
+
+    command_set_responses = [[] for _ in command_sets]
+    for response_record in responses:
+        arbitration_id = response_record.get('arbitration_id')
+        response = response_record.get('response')
+        if (did_list := response_record.get('did_list', None)) is not None:
+            # timeouts and unconnected modules list the DIDs that were requested
+            did_lists = {}
+            for did_id in did_list:
+                did_lists.setdefault(owners.get((arbitration_id, did_id), 0), []).append(did_id)
+            for index, owned_dids in did_lists.items():
+                split_record = dict(response_record)
+                split_record['did_list'] = owned_dids
+                command_set_responses[index].append(split_record)
+            continue
+
+        values = {}
+        for did_id, value in response.service_data.values.items():
+            values.setdefault(owners.get((arbitration_id, did_id), 0), {})[did_id] = value
+        if len(values) == 1:
+            command_set_responses[next(iter(values))].append(response_record)
+            continue
+        for index, owned_values in values.items():
+            split_response = copy(response)
+            split_response.service_data = copy(response.service_data)
+            split_response.service_data.values = owned_values
+            split_record = dict(response_record)
+            split_record['response'] = split_response
+            command_set_responses[index].append(split_record)
+    return command_set_responses
@@ -0,0 +1,96 @@
+"""
+Converts Record output files between the JSON array format, JSON Lines and the binary format.
+
+Record writes JSON Lines ('.jsonl') or the binary format ('.rec'), files written before that are
+JSON arrays ('.json').  The output format is taken from the output file extension:
+
+    python3 convert_records.py input=record-files/trip_2023-02-12_15_53.json [output=record-files/trip_2023-02-12_15_53.rec] [index_interval=60]
+
+Without an output file an array or binary file is converted to JSON Lines next to it, a JSON Lines
+file is converted to a JSON array.  'index_interval' sets the seconds between the index entries of
+a binary output file.
+"""
+
+import sys
+import os
+import json
+import logging
+
+import logfiles
+import version
+from record_writer import format_record, load_records
+from record_binary import EXTENSION as BINARY_EXTENSION, BinaryRecordEncoder
+from exceptions import FailedInitialization, RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+def write_records(file: str, records: list, index_interval: float = 60.0) -> None:
+    if file.endswith(BINARY_EXTENSION):
+        encoder = BinaryRecordEncoder(index_interval)
+        with open(file, 'wb') as outfile:
+            offset = outfile.write(encoder.header())
+            for record in records:
+                offset += outfile.write(encoder.encode(record, offset))
+            outfile.write(encoder.footer(offset))
+        return
+    with open(file, 'w') as outfile:
+        if file.endswith('.jsonl'):
+            for record in records:
+                outfile.write(format_record(record) + '\n')
+            return
+        array_records = []
+        for record in records:
+            arbitration_id = record.get('arbitration_id')
+            did_id = record.get('did_id')
+            array_records.append({'time': record.get('time'), 'arbitration_id': arbitration_id, 'arbitration_id_hex': f"{arbitration_id:04X}",
+                                  'did_id': did_id, 'did_id_hex': f"{did_id:04X}", 'payload': list(record.get('payload'))})
+        json.dump(array_records, outfile, indent=4, sort_keys=False)
+
+
+def main() -> None:
+    logfiles.start('log/convert_records.log')
+    _LOGGER.info(f"Mustang Mach E Record File Converter version {version.get_version()} PID is {os.getpid()}")
+    try:
+        input_file = None
+        output_file = None
+        index_interval = 60.0
+        for arg in sys.argv[1:]:
+            if arg.find('input=') == 0:
+                input_file = arg[len('input='):]
+            elif arg.find('output=') == 0:
+                output_file = arg[len('output='):]
+            elif arg.find('index_interval=') == 0:
+                index_interval = float(arg[len('index_interval='):])
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+        if input_file is None:
+            raise FailedInitialization(f"An input file is required")
+        if output_file is None:
+            root, extension = os.path.splitext(input_file)
+            output_file = root + ('.json' if extension == '.jsonl' else '.jsonl')
+        if os.path.abspath(input_file) == os.path.abspath(output_file):
+            raise FailedInitialization(f"Input and output files are the same")
+
+        records = load_records(input_file)
+        write_records(output_file, records, index_interval)
+        input_size = os.path.getsize(input_file)
+        output_size = os.path.getsize(output_file)
+        _LOGGER.info(f"Converted {len(records)} records from '{input_file}' ({input_size} bytes) to '{output_file}' ({output_size} bytes), {input_size / max(output_size, 1):.1f}x")
+
+    except KeyboardInterrupt:
+        print()
+    except RuntimeError as e:
+        _LOGGER.error(f"Run time error: {e}")
+    except FailedInitialization as e:
+        _LOGGER.error(f"{e}")
+    except Exception as e:
+        _LOGGER.exception(f"Unexpected exception: {e}")
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        main()
+    else:
+        print("python 3.10 or better required")
@@ -0,0 +1,111 @@
+"""
+Precision GPS server poller
+"""
+
+import logging
+from threading import Thread, Event
+from time import time
+
+import requests
+from requests.exceptions import RequestException
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+class GpsPoller:
+    """
+        Polls the phone GPS server from its own thread over a keep-alive session and keeps the latest fix,
+        the GPS codec reads the fix without waiting on the network so GPS latency never adds to an ISO-TP
+        transaction.  A failed poll waits before trying again, doubling the wait up to the maximum.
+    """
+
+    _backoff = 5.0
+    _backoff_max = 60.0
+
+    def __init__(self, server: str, timeout: float = 0.5, interval: float = 1.0, maximum_age: float = 5.0) -> None:
+        self._server = server
+        self._timeout = timeout
+        self._interval = interval
+        self._maximum_age = maximum_age
+        self._fix = None
+        self._connected = False
+        self._exit = Event()
+        self._wakeup = Event()
+        self._thread = None
+
+    def start(self) -> Thread:
+        if self._thread and self._thread.is_alive():
+            return self._thread
+        self._exit.clear()
+        self._thread = Thread(target=self._poll_task, name='gps_poller', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._exit.set()
+        self._wakeup.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+
+    def server(self) -> str:
+        return self._server
+
+    def connected(self) -> bool:
+        return self._connected
+
+    def reconnect(self) -> None:
+        # cut any backoff short, the poller tries the server right away
+        self._wakeup.set()
+
+    def latest_fix(self) -> dict:
+        """The latest fix or None if there is no fix newer than the maximum age, never blocks."""
+        fix = self._fix
+        if fix is None or time() - fix.get('time') > self._maximum_age:
+            return None
+        return fix
+
+    def _poll_task(self) -> None:
+        backoff = GpsPoller._backoff
+        with requests.Session() as session:
+            while not self._exit.is_set():
+                request_time = time()
+                try:
+                    response = session.get(self._server, timeout=self._timeout)
+                    response.raise_for_status()
+                    self._fix = self._parse_fix(response.json(), time() - request_time)
+                    if not self._connected:
+                        _LOGGER.info(f"Connected to precision GPS server '{self._server}'")
+                    self._connected = True
+                    backoff = GpsPoller._backoff
+                    wait = max(self._interval - (time() - request_time), 0.0)
+                except (RequestException, ValueError, TypeError) as e:
+                    if self._connected or self._fix is None:
+                        _LOGGER.error(f"Unable to reach precision GPS server '{self._server}', retrying in {backoff:.1f} seconds: {e}")
+                    else:
+                        _LOGGER.debug(f"Precision GPS server '{self._server}' still unreachable, retrying in {backoff:.1f} seconds: {e}")
+                    self._connected = False
+                    wait = backoff
+                    backoff = min(backoff * 2, GpsPoller._backoff_max)
+                except Exception as e:
+                    _LOGGER.exception(f"Unexpected GPS exception: {e}")
+                    self._connected = False
+                    wait = backoff
+                    backoff = min(backoff * 2, GpsPoller._backoff_max)
+
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+
+    def _parse_fix(self, phone_gps: dict, elapsed: float) -> dict:
+        # speed (m/s) and bearing are negative when the phone does not have them
+        speed = float(phone_gps.get('speed'))
+        bearing = float(phone_gps.get('course'))
+        return {
+            'time': time(),
+            'latitude': round(float(phone_gps.get('latitude')), 6),
+            'longitude': round(float(phone_gps.get('longitude')), 6),
+            'elevation': round(float(phone_gps.get('altitude')), 1),
+            'speed': speed if speed >= 0.0 else None,
+            'bearing': bearing if bearing >= 0.0 else None,
+            'elapsed': elapsed,
+        }
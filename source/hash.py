@@ -174,34 +174,39 @@ class Hash(Enum):
     TR_ExteriorAverage          = 'FFFF:9001:tr_exterior_average:float'
 
 
+def _build_hash_index() -> Tuple[dict, dict, dict]:
+    # get_hash() used to try the ':int', ':float', ':str' and ':bool' suffixes in that order, keep the same precedence
+    type_precedence = {'int': 0, 'float': 1, 'str': 2, 'bool': 3}
+    hash_index = {}
+    hash_fields = {}
+    db_fields = {}
+    for hash in sorted(Hash, key=lambda hash: type_precedence.get(hash.value.split(':')[3], len(type_precedence))):
+        arbitration_id, did_id, name, db_type = hash.value.split(':')
+        fields = (int(arbitration_id, base=16), int(did_id, base=16), name)
+        hash_fields[hash] = fields
+        db_fields[hash] = (name, db_type)
+        if db_type in type_precedence:
+            hash_index.setdefault(fields, hash)
+    return hash_index, hash_fields, db_fields
+
+
+_HASH_INDEX, _HASH_FIELDS, _DB_FIELDS = _build_hash_index()
+
+
+def lookup_hash(arbitration_id: int, did_id: int, name: str) -> Hash:
+    if (hash := _HASH_INDEX.get((arbitration_id, did_id, name), None)) is None:
+        _LOGGER.error(f"Hash error: no hash defined for hash string '{arbitration_id:04X}:{did_id:04X}:{name}'")
+    return hash
+
+
 def get_hash(hash: str) -> Hash:
-    try:
-        hash_int = hash + ':int'
-        return Hash(hash_int)
-    except ValueError:
-        try:
-            hash_float = hash + ':float'
-            return Hash(hash_float)
-        except ValueError:
-            try:
-                hash_str = hash + ':str'
-                return Hash(hash_str)
-            except ValueError:
-                try:
-                    hash_str = hash + ':bool'
-                    return Hash(hash_str)
-                except ValueError:
-                    _LOGGER.error(f"Hash error: no hash defined for hash string '{hash}'")
-                    return None
-
-
-def get_hash_fields(hash: Hash) -> Tuple[int, int, str, str]:
-    hash_fields = hash.value.split(':')
-    return int(hash_fields[0], base=16), int(hash_fields[1], base=16), hash_fields[2]
-
-
-def get_db_fields(hash: Hash) -> Tuple[str, type]:
-    hash_fields = hash.value.split(':')
-    db_type = hash_fields[3]
-    db_name = hash_fields[2]
-    return db_name, db_type
+    arbitration_id, did_id, name = hash.split(':', 2)
+    return lookup_hash(int(arbitration_id, base=16), int(did_id, base=16), name)
+
+
+def get_hash_fields(hash: Hash) -> Tuple[int, int, str]:
+    return _HASH_FIELDS[hash]
+
+
+def get_db_fields(hash: Hash) -> Tuple[str, str]:
+    return _DB_FIELDS[hash]
@@ -2,10 +2,12 @@
 #
 # InfluxDB Line Protocol Reference
 # https://docs.influxdata.com/influxdb/v2.0/reference/syntax/line-protocol/
+#
+# Points are encoded by line_protocol.py with nanosecond timestamps
 
 import os
 import logging
-from time import time
+from time import time_ns
 import datetime
 from typing import List
 
@@ -16,6 +18,9 @@ from influxdb_client.rest import ApiException
 from config.configuration import Configuration
 
 from exceptions import FailedInitialization
+from influxdb_writer import InfluxDBWriter
+from spool import Spool
+from line_protocol import LineProtocolEncoder, seconds_to_ns
 from urllib3.exceptions import ReadTimeoutError, ConnectTimeoutError, NewConnectionError
 
 from state_engine import get_state_value, set_state
@@ -38,11 +43,20 @@ class InfluxDB:
     _bucket = None
     _org = None
 
-    _line_points = []
+    _writer = None
     _block_size = 500
+    _flush_interval = 10.0
+    _queue_size = 20000
+
+    _did_encoder = LineProtocolEncoder('did')
+    _trip_encoder = LineProtocolEncoder('trip')
+    _charge_encoder = LineProtocolEncoder('charge')
 
+    _spool = None
+    _spool_path = 'cached/influxdb_spool'
     _backup_file = 'cached/influxdb.backup'
 
+
 def influxdb_connect(influxdb_config: Configuration):
     if InfluxDB._client is None:
         influxdb_config = dict(influxdb_config)
@@ -51,20 +65,21 @@ def influxdb_connect(influxdb_config: Configuration):
         InfluxDB._bucket = influxdb_config.get('bucket')
         InfluxDB._org = influxdb_config.get('org')
         InfluxDB._block_size = influxdb_config.get('block_size', 500)
+        InfluxDB._flush_interval = influxdb_config.get('flush_interval', 10.0)
+        InfluxDB._queue_size = influxdb_config.get('queue_size', 20000)
         InfluxDB._enable = influxdb_config.get('enable', False)
         _connect_influxdb_client()
 
-        if not os.path.exists(InfluxDB._backup_file):
-            path = os.path.dirname(InfluxDB._backup_file)
-            if not os.path.exists(path):
-                os.mkdir(path)
-            try:
-                with open(InfluxDB._backup_file, 'w') as _:
-                    pass
-            except FileNotFoundError:
-                raise FailedInitialization(f"Unable to create InfluxDB backup file {InfluxDB._backup_file}")
-        else:
-            write_lp_points([])
+        try:
+            InfluxDB._spool = Spool(InfluxDB._spool_path)
+            _migrate_backup_file()
+        except OSError as e:
+            raise FailedInitialization(f"Unable to create the InfluxDB spool in '{InfluxDB._spool_path}': {e}")
+
+        # points are written from the writer thread, spooled points are replayed in the background
+        InfluxDB._writer = InfluxDBWriter(write_points=_write_points, spool=InfluxDB._spool,
+                                          block_size=InfluxDB._block_size, flush_interval=InfluxDB._flush_interval, queue_size=InfluxDB._queue_size)
+        InfluxDB._writer.start()
 
 
 def _connect_influxdb_client():
@@ -87,8 +102,11 @@ def _connect_influxdb_client():
 
 
 def influxdb_disconnect():
-    if len(InfluxDB._line_points) > 0:
-        influxdb_write_record(data_points=[], flush=True)
+    if InfluxDB._writer:
+        InfluxDB._writer.stop()
+        InfluxDB._writer = None
+    if InfluxDB._spool:
+        InfluxDB._spool.close()
     if InfluxDB._write_api:
         try:
             InfluxDB._write_api.close()
@@ -104,117 +122,80 @@ def influxdb_disconnect():
         InfluxDB._client = None
 
 
-def write_lp_points(lp_points: List) -> None:
-    try:
-        if len(lp_points) > 0:
-            InfluxDB._write_api.write(bucket=InfluxDB._bucket, record=lp_points, write_precision=WritePrecision.S)
-            _LOGGER.info(f"Wrote {len(lp_points)} points to {InfluxDB._url}")
-        if os.path.getsize(InfluxDB._backup_file):
-            try:
-                with open(InfluxDB._backup_file, 'r') as infile:
-                    cached_points = list(infile)
-                InfluxDB._write_api.write(bucket=InfluxDB._bucket, record=cached_points, write_precision=WritePrecision.S)
-                with open(InfluxDB._backup_file, 'w') as _:
-                    pass
-                _LOGGER.info(f"Wrote {len(cached_points)} cached points from backup file '{InfluxDB._backup_file}' to {InfluxDB._url}")
-            except ApiException as e:
-                _LOGGER.error(f"Failed to write backup file: {e}")
-            except (ReadTimeoutError, ConnectTimeoutError):
-                _LOGGER.error(f"Failed to write backup file '{InfluxDB._backup_file}' contents to {InfluxDB._url}")
-    except ApiException as e:
-        _LOGGER.error(f"InfluxDB ApiException: {e}")
-        with open(InfluxDB._backup_file, 'a') as outfile:
-            for lp_point in InfluxDB._line_points:
-                outfile.write(f"{lp_point}\n")
-    except (RuntimeError, ReadTimeoutError, ConnectTimeoutError):
-        with open(InfluxDB._backup_file, 'a') as outfile:
-            for lp_point in InfluxDB._line_points:
-                outfile.write(f"{lp_point}\n")
-        _LOGGER.error(f"Wrote {len(InfluxDB._line_points)} points to backup file '{InfluxDB._backup_file}'")
+def write_lp_points(lp_points: List, flush: bool = False) -> None:
+    # queued for the writer thread, never waits on the network
+    if InfluxDB._writer:
+        InfluxDB._writer.write(lp_points, flush=flush)
+    elif InfluxDB._spool:
+        InfluxDB._spool.append(lp_points)
+
+
+def _write_points(lp_points: List) -> None:
+    # runs on the writer thread, raises if the points could not be written
+    if InfluxDB._write_api is None:
+        raise RuntimeError(f"Not connected to {InfluxDB._url}")
+    InfluxDB._write_api.write(bucket=InfluxDB._bucket, record=lp_points, write_precision=WritePrecision.NS)
+    _LOGGER.info(f"Wrote {len(lp_points)} points to {InfluxDB._url}")
+
+
+def _migrate_backup_file() -> None:
+    # points cached in the single backup file used before the spool are moved to the spool
+    if not os.path.exists(InfluxDB._backup_file):
+        return
+    lp_points = []
+    migrated = 0
+    with open(InfluxDB._backup_file, 'r') as infile:
+        for line in infile:
+            # the backup file has second timestamps, the spool is in nanoseconds
+            if len(line := line.rstrip('\n')):
+                fields, _, timestamp = line.rpartition(' ')
+                lp_points.append(f"{fields} {seconds_to_ns(int(timestamp) if timestamp.isdigit() else timestamp)}")
+            if len(lp_points) >= InfluxDB._block_size:
+                InfluxDB._spool.append(lp_points)
+                migrated += len(lp_points)
+                lp_points = []
+    if len(lp_points):
+        InfluxDB._spool.append(lp_points)
+        migrated += len(lp_points)
+    os.remove(InfluxDB._backup_file)
+    _LOGGER.info(f"Moved {migrated} cached points from backup file '{InfluxDB._backup_file}' to the spool in '{InfluxDB._spool_path}'")
 
 
 def influxdb_trip(tags: List[Hash], fields: List[Hash], trip_start: Hash) -> None:
-    ts_start = get_state_value(trip_start)
-    line_protocol = f"trip"
-    for _, hash in enumerate(tags):
-        tag_name, _ = get_db_fields(hash)
-        line_protocol += ',' + tag_name + '=' + f'{get_state_value(hash)}'
-    line_protocol += ' '
-
-    for index, hash in enumerate(fields):
-        if index >= 1:
-            line_protocol += ','
-        field_name, field_type = get_db_fields(hash)
-        field_value = str(get_state_value(hash))
-        if field_type == 'str':
-            field_value = f'"{field_value}"'
-        line_protocol += field_name + '=' + field_value
-        if field_type == 'int':
-            line_protocol += 'i'
-    line_protocol += f" {ts_start}"
-    write_lp_points([line_protocol])
-    influxdb_write_record(data_points=[], flush=True)
+    _write_summary(InfluxDB._trip_encoder, tags, fields, trip_start)
 
 
 def influxdb_charging(tags: List[Hash], fields: List[Hash], charge_start: Hash) -> None:
-    ts_start = get_state_value(charge_start)
-    line_protocol = f"charge"
-    for _, hash in enumerate(tags):
-        tag_name, _ = get_db_fields(hash)
-        line_protocol += ',' + tag_name + '=' + f'{get_state_value(hash)}'
-    line_protocol += ' '
-
-    for index, hash in enumerate(fields):
-        if index >= 1:
-            line_protocol += ','
-        field_name, field_type = get_db_fields(hash)
-        field_value = str(get_state_value(hash))
-        if field_type == 'str':
-            field_value = f'"{field_value}"'
-        line_protocol += field_name + '=' + field_value
-        if field_type == 'int':
-            line_protocol += 'i'
-    line_protocol += f" {ts_start}"
-    write_lp_points([line_protocol])
-    influxdb_write_record(data_points=[], flush=True)
+    _write_summary(InfluxDB._charge_encoder, tags, fields, charge_start)
+
+
+def _write_summary(encoder: LineProtocolEncoder, tags: List[Hash], fields: List[Hash], start: Hash) -> None:
+    if (start_time := get_state_value(start)) is None:
+        _LOGGER.debug(f"No {start.name} state, the summary was not written")
+        return
+    encoder.set_tags([(hash, get_state_value(hash)) for hash in tags])
+    line_protocol = encoder.encode_fields([(hash, get_state_value(hash)) for hash in fields], seconds_to_ns(start_time))
+    if line_protocol:
+        write_lp_points([line_protocol], flush=True)
 
 
 def influxdb_write_record(data_points: List[dict], flush=False) -> None:
-    lp_points = []
-    ts = int(time())
     id = get_state_value(Hash.DatabaseID)
     vehicle = get_state_value(Hash.Vehicle)
     if vehicle is None:
         return
     if id is None:
         return
-    id_tag_name, _ = get_db_fields(Hash.DatabaseID)
-    vtag_name, _ = get_db_fields(Hash.Vehicle)
+    encoder = InfluxDB._did_encoder
+    encoder.set_tags([(Hash.DatabaseID, id), (Hash.Vehicle, vehicle)])
+    points = []
     for data_point in data_points:
-        arb_id = data_point.get('arbitration_id')
-        did_id = data_point.get('did_id')
-        did_name = data_point.get('name')
-        value = data_point.get('value')
-        line_protocol = f"did,{id_tag_name}={id},{vtag_name}={vehicle} {did_name}="
-        if hash := get_hash(f"{arb_id:04X}:{did_id:04X}:{did_name}"):
-            _, field_type = get_db_fields(hash)
-            if field_type == 'str':
-                value = f'"{value}"'
-            line_protocol += str(value)
-            if field_type == 'int':
-                line_protocol += 'i'
-            if field_type == 'bool':
-                line_protocol += ''
-            line_protocol += f" {ts}"
-            lp_points.append(line_protocol)
-            InfluxDB._line_points += lp_points
-        else:
-            _LOGGER.error(f"Can't find hash for: {arb_id:04X}:{did_id:04X}:{did_name}")
+        if hash := data_point.get('hash', None) or lookup_hash(data_point.get('arbitration_id'), data_point.get('did_id'), data_point.get('name')):
+            points.append((hash, data_point.get('value')))
+    lp_points = encoder.encode_batch(points, time_ns())
 
-    if len(InfluxDB._line_points) >= InfluxDB._block_size or flush == True:
-        if len(InfluxDB._line_points) > 0:
-            write_lp_points(InfluxDB._line_points)
-            InfluxDB._line_points = []
+    if len(lp_points) > 0 or flush == True:
+        write_lp_points(lp_points, flush=flush)
 
 
 if __name__ == '__main__':
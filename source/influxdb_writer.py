@@ -0,0 +1,204 @@
+"""
+Background InfluxDB writer
+"""
+
+import logging
+import random
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from time import perf_counter, time
+
+from typing import Callable, List
+
+from spool import Spool
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+class InfluxDBWriter:
+    """
+        Line protocol points are queued by the state processing and written from the 'influxdb_writer' thread,
+        a block is written when it reaches the block size or when the oldest point has waited the flush interval.
+        Failed writes are retried with a jittered exponential backoff, points that still can't be written or that
+        don't fit in the queue are spilled to the spool so the caller never waits on the network.  The spool is
+        replayed a block at a time while the live points are keeping up and the server is reachable.
+
+            write_points:       writes a list of points, raises an exception if the write fails
+            spool:              Spool holding the points that could not be written
+    """
+
+    _retries = 3
+    _retry_backoff = 1.0
+    _retry_backoff_max = 30.0
+    _statistics_interval = 300.0
+
+    def __init__(self, write_points: Callable[[List[str]], None], spool: Spool,
+                 block_size: int = 500, flush_interval: float = 10.0, queue_size: int = 20000) -> None:
+        self._write_points = write_points
+        self._spool = spool
+        self._replay_at = 0.0
+        self._replay_backoff = InfluxDBWriter._retry_backoff
+        self._block_size = max(block_size, 1)
+        self._flush_interval = flush_interval
+        self._queue = Queue(maxsize=max(queue_size, self._block_size))
+        self._exit = Event()
+        self._thread = None
+        self._statistics = {}
+        self._reset_statistics()
+
+    def start(self) -> Thread:
+        self._exit.clear()
+        self._reset_statistics()
+        self._replay_at = 0.0
+        self._thread = Thread(target=self._writer_task, name='influxdb_writer', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 10.0) -> None:
+        # the queued points are written before the thread exits, whatever it left in the queue is spilled
+        self._exit.set()
+        self._wakeup()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                # the thread still owns the queue, spilling it now would race with its writes
+                _LOGGER.error(f"InfluxDB writer did not stop within {timeout:.1f} seconds, {self._queue.qsize()} queued points were not spilled")
+                self.log_statistics()
+                return
+        self._spill(self._drain())
+        self.log_statistics()
+
+    def write(self, lp_points: List[str], flush: bool = False) -> None:
+        """Queue the points without blocking, flush asks for the queued points to be written now."""
+        spilled = []
+        for index, lp_point in enumerate(lp_points):
+            try:
+                self._queue.put_nowait(lp_point)
+            except Full:
+                spilled = lp_points[index:]
+                break
+        if len(spilled):
+            if self._statistics['queue_full'] == 0:
+                _LOGGER.warning(f"InfluxDB write queue is full, spilling points to the spool")
+            self._statistics['queue_full'] += 1
+            self._spill(spilled)
+        self._statistics['queue_max'] = max(self._statistics['queue_max'], self._queue.qsize())
+        if flush:
+            self._wakeup()
+
+    def statistics(self) -> dict:
+        """Queue depth, write latency in seconds and points written per second."""
+        stats = dict(self._statistics)
+        elapsed = max(time() - stats.get('started'), 1e-6)
+        writes = stats.get('writes')
+        stats['queue_depth'] = self._queue.qsize()
+        stats['latency_mean'] = stats.get('write_time') / writes if writes else 0.0
+        stats['points_per_second'] = stats.get('points') / elapsed
+        return stats
+
+    def log_statistics(self) -> None:
+        stats = self.statistics()
+        _LOGGER.info(f"InfluxDB writer: {stats.get('points')} points in {stats.get('writes')} writes ({stats.get('points_per_second'):.1f} points/s), "
+                     f"latency {stats.get('latency_mean') * 1000:.0f} ms (max {stats.get('latency_max') * 1000:.0f} ms), "
+                     f"queue {stats.get('queue_depth')} (max {stats.get('queue_max')}), {stats.get('retries')} retries, "
+                     f"{stats.get('spilled')} points spilled, {stats.get('replayed')} points replayed")
+
+    def _reset_statistics(self) -> None:
+        self._statistics = {'started': time(), 'points': 0, 'writes': 0, 'write_time': 0.0, 'latency_max': 0.0,
+                            'retries': 0, 'spilled': 0, 'replayed': 0, 'queue_full': 0, 'queue_max': 0}
+
+    def _wakeup(self) -> None:
+        # None in the queue is a flush marker, a full queue means the writer is busy anyway
+        try:
+            self._queue.put_nowait(None)
+        except Full:
+            pass
+
+    def _drain(self) -> List[str]:
+        lp_points = []
+        while True:
+            try:
+                if (lp_point := self._queue.get_nowait()) is not None:
+                    lp_points.append(lp_point)
+            except Empty:
+                return lp_points
+
+    def _writer_task(self) -> None:
+        block = []
+        flush_at = None
+        next_statistics = time() + InfluxDBWriter._statistics_interval
+        while True:
+            flush = False
+            timeout = 0.5 if flush_at is None else min(max(flush_at - time(), 0.0), 0.5)
+            try:
+                if (lp_point := self._queue.get(timeout=timeout)) is None:
+                    flush = True
+                else:
+                    block.append(lp_point)
+                    if flush_at is None:
+                        flush_at = time() + self._flush_interval
+            except Empty:
+                pass
+
+            if self._exit.is_set() and self._queue.empty():
+                if len(block):
+                    self._write_block(block)
+                break
+
+            if len(block) >= self._block_size or (len(block) and (flush or time() >= flush_at)):
+                self._write_block(block)
+                block = []
+                flush_at = None
+
+            if self._queue.qsize() < self._block_size and time() >= self._replay_at and self._spool.pending():
+                self._replay_block()
+
+            if time() >= next_statistics:
+                self.log_statistics()
+                next_statistics = time() + InfluxDBWriter._statistics_interval
+
+    def _write_block(self, block: List[str]) -> None:
+        backoff = InfluxDBWriter._retry_backoff
+        for attempt in range(InfluxDBWriter._retries + 1):
+            start = perf_counter()
+            try:
+                self._write_points(block)
+                latency = perf_counter() - start
+                self._statistics['points'] += len(block)
+                self._statistics['writes'] += 1
+                self._statistics['write_time'] += latency
+                self._statistics['latency_max'] = max(self._statistics['latency_max'], latency)
+                # the server is reachable again, start replaying the spool
+                self._replay_at = 0.0
+                return
+            except Exception as e:
+                _LOGGER.error(f"InfluxDB write of {len(block)} points failed (attempt {attempt + 1}): {e}")
+            if attempt == InfluxDBWriter._retries or self._exit.is_set():
+                break
+            self._statistics['retries'] += 1
+            self._exit.wait(backoff * random.uniform(0.5, 1.5))
+            backoff = min(backoff * 2, InfluxDBWriter._retry_backoff_max)
+        self._spill(block)
+        self._replay_at = max(self._replay_at, time() + self._replay_backoff)
+
+    def _replay_block(self) -> None:
+        # the spool position only moves once the block is written, a failure waits before trying again
+        lp_points, position = self._spool.read_block(self._block_size)
+        try:
+            if len(lp_points):
+                self._write_points(lp_points)
+            self._spool.commit(position)
+            self._statistics['replayed'] += len(lp_points)
+            self._replay_backoff = InfluxDBWriter._retry_backoff
+            if not self._spool.pending():
+                _LOGGER.info(f"Replayed the InfluxDB spool, {self._statistics['replayed']} points since the writer started")
+        except Exception as e:
+            _LOGGER.error(f"InfluxDB replay of {len(lp_points)} spooled points failed, retrying in {self._replay_backoff:.1f} seconds: {e}")
+            self._replay_at = time() + self._replay_backoff * random.uniform(0.5, 1.5)
+            self._replay_backoff = min(self._replay_backoff * 2, InfluxDBWriter._retry_backoff_max)
+
+    def _spill(self, lp_points: List[str]) -> None:
+        if len(lp_points):
+            self._statistics['spilled'] += len(lp_points)
+            self._spool.append(lp_points)
@@ -0,0 +1,119 @@
+"""
+InfluxDB line protocol encoding
+
+InfluxDB Line Protocol Reference
+https://docs.influxdata.com/influxdb/v2.0/reference/syntax/line-protocol/
+"""
+
+import math
+from typing import Any, Callable, List, Tuple
+
+from hash import Hash, get_db_fields
+
+
+# measurements escape commas and spaces, tag keys, tag values and field keys also escape equal signs
+_MEASUREMENT_ESCAPES = str.maketrans({',': '\\,', ' ': '\\ '})
+_KEY_ESCAPES = str.maketrans({',': '\\,', ' ': '\\ ', '=': '\\='})
+_STRING_ESCAPES = str.maketrans({'"': '\\"', '\\': '\\\\'})
+
+
+def escape_measurement(measurement: str) -> str:
+    return measurement.translate(_MEASUREMENT_ESCAPES)
+
+
+def escape_key(key: str) -> str:
+    return key.translate(_KEY_ESCAPES)
+
+
+def _format_int(value: Any) -> str:
+    return f"{int(value)}i"
+
+
+def _format_float(value: Any) -> str:
+    # NaN and infinity can't be written, the field is left out
+    value = float(value)
+    return repr(value) if math.isfinite(value) else None
+
+
+def _format_str(value: Any) -> str:
+    value = str(value)
+    if '"' in value or '\\' in value:
+        value = value.translate(_STRING_ESCAPES)
+    return '"' + value + '"'
+
+
+def _format_bool(value: Any) -> str:
+    return 'true' if value else 'false'
+
+
+_VALUE_FORMATTERS = {
+    'int':      _format_int,
+    'float':    _format_float,
+    'str':      _format_str,
+    'bool':     _format_bool,
+}
+
+
+def seconds_to_ns(timestamp: Any) -> int:
+    if isinstance(timestamp, int):
+        return timestamp * 1000000000
+    return int(round(float(timestamp) * 1000000000))
+
+
+class LineProtocolEncoder:
+    """
+        Encodes points of one measurement, the escaped field key and the value formatter of every Hash are
+        compiled once and the measurement and tag set prefix is only rebuilt when the tags change, so a point
+        is a dictionary lookup and a single string format.  Timestamps are in nanoseconds.
+    """
+
+    def __init__(self, measurement: str) -> None:
+        self._measurement = escape_measurement(measurement)
+        self._tags = None
+        self._prefix = self._measurement + ' '
+        self._templates = {}
+        for hash in Hash:
+            field_name, field_type = get_db_fields(hash)
+            self._templates[hash] = (escape_key(field_name) + '=', _VALUE_FORMATTERS.get(field_type, _format_str))
+
+    def set_tags(self, tags: List[Tuple[Hash, Any]]) -> None:
+        """Tag set from (Hash, value) pairs, the tag key is the Hash field name, tags without a value are left out."""
+        if tags == self._tags:
+            return
+        self._tags = tags
+        tag_set = ''.join([f",{escape_key(get_db_fields(hash)[0])}={escape_key(str(value))}" for hash, value in tags if value is not None])
+        self._prefix = f"{self._measurement}{tag_set} "
+
+    def template(self, hash: Hash) -> Tuple[str, Callable[[Any], str]]:
+        return self._templates[hash]
+
+    def encode(self, hash: Hash, value: Any, timestamp: int) -> str:
+        field, format_value = self._templates[hash]
+        if value is None or (formatted := format_value(value)) is None:
+            return None
+        return f"{self._prefix}{field}{formatted} {timestamp}"
+
+    def encode_batch(self, points: List[Tuple[Hash, Any]], timestamp: int) -> List[str]:
+        """One line for each (Hash, value) point, all with the same timestamp, points without a value are left out."""
+        prefix = self._prefix
+        templates = self._templates
+        suffix = f" {timestamp}"
+        lines = []
+        for hash, value in points:
+            if value is None:
+                continue
+            field, format_value = templates[hash]
+            if (formatted := format_value(value)) is not None:
+                lines.append(prefix + field + formatted + suffix)
+        return lines
+
+    def encode_fields(self, fields: List[Tuple[Hash, Any]], timestamp: int) -> str:
+        """A single line with all the (Hash, value) fields, fields without a value are left out."""
+        field_set = []
+        for hash, value in fields:
+            field, format_value = self._templates[hash]
+            if value is not None and (formatted := format_value(value)) is not None:
+                field_set.append(field + formatted)
+        if len(field_set) == 0:
+            return None
+        return f"{self._prefix}{','.join(field_set)} {timestamp}"
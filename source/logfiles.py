@@ -3,10 +3,14 @@
 import os
 import sys
 import logging
+import logging.handlers
+
+from exceptions import FailedInitialization
 
 
 _LOG_FILENAME = ""
 _LOGGER = logging.getLogger('mme')
+_LOG_LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
 
 
 def rollover(filename: str) -> None:
@@ -51,3 +55,11 @@ def start(log_file: str) -> None:
 
     # First log entry
     logger.info("Created application log %s", filename)
+
+
+def set_level(log_level: str) -> None:
+    """Set the level of the application loggers, the debug logging of the decoded DIDs is skipped above 'debug'."""
+    level = _LOG_LEVELS.get(log_level.lower(), None)
+    if level is None:
+        raise FailedInitialization(f"log_level must be one of {', '.join(_LOG_LEVELS.keys())}, not '{log_level}'")
+    logging.getLogger('mme').setLevel(level)
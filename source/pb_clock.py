@@ -0,0 +1,116 @@
+import logging
+from threading import Event, Lock
+from time import monotonic
+from typing import Callable
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+class PlaybackClock:
+    """
+        Maps the time of the playback events to the wall clock.  Events are played rate times faster than
+        they were recorded (a rate of 0 plays them as fast as possible) and with speedup, gaps over 2 seconds
+        are cut to 1 second.  Pause, resume, rate and seek can be called from any thread, a seek is picked
+        up by the playback engine with take_seek().
+    """
+
+    _SPEEDUP_GAP = 2.0
+    _SPEEDUP_TO = 1.0
+    _POLL_INTERVAL = 0.25
+
+    def __init__(self, rate: float = 1.0, speedup: bool = True) -> None:
+        self._lock = Lock()
+        self._changed = Event()
+        self._rate = max(rate, 0.0)
+        self._speedup = speedup
+        self._paused = False
+        self._seek_to = None
+        self._time = None
+        self._anchor_wall = self._anchor_time = None
+
+    def time(self) -> float:
+        return self._time
+
+    def status(self) -> dict:
+        with self._lock:
+            return {'time': self._time, 'rate': self._rate, 'paused': self._paused}
+
+    def pause(self) -> None:
+        with self._lock:
+            if not self._paused:
+                self._anchor(self._position())
+                self._paused = True
+        self._changed.set()
+
+    def resume(self) -> None:
+        with self._lock:
+            if self._paused:
+                self._paused = False
+                self._anchor(self._anchor_time)
+        self._changed.set()
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            position = self._position()
+            self._rate = max(rate, 0.0)
+            self._anchor(position)
+        self._changed.set()
+
+    def seek(self, seek_time: float) -> None:
+        with self._lock:
+            self._seek_to = seek_time
+        self._changed.set()
+
+    def seek_pending(self) -> bool:
+        return self._seek_to is not None
+
+    def take_seek(self) -> float:
+        with self._lock:
+            seek_time, self._seek_to = self._seek_to, None
+            return seek_time
+
+    def seeked(self, seek_time: float) -> None:
+        """The engine moved the playback to seek_time, the clock continues from there."""
+        with self._lock:
+            self._time = seek_time
+            self._anchor(seek_time)
+
+    def wait(self, event_time: float, exit_requested: Callable[[], bool]) -> bool:
+        """Wait until the event is due, False if a seek or exit was requested first."""
+        while True:
+            if exit_requested() or self._seek_to is not None:
+                return False
+            with self._lock:
+                if self._time is None:
+                    self._time = event_time
+                    self._anchor(event_time)
+                    return True
+                target = event_time
+                if self._speedup and event_time - self._time > PlaybackClock._SPEEDUP_GAP:
+                    target = self._time + PlaybackClock._SPEEDUP_TO
+                if self._paused:
+                    delay = PlaybackClock._POLL_INTERVAL
+                elif self._rate == 0.0:
+                    delay = 0.0
+                else:
+                    delay = self._anchor_wall + (target - self._anchor_time) / self._rate - monotonic()
+                if delay <= 0.0 and not self._paused:
+                    # the cut part of a gap moves the anchor so the following events keep their spacing
+                    self._anchor_time += event_time - target
+                    self._time = event_time
+                    return True
+            self._changed.wait(min(delay, PlaybackClock._POLL_INTERVAL))
+            self._changed.clear()
+
+    def _position(self) -> float:
+        # the playback time the clock has reached, paused it stays at the anchor
+        if self._anchor_time is None or self._paused:
+            return self._anchor_time
+        if self._rate == 0.0:
+            return self._time
+        return self._anchor_time + (monotonic() - self._anchor_wall) * self._rate
+
+    def _anchor(self, playback_time: float) -> None:
+        self._anchor_wall = monotonic()
+        self._anchor_time = playback_time
@@ -0,0 +1,121 @@
+import os
+import socket
+import logging
+from threading import Event, Thread
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+class PlaybackControl:
+    """
+        Local control of the playback through a UNIX socket, one command per line and one line in reply:
+
+            pause | resume | status
+            rate <multiplier>   rate max plays the events as fast as possible
+            seek <seconds>      seconds from the start of the playback file, +seconds and -seconds are
+                                relative to the playback time and @timestamp is an absolute time
+
+        playback_ctl.py sends the commands from the command line.
+    """
+
+    _TIMEOUT = 0.5
+
+    def __init__(self, path: str, engine) -> None:
+        self._path = path
+        self._engine = engine
+        self._exit = Event()
+        self._socket = None
+        self._thread = None
+
+    def start(self) -> Thread:
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self._path)
+        self._socket.listen(1)
+        self._socket.settimeout(PlaybackControl._TIMEOUT)
+        self._exit.clear()
+        self._thread = Thread(target=self._control_task, name='playback_control', daemon=True)
+        self._thread.start()
+        _LOGGER.info(f"Playback control listening on '{self._path}'")
+        return self._thread
+
+    def stop(self) -> None:
+        self._exit.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+
+    def command(self, line: str) -> str:
+        arguments = line.split()
+        if len(arguments) == 0:
+            return 'error empty command'
+        command = arguments[0].lower()
+        try:
+            if command == 'pause' and len(arguments) == 1:
+                self._engine.pause()
+            elif command == 'resume' and len(arguments) == 1:
+                self._engine.resume()
+            elif command == 'rate' and len(arguments) == 2:
+                rate = 0.0 if arguments[1].lower() == 'max' else float(arguments[1])
+                if rate < 0.0:
+                    return f"error rate can't be negative"
+                self._engine.set_rate(rate)
+            elif command == 'seek' and len(arguments) == 2:
+                self._engine.seek(self._seek_time(arguments[1]))
+            elif command != 'status' or len(arguments) != 1:
+                return f"error unknown command '{line.strip()}'"
+        except ValueError:
+            return f"error bad value in '{line.strip()}'"
+        return 'ok ' + ' '.join([f"{key}={value}" for key, value in self._engine.status().items()])
+
+    def _seek_time(self, argument: str) -> float:
+        status = self._engine.status()
+        if argument.startswith('@'):
+            return float(argument[1:])
+        if argument.startswith('+') or argument.startswith('-'):
+            if status.get('time') is None:
+                raise ValueError
+            return status.get('time') + float(argument)
+        if status.get('start') is None:
+            raise ValueError
+        return status.get('start') + float(argument)
+
+    def _control_task(self) -> None:
+        while not self._exit.is_set():
+            try:
+                connection, _ = self._socket.accept()
+            except socket.timeout:
+                continue
+            except OSError as e:
+                _LOGGER.error(f"Playback control socket error: {e}")
+                return
+            with connection:
+                self._serve(connection)
+
+    def _serve(self, connection: socket.socket) -> None:
+        connection.settimeout(PlaybackControl._TIMEOUT)
+        buffer = b''
+        while not self._exit.is_set():
+            try:
+                data = connection.recv(1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if len(data) == 0:
+                return
+            buffer += data
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                reply = self.command(line.decode(errors='replace'))
+                _LOGGER.info(f"Playback control '{line.decode(errors='replace').strip()}': {reply}")
+                try:
+                    connection.sendall((reply + '\n').encode())
+                except OSError:
+                    return
@@ -10,6 +10,15 @@ _LOGGER = logging.getLogger('mme')
 
 
 class PlaybackDID:
+    """
+        The DID values are kept as the packed response, the precompiled structs unpack the recorded events
+        and pack the response once per event instead of once per request.  When packing the unpacked values
+        gives back the recorded payload the payload is used as the response as it is.  'T' and 't' are 24 bit
+        unsigned and signed values, a bitfield DID answers with its first value only.
+    """
+
+    # formats that pack the unpacked values back to the same bytes
+    _IDENTITY_FORMATS = set('bBhHiIlLqQTts0123456789')
 
     def __init__(self, did_id: int, did_name: str, packing: str, bitfield: bool, modules: List[str], states: List[dict], codec_manager: CodecManager) -> None:
         self._did_id = did_id
@@ -19,12 +28,28 @@ class PlaybackDID:
         self._bitfield = bitfield
         self._modules = modules
         self._codec_manager = codec_manager
-        self._states = []
+        self._did_id_bytes = struct.pack('>H', did_id)
+        initial_states = []
         for state in states:
             # variable = state.get('name', None)
             value = state.get('initial_value', None)
             assert value is not None
-            self._states.append(value)
+            initial_states.append(value)
+
+        if any(character.isdigit() for character in packing):
+            # a counted format like '17s' is a single value
+            self._unpacker = self._packer = struct.Struct('>' + packing)
+            self._packing_24bit = []
+            packed_count = 1
+        else:
+            packed_count = 1 if bitfield else len(packing)
+            self._packing_24bit = [index for index, character in enumerate(packing) if character in 'Tt']
+            self._unpacker = struct.Struct('>' + packing.replace('T', 'HB').replace('t', 'hB'))
+            self._packer = struct.Struct('>' + packing[:packed_count].replace('T', 'HB').replace('t', 'hB'))
+        self._packed_count = packed_count
+        self._identity = self._packer.format == self._unpacker.format and set(packing) <= PlaybackDID._IDENTITY_FORMATS
+        self._initial_response = self._pack(initial_states[:packed_count])
+        self._set_response(self._initial_response)
 
     def did_id(self) -> int:
         return self._did_id
@@ -32,57 +57,63 @@ class PlaybackDID:
     def did_name(self) -> str:
         return self._did_name
 
-    def response(self) -> bytearray:
-        response = bytearray()
-        index = 0
-        for state in self._states:
-            if self._packing[index] == 'T':
-                packing_format = '>L'
-            elif self._packing[index] == 't':
-                packing_format = '>l'
-            elif self._packing[index] == '1':
-                ###
-                packing_format = self._packing
-                if type(state) != bytes:
-                    state = bytes(state, 'utf-8')
-                ###
-            else:
-                packing_format = '>' + self._packing[index]
-
-            postfix = struct.pack(packing_format, state)
-            if self._packing[index] == 'T' or self._packing[index] == 't':
-                # Pack as uint then remove high order byte to get A:B:C
-                postfix = postfix[1:4]
-            response = response + postfix
-            index += 1
-            if index == 1 and self._bitfield:
-                break
-        return response
+    def response(self) -> bytes:
+        return self._response
+
+    def record(self) -> bytes:
+        """The DID and its response, as they are added to a ReadDataByIdentifier response."""
+        return self._record
+
+    def read_response(self) -> bytes:
+        """The complete positive response to a ReadDataByIdentifier request for this DID only."""
+        return self._read_response
+
+    def reset(self) -> None:
+        self._set_response(self._initial_response)
 
     def new_event(self, event) -> None:
-        payload = bytearray(event.get('payload'))
-        unpacking_format = '>' + self._packing
-        if self._packing.find('T') >= 0:
-            unpacking_format = unpacking_format.replace('T', 'HB')
-        unpacked_values = list(struct.unpack(unpacking_format, payload))
-        if self._packing.find('T') >= 0:
-            unpacked_values[0] = unpacked_values[0] * 256 + unpacked_values[1]
-
-        index = 0
-        for _ in self._states:
-            self._states[index] = unpacked_values[index]
-            index += 1
-            if index == 1 and self._bitfield:
-                break
+        payload = event.get('payload')
+        if self._identity:
+            payload = payload if type(payload) == bytes else bytes(payload)
+            if len(payload) != self._unpacker.size:
+                raise struct.error(f"DID {self._did_id_hex} payload has {len(payload)} bytes instead of {self._unpacker.size}")
+            self._set_response(payload)
+        else:
+            self._set_response(self._pack(self._unpack(payload)[:self._packed_count]))
         self._log_event(event)
 
+    def _unpack(self, payload) -> list:
+        values = list(self._unpacker.unpack(bytes(payload)))
+        for index in self._packing_24bit:
+            # 'HB' or 'hB' back to one value, left to right so the values before index are already merged
+            values[index:index + 2] = [values[index] * 256 + values[index + 1]]
+        return values
+
+    def _pack(self, states: list) -> bytes:
+        values = []
+        for index, state in enumerate(states):
+            if index in self._packing_24bit:
+                values += [state >> 8, state & 0xFF]
+            elif type(state) == str:
+                values.append(bytes(state, 'utf-8'))
+            else:
+                values.append(state)
+        return self._packer.pack(*values)
+
+    def _set_response(self, response: bytes) -> None:
+        self._response = response
+        self._record = self._did_id_bytes + response
+        self._read_response = b'\x62' + self._record
+
     def _log_event(self, event: dict) -> None:
+        # decoding the event is only needed for the debug log
+        if not _LOGGER.isEnabledFor(logging.DEBUG):
+            return
         event_time = event.get('time')
         arbitration_id = event.get('arbitration_id')
         did_id = event.get('did_id')
-        payload = event.get('payload')
-        if codec := self._codec_manager.codec(did_id):
-            decoded = codec.decode('pb', bytearray(payload))
+        payload = list(event.get('payload'))
+        if decoded := self._codec_manager.codec(did_id).decode(bytearray(payload)):
             _LOGGER.debug(f"Event {event_time:.06f} {arbitration_id:04X}/{did_id:04X} payload={payload} {decoded.get('decoded')}")
         else:
             _LOGGER.debug(f"Event {event_time:.06f} {arbitration_id:04X}/{did_id:04X} payload={payload}")
@@ -0,0 +1,102 @@
+import logging
+from collections import deque
+from threading import Thread
+from typing import List
+
+import can
+import isotp
+from can.interfaces.socketcan import SocketcanBus
+
+from pb_module import PlaybackModule
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+class _ModuleStack:
+    """The ISO-TP state machine of one module, fed with the frames the dispatcher received for it."""
+
+    def __init__(self, module: PlaybackModule, bus: can.BusABC) -> None:
+        self.module = module
+        self.frames = deque()
+        self._bus = bus
+        self.stack = isotp.TransportLayerLogic(rxfn=self._rxfn, txfn=self._txfn, address=module.address(),
+                                               error_handler=module.error_handler, params=PlaybackModule.isotp_params)
+
+    def busy(self) -> bool:
+        return self.stack.transmitting() or self.stack.is_rx_active()
+
+    def process(self) -> None:
+        self.stack.process()
+        while self.stack.available():
+            request = self.stack.recv()
+            if response := self.module.respond(request):
+                self.stack.send(response)
+                self.stack.process()
+
+    def _rxfn(self, timeout: float) -> isotp.CanMessage:
+        if len(self.frames) == 0:
+            return None
+        message = self.frames.popleft()
+        return isotp.CanMessage(arbitration_id=message.arbitration_id, data=message.data, dlc=message.dlc,
+                                extended_id=message.is_extended_id, is_fd=message.is_fd, bitrate_switch=message.bitrate_switch)
+
+    def _txfn(self, message: isotp.CanMessage) -> None:
+        self._bus.send(can.Message(arbitration_id=message.arbitration_id, data=message.data, is_extended_id=message.is_extended_id,
+                                   is_fd=message.is_fd, bitrate_switch=message.bitrate_switch))
+
+
+class ChannelDispatcher:
+    """
+        Receives the requests for all the playback modules on a CAN channel through one socket, filtered
+        to the request IDs of the modules.  The 'dispatch_<channel>' thread blocks on the socket and passes
+        each frame to the ISO-TP state machine of the module it is addressed to, only the state machines
+        with a transfer in progress shorten the wait for the next frame.
+    """
+
+    _IDLE_TIMEOUT = 0.5
+
+    def __init__(self, channel: str, modules: List[PlaybackModule], bus: can.BusABC = None) -> None:
+        self._channel = channel
+        self._modules = modules
+        self._bus = bus
+        self._own_bus = bus is None
+        self._stacks = {}
+        self._exit_requested = False
+        self._thread = None
+
+    def start(self) -> Thread:
+        self._exit_requested = False
+        if self._bus is None:
+            self._bus = SocketcanBus(channel=self._channel, can_filters=[{'can_id': module.arbitration_id(), 'can_mask': 0x7FF} for module in self._modules])
+        self._stacks = {module.arbitration_id(): _ModuleStack(module, self._bus) for module in self._modules}
+        self._thread = Thread(target=self._dispatch_task, name=f"dispatch_{self._channel}")
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._exit_requested = True
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+        if self._bus and self._own_bus:
+            self._bus.shutdown()
+            self._bus = None
+
+    def _dispatch_task(self) -> None:
+        stacks = self._stacks
+        busy = set()
+        while self._exit_requested == False:
+            timeout = min([module_stack.stack.sleep_time() for module_stack in busy]) if busy else ChannelDispatcher._IDLE_TIMEOUT
+            try:
+                message = self._bus.recv(timeout)
+            except can.CanError as e:
+                _LOGGER.error(f"{self._channel} receive error: {e}")
+                continue
+            if message is not None:
+                if (module_stack := stacks.get(message.arbitration_id)) is not None:
+                    module_stack.frames.append(message)
+                    busy.add(module_stack)
+            for module_stack in list(busy):
+                module_stack.process()
+                if not module_stack.busy() and len(module_stack.frames) == 0:
+                    busy.discard(module_stack)
@@ -1,12 +1,17 @@
 from threading import Thread
 
 import logging
-from time import sleep
-import json
+import os
+from time import sleep, perf_counter
 
 from module_manager import ModuleManager
 from config.configuration import Configuration
 
+from record_stream import RecordStream
+from record_binary import EXTENSION as BINARY_EXTENSION
+from pb_clock import PlaybackClock
+from pb_snapshot import SnapshotIndex
+from pb_control import PlaybackControl
 from exceptions import RuntimeError
 
 
@@ -19,17 +24,37 @@ class PlaybackEngine:
         playback_config = dict(config.playback)
         self._active_modules = active_modules
         self._module_manager = module_manager
-        self._filename = f"{playback_config.get('source_path')}/{playback_config.get('source_file')}.json"
+        # binary files first, then JSON Lines and the array format files written before Record switched to JSON Lines
+        for extension in [BINARY_EXTENSION, '.jsonl', '.json']:
+            self._filename = f"{playback_config.get('source_path')}/{playback_config.get('source_file')}{extension}"
+            if os.path.exists(self._filename):
+                break
         self._speedup = playback_config.get('speedup', True)
+        self._read_ahead = playback_config.get('read_ahead', 256)
+        self._clock = PlaybackClock(rate=playback_config.get('rate', 1.0), speedup=self._speedup)
+        self._snapshots = self._control = None
+        if control_socket := playback_config.get('control_socket', None):
+            # seeking is only possible with the control interface, the file is only indexed then
+            self._snapshots = SnapshotIndex(self._filename, playback_config.get('snapshot_interval', 60.0))
+            self._control = PlaybackControl(control_socket, self)
+        self._hold_at_end = self._control is not None and playback_config.get('hold_at_end', False)
         self._exit_requested = False
         self._currrent_position = None
         self._playback = None
+        self._started = None
         self._playback_alert_time = self._playback_time = None
+        self._start_time = None
+        self._fast_forward_to = None
         self._load_playback()
         self._thread = None
 
     def start(self) -> Thread:
         self._exit_requested = False
+        self._started = perf_counter()
+        self._playback.start()
+        if self._control:
+            self._snapshots.start()
+            self._control.start()
         self._thread = Thread(target=self._playback_engine, name='playback_engine')
         self._thread.start()
         return self._thread
@@ -38,49 +63,100 @@ class PlaybackEngine:
         self._exit_requested = True
         if self._thread.is_alive():
             self._thread.join()
+        if self._control:
+            self._control.stop()
+            self._snapshots.stop()
+        self._playback.stop()
+
+    def pause(self) -> None:
+        self._clock.pause()
+
+    def resume(self) -> None:
+        self._clock.resume()
+
+    def set_rate(self, rate: float) -> None:
+        self._clock.set_rate(rate)
+
+    def seek(self, seek_time: float) -> None:
+        self._clock.seek(seek_time)
+
+    def status(self) -> dict:
+        status = self._clock.status()
+        offset = None if status.get('time') is None or self._start_time is None else round(status.get('time') - self._start_time, 3)
+        return {'start': self._start_time, 'time': status.get('time'), 'offset': offset, 'rate': status.get('rate'), 'paused': status.get('paused')}
+
+    def _exit(self) -> bool:
+        return self._exit_requested
 
     def _playback_engine(self) -> None:
         try:
             while self._exit_requested == False:
+                if (seek_time := self._clock.take_seek()) is not None:
+                    self._seek(seek_time)
                 if (event := self._next_event()) is None:
                     _LOGGER.debug("No more events to process")
-                    sleep(10)
-                    return
-                if (sleep_for := event.get('time') - self._playback_time) > 0:
-                    sleep_for = 1.0 if self._speedup and sleep_for > 2.0 else sleep_for
-                    sleep(sleep_for)
+                    if self._clock.seek_pending():
+                        continue
+                    if not self._hold_at_end:
+                        sleep(10)
+                        return
+                    # held at the end of the file until the control interface seeks back
+                    while not self._exit_requested and not self._clock.seek_pending():
+                        sleep(0.25)
+                    continue
+                if self._fast_forward_to is not None and event.get('time') < self._fast_forward_to:
+                    # events between the snapshot and the seek time are applied without waiting
+                    self._process_event(event)
+                    continue
+                self._fast_forward_to = None
+                if not self._clock.wait(event.get('time'), self._exit):
+                    continue
                 self._playback_time = event.get('time')
 
                 if self._playback_time - self._playback_alert_time > 300:
                     _LOGGER.info(f"5 minutes simulated time passed: {int(self._playback_time)}")
                     self._playback_alert_time = self._playback_time
 
-                arbitration_id = event.get('arbitration_id')
-                module_name = self._module_manager.module_name(arbitration_id)
-                if module := self._active_modules.get(module_name):
-                    module.process_event(event)
-                else:
-                    _LOGGER.debug(f"what? {module_name}")
+                self._process_event(event)
         except RuntimeError as e:
             _LOGGER.error(f"Run time error: {e}")
             return
 
+    def _process_event(self, event: dict) -> None:
+        arbitration_id = event.get('arbitration_id')
+        module_name = self._module_manager.module_name(arbitration_id)
+        if module := self._active_modules.get(module_name):
+            module.process_event(event)
+        else:
+            _LOGGER.debug(f"what? {module_name}")
+
+    def _seek(self, seek_time: float) -> None:
+        # start from the DID values of the last snapshot before the seek time and fast forward from there
+        snapshot_time, snapshot = self._snapshots.snapshot(seek_time)
+        self._playback.stop()
+        self._playback = RecordStream(self._filename, self._read_ahead, snapshot_time)
+        self._playback.start()
+        for module in self._active_modules.values():
+            module.reset()
+        for event in snapshot:
+            self._process_event(event)
+        self._fast_forward_to = seek_time
+        self._playback_alert_time = self._playback_time = seek_time
+        self._clock.seeked(seek_time)
+        _LOGGER.info(f"Seek to {seek_time:.3f}, {len(snapshot)} events from the snapshot at {snapshot_time}")
+
     def _next_event(self) -> dict:
-        if self._currrent_position is None or self._currrent_position == len(self._playback):
+        if self._playback is None or (event := self._playback.next()) is None:
             return None
-        event = self._playback[self._currrent_position]
         if self._playback_time is None:
-            self._playback_alert_time = self._playback_time = event.get('time')
+            self._start_time = self._playback_alert_time = self._playback_time = event.get('time')
+            if self._started is not None:
+                _LOGGER.info(f"First playback event read {perf_counter() - self._started:.3f} seconds after starting")
         self._currrent_position += 1
         return event
 
     def _load_playback(self) -> None:
-        try:
-            with open(self._filename) as infile:
-                self._playback = json.load(infile)
-                self._currrent_position = 0
-                _LOGGER.info(f"Loaded playback file '{self._filename}'")
-        except FileNotFoundError as e:
-            raise RuntimeError(f"unable to open file '{self._filename}' ({e.strerror})")
-        except json.JSONDecodeError as e:
-            raise RuntimeError(f"JSON error in '{self._filename}' at line {e.lineno}")
+        # events are read as they are played, read_ahead events ahead of the playback
+        self._playback = RecordStream(self._filename, self._read_ahead)
+        self._currrent_position = 0
+        _LOGGER.info(f"Opened playback file '{self._filename}'")
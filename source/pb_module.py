@@ -1,12 +1,9 @@
 import logging
-from threading import Thread
-from time import sleep
 import struct
 
 from typing import List
 
 import isotp
-from can.interfaces.socketcan import SocketcanBus
 
 from module_manager import ModuleManager
 from pb_did import PlaybackDID
@@ -29,7 +26,7 @@ class PlaybackModule:
         'tx_padding' : 0x00,                       # Will pad all transmitted CAN messages with byte 0x00.
         'rx_flowcontrol_timeout' : 2000,           # Triggers a timeout if a flow control is awaited for more than 1000 milliseconds
         'rx_consecutive_frame_timeout' : 2000,     # Triggers a timeout if a consecutive frame is awaited for more than 1000 milliseconds
-        'squash_stmin_requirement' : False,        # When sending, respect the stmin requirement of the receiver. If set to True, go as fast as possible.
+        'override_receiver_stmin' : None,          # When sending, respect the stmin requirement of the receiver (can-isotp 2.x, was squash_stmin_requirement)
         'max_frame_size' : 4095                    # Limit the size of receive frame.
     }
 
@@ -47,60 +44,36 @@ class PlaybackModule:
         self._channel = channel
         self._rxid = arbitration_id
         self._txid = self._rxid + 8
-        self._exit_requested = False
-        self._bus = None
-        self._stack = None
-        self._did_thread = None
         self._dids = {}
 
-    def start(self) -> None:
-        self._exit_requested = False
-        addr = isotp.Address(isotp.AddressingMode.Normal_11bits, rxid=self._rxid, txid=self._txid)
-        self._bus = SocketcanBus(channel=self._channel)
-        self._stack = isotp.CanStack(bus=self._bus, address=addr, error_handler=self.error_handler, params=PlaybackModule.isotp_params)
-        self._did_thread = Thread(target=self._did_task, name=self._name)
-        self._did_thread.start()
-
-    def stop(self) -> None:
-        self._exit_requested = True
-        if self._did_thread.is_alive():
-            sleep(0.1)
-            self._did_thread.join()
-        if self._bus:
-            sleep(0.1)
-            self._bus.shutdown()
-            self._bus = None
-
     def add_did(self, did: PlaybackDID) -> None:
         did_id = did.did_id()
         self._dids[did_id] = did
 
-    def _did_task(self) -> None:
-        while self._exit_requested == False:
-            sleep(self._stack.sleep_time())
-            self._stack.process()
-            if self._stack.available():
-                payload = self._stack.recv()
-                service = struct.unpack_from('>B', payload)
-                if service[0] == 0x22:
-                    offset = 1
-                    response = struct.pack('>B', 0x62)
-                    while offset < len(payload):
-                        did_id = struct.unpack_from('>H', payload, offset=offset)[0]
-                        offset += 2
-                        response += struct.pack('>H', did_id)
-                        did_handler = self._dids.get(did_id, None)
-                        if did_handler is None:
-                            response = struct.pack('>BBB', 0x7F, 0x22, 0x31)
-                            _LOGGER.error(f"Unable to handle DID {did_id:04X}/{did_id}")
-                            break
-                        else:
-                            response += did_handler.response()
-
-                    while self._stack.transmitting():
-                        self._stack.process()
-                        sleep(self._stack.sleep_time())
-                    self._stack.send(response)
+    def reset(self) -> None:
+        """Back to the initial DID values, before a seek."""
+        for did in self._dids.values():
+            did.reset()
+
+    def respond(self, request: bytearray) -> bytes:
+        """The response to a ReadDataByIdentifier request, None for other services."""
+        if len(request) == 0 or request[0] != 0x22:
+            return None
+        if len(request) == 3 and (did_handler := self._dids.get((request[1] << 8) | request[2], None)) is not None:
+            # a single DID is answered with the response the DID keeps packed
+            return did_handler.read_response()
+        records = [b'\x62']
+        for offset in range(1, len(request) - 1, 2):
+            did_id = (request[offset] << 8) | request[offset + 1]
+            did_handler = self._dids.get(did_id, None)
+            if did_handler is None:
+                _LOGGER.error(f"Unable to handle DID {did_id:04X}/{did_id}")
+                return struct.pack('>BBB', 0x7F, 0x22, 0x31)
+            records.append(did_handler.record())
+        return b''.join(records)
+
+    def address(self) -> isotp.Address:
+        return isotp.Address(isotp.AddressingMode.Normal_11bits, rxid=self._rxid, txid=self._txid)
 
     def process_event(self, event: dict) -> None:
         #_LOGGER.debug(f"Dequeued event {event} on queue {self._module_manager.module_name(event.get('arbitration_id'))}")
@@ -0,0 +1,69 @@
+import logging
+from bisect import bisect_right
+from threading import Event, Lock, Thread
+from typing import List, Tuple
+
+from record_stream import iter_records
+from exceptions import RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+class SnapshotIndex:
+    """
+        The 'playback_snapshots' thread reads the playback file once and keeps a snapshot every interval
+        seconds of playback time, the last event of each module and DID before that time.  A seek applies
+        the snapshot before the seek time and only replays the events after it.
+    """
+
+    def __init__(self, file: str, interval: float = 60.0) -> None:
+        self._file = file
+        self._interval = interval
+        self._lock = Lock()
+        self._exit = Event()
+        self._times = []
+        self._snapshots = []
+        self._complete = False
+        self._thread = None
+
+    def start(self) -> Thread:
+        self._exit.clear()
+        self._thread = Thread(target=self._index_task, name='playback_snapshots', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._exit.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+
+    def complete(self) -> bool:
+        return self._complete
+
+    def snapshot(self, seek_time: float) -> Tuple[float, List[dict]]:
+        """The time and events of the last snapshot at or before seek_time, (None, []) if there isn't one."""
+        with self._lock:
+            if (position := bisect_right(self._times, seek_time)) == 0:
+                return None, []
+            return self._times[position - 1], self._snapshots[position - 1]
+
+    def _index_task(self) -> None:
+        latest = {}
+        snapshot_time = None
+        try:
+            for event in iter_records(self._file):
+                if self._exit.is_set():
+                    return
+                event_time = event.get('time')
+                if snapshot_time is None or event_time - snapshot_time >= self._interval:
+                    # the snapshot holds the events before event_time, the playback resumes with this one
+                    snapshot_time = event_time
+                    with self._lock:
+                        self._times.append(snapshot_time)
+                        self._snapshots.append(list(latest.values()))
+                latest[(event.get('arbitration_id'), event.get('did_id'))] = event
+            self._complete = True
+            _LOGGER.info(f"Indexed {len(self._times)} playback snapshots of '{self._file}'")
+        except RuntimeError as e:
+            _LOGGER.error(f"Unable to index '{self._file}': {e}")
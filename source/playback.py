@@ -10,6 +10,7 @@ from did_manager import DIDManager
 from pb_module import PlaybackModule
 from pb_did import PlaybackDID
 from pb_engine import PlaybackEngine
+from pb_dispatcher import ChannelDispatcher
 
 import version
 import logfiles
@@ -31,18 +32,19 @@ class Playback:
         self._dids = self._did_manager.dids()
         self._modules = self._add_modules(self._module_manager.modules())
         self._add_dids(self._dids)
+        self._dispatchers = self._add_dispatchers()
         self._playback_engine = PlaybackEngine(config=config, active_modules=self._modules, module_manager=self._module_manager)
 
     def start(self) -> None:
-        for module in self._modules.values():
-            module.start()
+        for dispatcher in self._dispatchers:
+            dispatcher.start()
         playback_thread = self._playback_engine.start()
         playback_thread.join()
 
     def stop(self) -> None:
         self._playback_engine.stop()
-        for module in self._modules.values():
-            module.stop()
+        for dispatcher in self._dispatchers:
+            dispatcher.stop()
 
     def _add_modules(self, module_list: List[dict]) -> None:
         active_modules = {}
@@ -56,6 +58,13 @@ class Playback:
                 active_modules[module_name] = PlaybackModule(config=self._config, name=module_name, arbitration_id=arbitration_id, channel=channel, module_manager=self._module_manager)
         return active_modules
 
+    def _add_dispatchers(self) -> List[ChannelDispatcher]:
+        # one receive loop for all the modules on a channel
+        channel_modules = {}
+        for module in self._modules.values():
+            channel_modules.setdefault(module.channel(), []).append(module)
+        return [ChannelDispatcher(channel=channel, modules=modules) for channel, modules in channel_modules.items()]
+
     def _add_dids(self, dids: List[dict]) -> None:
         self._dids_by_id = {}
         for did_item in dids:
@@ -84,11 +93,12 @@ def _sigterm() -> None:
 
 def main() -> None:
     try:
-        yaml_file, log_file = parse_command_line(default_yaml='mme.yaml', default_log='playback.log')
+        yaml_file, log_file, _ = parse_command_line(default_yaml='mme.yaml', default_log='playback.log')
         logfiles.start(log_file)
         _LOGGER.info(f"Mustang Mach E Playback Utility version {version.get_version()} PID is {os.getpid()}")
 
         if config := parse_yaml_file(yaml_file=yaml_file):
+            logfiles.set_level(dict(config.mme.playback).get('log_level', 'debug'))
             SigTermCatcher(_sigterm)
             playback = Playback(config=config.mme)
             try:
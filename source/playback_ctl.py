@@ -0,0 +1,66 @@
+"""
+Sends a command to a running Playback through its control socket (the playback 'control_socket' option).
+
+    python3 playback_ctl.py [socket=/tmp/mme_playback.sock] status|pause|resume|rate=<multiplier or max>|seek=<seconds>
+
+'seek' is in seconds from the start of the playback file, '+seconds' and '-seconds' are relative to the
+playback time and '@timestamp' is an absolute time.
+"""
+
+import sys
+import socket
+
+from exceptions import FailedInitialization, RuntimeError
+
+
+def send_command(path: str, command: str) -> str:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as control:
+            control.settimeout(5.0)
+            control.connect(path)
+            control.sendall((command + '\n').encode())
+            reply = b''
+            while not reply.endswith(b'\n'):
+                if len(data := control.recv(1024)) == 0:
+                    break
+                reply += data
+            return reply.decode().strip()
+    except OSError as e:
+        raise RuntimeError(f"unable to reach playback on '{path}' ({e})")
+
+
+def main() -> None:
+    try:
+        path = '/tmp/mme_playback.sock'
+        command = None
+        for arg in sys.argv[1:]:
+            if arg.find('socket=') == 0:
+                path = arg[len('socket='):]
+            elif arg in ['status', 'pause', 'resume']:
+                command = arg
+            elif arg.find('rate=') == 0 or arg.find('seek=') == 0:
+                command = arg.replace('=', ' ', 1)
+            else:
+                raise FailedInitialization(f"Unsupported option '{arg}'")
+        if command is None:
+            raise FailedInitialization(f"A command is required")
+        reply = send_command(path, command)
+        print(reply)
+        if not reply.startswith('ok'):
+            sys.exit(1)
+
+    except KeyboardInterrupt:
+        print()
+    except RuntimeError as e:
+        print(f"Run time error: {e}")
+        sys.exit(1)
+    except FailedInitialization as e:
+        print(f"{e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    if sys.version_info[0] >= 3 and sys.version_info[1] >= 10:
+        main()
+    else:
+        print("python 3.10 or better required")
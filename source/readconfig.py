@@ -253,21 +253,42 @@ def check_config(config):
                     {'dest_file': {'required': True, 'keys': [], 'type': str}},
                     {'gps_server': {'required': False, 'keys': [], 'type': str}},
                     {'gps_server_timeout': {'required': False, 'keys': [], 'type': float}},
+                    {'gps_server_interval': {'required': False, 'keys': [], 'type': float}},
+                    {'gps_server_maximum_age': {'required': False, 'keys': [], 'type': float}},
                     {'file_writes': {'required': False, 'keys': [], 'type': int}},
+                    {'file_fsync_interval': {'required': False, 'keys': [], 'type': float}},
+                    {'file_rotate_size': {'required': False, 'keys': [], 'type': int}},
+                    {'file_rotate_interval': {'required': False, 'keys': [], 'type': float}},
+                    {'file_format': {'required': False, 'keys': [], 'type': str}},
+                    {'file_index_interval': {'required': False, 'keys': [], 'type': float}},
                     {'did_read': {'required': False, 'keys': [], 'type': int}},
+                    {'isotp_backend': {'required': False, 'keys': [], 'type': str}},
+                    {'breaker_timeouts': {'required': False, 'keys': [], 'type': int}},
+                    {'breaker_backoff': {'required': False, 'keys': [], 'type': float}},
+                    {'breaker_backoff_max': {'required': False, 'keys': [], 'type': float}},
+                    {'inflight_window': {'required': False, 'keys': [], 'type': int}},
+                    {'codec_plugins': {'required': False, 'keys': [], 'type': str}},
                     {'born_on': {'required': False, 'keys': [], 'type': int}},
                     {'request_timeout': {'required': False, 'keys': [], 'type': float}},
                     {'trip_minimum': {'required': False, 'keys': [], 'type': float}},
                     {'charge_minimum': {'required': False, 'keys': [], 'type': int}},
                     {'p2_timeout': {'required': False, 'keys': [], 'type': float}},
                     {'p2_star_timeout': {'required': False, 'keys': [], 'type': float}},
+                    {'log_level': {'required': False, 'keys': [], 'type': str}},
                 ]}},
                 {'playback': {'required': True, 'keys': [
                     {'speedup': {'required': False, 'keys': [], 'type': bool}},
                     {'source_path': {'required': True, 'keys': [], 'type': str}},
                     {'source_file': {'required': True, 'keys': [], 'type': str}},
+                    {'read_ahead': {'required': False, 'keys': [], 'type': int}},
+                    {'rate': {'required': False, 'keys': [], 'type': float}},
+                    {'control_socket': {'required': False, 'keys': [], 'type': str}},
+                    {'snapshot_interval': {'required': False, 'keys': [], 'type': float}},
+                    {'hold_at_end': {'required': False, 'keys': [], 'type': bool}},
                     {'rx_flowcontrol_timeout': {'required': False, 'keys': [], 'type': float}},
                     {'rx_consecutive_frame_timeout': {'required': False, 'keys': [], 'type': float}},
+                    {'codec_plugins': {'required': False, 'keys': [], 'type': str}},
+                    {'log_level': {'required': False, 'keys': [], 'type': str}},
                 ]}},
                 {'influxdb2': {'required': False, 'keys': [
                     {'enable': {'required': True, 'keys': [], 'type': bool}},
@@ -276,6 +297,8 @@ def check_config(config):
                     {'bucket': {'required': True, 'keys': [], 'type': str}},
                     {'token': {'required': True, 'keys': [], 'type': str}},
                     {'block_size': {'required': False, 'keys': [], 'type': int}},
+                    {'flush_interval': {'required': False, 'keys': [], 'type': float}},
+                    {'queue_size': {'required': False, 'keys': [], 'type': int}},
                 ]}},
                 {'geocodio': {'required': False, 'keys': [
                     {'enable': {'required': True, 'keys': [], 'type': bool}},
@@ -333,9 +356,10 @@ def parse_yaml_file(yaml_file: str = None) -> None:
         raise FailedInitialization(f"Configuration file error: unexpected exception: {error_message}")
 
 
-def parse_command_line(default_yaml: str, default_log: str) -> Tuple[str, str]:
+def parse_command_line(default_yaml: str, default_log: str, engines: List[str] = None) -> Tuple[str, str, str]:
     yaml_file = default_yaml
     log_file = default_log
+    engine = None if engines is None else engines[0]
     for index, arg in enumerate(sys.argv):
         if index == 0:
             continue
@@ -343,10 +367,13 @@ def parse_command_line(default_yaml: str, default_log: str) -> Tuple[str, str]:
             yaml_file = arg[len('yamlfile='):]
         elif arg.find('logfile=') == 0:
             log_file = arg[len('logfile='):]
+        elif arg.find('engine=') == 0 and engines is not None:
+            engine = arg[len('engine='):]
+            if engine not in engines:
+                raise FailedInitialization(f"Unsupported engine '{engine}', choose from {engines}")
         else:
             raise FailedInitialization(f"Unsupported option '{arg}'")
-    return yaml_file, log_file
-
+    return yaml_file, log_file, engine
 
 if __name__ == '__main__':
     if sys.version_info[0] >= 3 and sys.version_info[1] >= 8:
@@ -16,6 +16,7 @@ from did_manager import DIDManager
 from record_modmgr import RecordModuleManager
 from record_canmgr import RecordCanbusManager
 from record_statemgr import RecordStateManager
+from record_engine import RecordAsyncEngine
 
 from exceptions import SigTermCatcher, FailedInitialization, RuntimeError, TerminateSignal
 
@@ -24,7 +25,7 @@ _LOGGER = logging.getLogger('mme')
 
 
 class Record:
-    def __init__(self, config: Configuration) -> None:
+    def __init__(self, config: Configuration, engine: str = 'threads') -> None:
         self._request_queue = Queue(maxsize=10)
         self._response_queue = Queue(maxsize=10)
         self._module_manager = RecordModuleManager(config=config)
@@ -32,9 +33,15 @@ class Record:
         initialize_geocodio(config)
         self._canbus_manager = RecordCanbusManager(config=config, request_queue=self._request_queue, response_queue=self._response_queue, module_manager=self._module_manager)
         self._state_manager = RecordStateManager(config=config, request_queue=self._request_queue, response_queue=self._response_queue)
+        self._async_engine = RecordAsyncEngine(canbus_manager=self._canbus_manager, state_manager=self._state_manager) if engine == 'asyncio' else None
 
     def start(self) -> None:
-        self._module_manager.start()
+        self._module_manager.start(data_identifiers=self._state_manager.module_data_identifiers())
+        if self._async_engine:
+            self._state_manager.start(threaded=False)
+            self._async_engine.run()
+            return
+
         threads = []
         threads.append(self._state_manager.start())
         threads.append(self._canbus_manager.start())
@@ -43,6 +50,8 @@ class Record:
                 thread.join()
 
     def stop(self) -> None:
+        if self._async_engine:
+            self._async_engine.stop()
         self._canbus_manager.stop()
         self._state_manager.stop()
         self._module_manager.stop()
@@ -64,13 +73,14 @@ def _sigterm() -> None:
 
 def main() -> None:
     try:
-        yaml_file, log_file = parse_command_line(default_yaml='mme.yaml', default_log='record.log')
+        yaml_file, log_file, engine = parse_command_line(default_yaml='mme.yaml', default_log='record.log', engines=['threads', 'asyncio'])
         logfiles.start(log_file)
         _LOGGER.info(f"Mustang Mach E Record Utility version {version.get_version()}, PID is {os.getpid()}")
 
         if config := parse_yaml_file(yaml_file=yaml_file):
+            logfiles.set_level(dict(config.mme.record).get('log_level', 'debug'))
             SigTermCatcher(_sigterm)
-            record = Record(config=config.mme)
+            record = Record(config=config.mme, engine=engine)
             try:
                 record.start()
             except KeyboardInterrupt:
@@ -0,0 +1,128 @@
+"""
+Binary container format for the Record output files ('.rec')
+
+    header      8 bytes, b'MMEREC\\x00\\x01'
+    record      '<dIHH' time (seconds), arbitration id, DID and payload length, followed by the payload bytes
+    ...
+    index       '<dQ' time and file offset of a record, one entry every index_interval seconds
+    ...
+    trailer     '<QI8s' file offset of the index, number of index entries and b'MMEINDEX'
+
+The index and trailer are written when the file is closed, a file cut short by a crash has neither
+and is read up to the last complete record.
+"""
+
+import mmap
+import struct
+from bisect import bisect_right
+from typing import Iterator, List, Tuple
+
+from exceptions import RuntimeError
+
+
+EXTENSION = '.rec'
+
+_MAGIC = b'MMEREC\x00\x01'
+_INDEX_MAGIC = b'MMEINDEX'
+_RECORD = struct.Struct('<dIHH')
+_INDEX_ENTRY = struct.Struct('<dQ')
+_TRAILER = struct.Struct('<QI8s')
+
+
+class BinaryRecordEncoder:
+    """
+        Encodes records for RecordWriter, the caller passes the file offset of every record so the
+        encoder can keep the time index that footer() writes.
+    """
+
+    def __init__(self, index_interval: float = 60.0) -> None:
+        self._index_interval = index_interval
+        self._index = []
+        self._index_time = None
+
+    def header(self) -> bytes:
+        self._index = []
+        self._index_time = None
+        return _MAGIC
+
+    def encode(self, record: dict, offset: int) -> bytes:
+        record_time = record.get('time')
+        payload = record.get('payload')
+        try:
+            payload = bytes(payload)
+            encoded = _RECORD.pack(record_time, record.get('arbitration_id'), record.get('did_id'), len(payload)) + payload
+        except struct.error as e:
+            raise ValueError(f"{e}")
+        if self._index_time is None or record_time - self._index_time >= self._index_interval:
+            self._index.append((record_time, offset))
+            self._index_time = record_time
+        return encoded
+
+    def footer(self, offset: int) -> bytes:
+        return b''.join([_INDEX_ENTRY.pack(*entry) for entry in self._index]) + _TRAILER.pack(offset, len(self._index), _INDEX_MAGIC)
+
+
+class BinaryRecordReader:
+    """
+        Reads a '.rec' file through a read only memory map, records are unpacked as they are iterated
+        and the payload is the raw bytes.  records(start_time) uses the index to skip to a time.
+    """
+
+    def __init__(self, file: str) -> None:
+        self._file = file
+        try:
+            with open(file, 'rb') as infile:
+                self._mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError as e:
+            raise RuntimeError(f"unable to open file '{file}' ({e.strerror})")
+        except ValueError:
+            raise RuntimeError(f"'{file}' is not a record file")
+        if self._mmap[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise RuntimeError(f"'{file}' is not a record file")
+        self._end, self._index = self._read_index()
+
+    def __enter__(self) -> 'BinaryRecordReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.records()
+
+    def close(self) -> None:
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+
+    def indexed(self) -> bool:
+        return self._end < len(self._mmap)
+
+    def index(self) -> List[Tuple[float, int]]:
+        return self._index
+
+    def records(self, start_time: float = None) -> Iterator[dict]:
+        data = self._mmap
+        end = self._end
+        offset = len(_MAGIC)
+        if start_time is not None and (position := bisect_right(self._index, (start_time, end))) > 0:
+            offset = self._index[position - 1][1]
+        unpack_from = _RECORD.unpack_from
+        header_size = _RECORD.size
+        while offset + header_size <= end:
+            record_time, arbitration_id, did_id, length = unpack_from(data, offset)
+            offset += header_size
+            if offset + length > end:
+                break
+            if start_time is None or record_time >= start_time:
+                yield {'time': record_time, 'arbitration_id': arbitration_id, 'did_id': did_id, 'payload': data[offset:offset + length]}
+            offset += length
+
+    def _read_index(self) -> Tuple[int, List[Tuple[float, int]]]:
+        size = len(self._mmap)
+        if size >= len(_MAGIC) + _TRAILER.size:
+            index_offset, count, magic = _TRAILER.unpack_from(self._mmap, size - _TRAILER.size)
+            if magic == _INDEX_MAGIC and index_offset + count * _INDEX_ENTRY.size == size - _TRAILER.size:
+                return index_offset, list(_INDEX_ENTRY.iter_unpack(self._mmap[index_offset:size - _TRAILER.size]))
+        return size, []
@@ -1,17 +1,19 @@
 import logging
+from time import time
 from typing import List
 
 from  threading import Thread
 from queue import Empty, Full, Queue
 
-import udsoncan.configs
-from udsoncan.client import Client
 from udsoncan import Response
 from udsoncan.exceptions import *
 
 from record_modmgr import RecordModuleManager
 from config.configuration import Configuration
 
+from vehicle_state import ModuleHealth
+from state_engine import set_module_health
+
 
 _LOGGER = logging.getLogger('mme')
 
@@ -24,77 +26,101 @@ class RecordCanbusManager:
         self.request_queue = request_queue
         self.response_queue = response_queue
         self._exit_requested = False
-        self._did_read = config_record.get('did_read', 1)
-        self._iso_tp_config = dict(udsoncan.configs.default_client_config)
-        self._iso_tp_config['request_timeout'] = config_record.get('request_timeout', 1.0)
-        self._iso_tp_config['p2_timeout'] = config_record.get('p2_timeout', 1.0)
-        self._iso_tp_config['p2_star_timeout'] = config_record.get('p2_star_timeout', 1.0)
-        self._iso_tp_config['logger_name'] = 'mme'
+        self._did_read = config_record.get('did_read', 0)
+        self._breaker_timeouts = config_record.get('breaker_timeouts', 3)
+        self._breaker_backoff = config_record.get('breaker_backoff', 5.0)
+        self._breaker_backoff_max = config_record.get('breaker_backoff_max', 300.0)
+        self._module_breakers = {}
+        self._channels = sorted(set([module.get('channel') for module in self._module_manager.modules()]))
+        self._channel_queues = {}
+        self._channel_threads = []
+        self._pending_jobs = Queue()
+        self._thread = None
+        self._collector_thread = None
 
     def start(self) -> List[Thread]:
         self._exit_requested = False
+        self._channel_queues = {}
+        self._channel_threads = []
+        for channel in self._channels:
+            channel_queue = Queue()
+            self._channel_queues[channel] = channel_queue
+            self._channel_threads.append(Thread(target=self._channel_task, args=(channel, channel_queue), name=f"canbus_{channel}"))
+        self._pending_jobs = Queue()
         self._thread = Thread(target=self._canbus_task, name='canbus_manager')
+        self._collector_thread = Thread(target=self._collector_task, name='canbus_collector')
+        for thread in self._channel_threads:
+            thread.start()
+        self._collector_thread.start()
         self._thread.start()
-        return [self._thread]
+        return [self._thread, self._collector_thread] + self._channel_threads
 
     def stop(self) -> None:
         self._exit_requested = True
-        if self._thread.is_alive():
+        if self._thread and self._thread.is_alive():
             self._thread.join()
+        if self._collector_thread and self._collector_thread.is_alive():
+            self._collector_thread.join()
+        for thread in self._channel_threads:
+            if thread.is_alive():
+                thread.join()
 
     def _canbus_task(self) -> None:
+        # Steps done in _canbus_task:
+        #   - get a job from the request queue
+        #   - split the job by the CAN bus channel each module sits on
+        #   - hand the job to the collector without waiting for the channels to finish
+        try:
+            while self._exit_requested == False:
+                try:
+                    job = self.request_queue.get(block=True, timeout=0.5)
+                except Empty:
+                    continue
+
+                channel_jobs = {}
+                for index, module in enumerate(job):
+                    channel_jobs.setdefault(self.module_channel(module), []).append((index, module))
+
+                channel_responses = Queue()
+                for channel, modules in channel_jobs.items():
+                    if channel_queue := self._channel_queues.get(channel, None):
+                        channel_queue.put((modules, channel_responses))
+                    else:
+                        # no worker for this channel, modules without a connection respond immediately
+                        channel_responses.put([(index, self.read_module(module)) for index, module in modules])
+                self._pending_jobs.put((len(channel_jobs), channel_responses))
+
+        except RuntimeError as e:
+            _LOGGER.error(f"Run time error: {e}")
+            return
+
+    def _collector_task(self) -> None:
+        # Steps done in _collector_task:
+        #   - take the jobs in the order they were dispatched
+        #   - merge the channel responses back in job order
+        #   - put the job responses on the response queue
+        #
+        # each module is read by a single channel worker so the responses for a module stay in order
         try:
             while self._exit_requested == False:
                 try:
-                    job = self.request_queue.get(block=True, timeout=None)
+                    channel_count, channel_responses = self._pending_jobs.get(block=True, timeout=0.5)
                 except Empty:
-                    _LOGGER.error(f"timeout on the request queue")
                     continue
 
+                indexed_responses = []
+                while channel_count > 0:
+                    try:
+                        indexed_responses += channel_responses.get(block=True, timeout=0.5)
+                        channel_count -= 1
+                    except Empty:
+                        if self._exit_requested == True:
+                            return
+                indexed_responses.sort(key=lambda indexed_response: indexed_response[0])
                 responses = []
-                for module in job:
-                    module_name = module.get('module')
-                    txid = module.get('arbitration_id')
-
-                    did_list = []
-                    data_identifiers = {}
-                    for did_dict in module.get('dids'):
-                        did_id = did_dict.get('did_id')
-                        did_list.append(did_id)
-                        data_identifiers[did_id] = did_dict.get('codec')
-                    if len(did_list) == 0:
-                        continue
-                    self._iso_tp_config['data_identifiers'] = data_identifiers
-
-                    connection = self._module_manager.connection(module_name)
-                    if connection is None:
-                        no_connection = Response(service=None, code=0x10, data=None)
-                        no_connection.valid = False
-                        no_connection.invalid_reason = "module has no connection"
-                        responses.append({'arbitration_id': txid, 'arbitration_id_hex': f"{txid:04X}", 'did_list': did_list, 'response': no_connection})
-                        continue
-
-                    with Client(connection, config=self._iso_tp_config) as client:
-                        while len(did_list) > 0:
-                            next_read = did_list[0:self._did_read]
-                            del did_list[0:self._did_read]
-                            try:
-                                response = client.read_data_by_identifier(next_read)
-                                responses.append({'arbitration_id': txid, 'arbitration_id_hex': f"{txid:04X}", 'response': response})
-                            except ValueError as e:
-                                _LOGGER.error(f"{txid:04X}: {e}")
-                            except ConfigError as e:
-                                _LOGGER.error(f"{txid:04X}: {e}")
-                            except TimeoutException as e:
-                                #_LOGGER.error(f"{txid:04X}: {e}")
-                                timeout = Response(service=None, code=0x10, data=None)
-                                timeout.valid = False
-                                timeout.invalid_reason = "request timed out"
-                                responses.append({'arbitration_id': txid, 'arbitration_id_hex': f"{txid:04X}", 'did_list': next_read, 'response': timeout})
-                            except (NegativeResponseException, UnexpectedResponseException, InvalidResponseException) as e:
-                                _LOGGER.error(f"{txid:04X}: {e}")
-                            except Exception as e:
-                                _LOGGER.exception(f"Unexpected exception: {e}")
+                for _, module_responses in indexed_responses:
+                    responses += module_responses
+
                 try:
                     self.response_queue.put(responses)
                 except Full:
@@ -104,3 +130,129 @@ class RecordCanbusManager:
         except RuntimeError as e:
             _LOGGER.error(f"Run time error: {e}")
             return
+
+    def _channel_task(self, channel: str, channel_queue: Queue) -> None:
+        try:
+            while self._exit_requested == False:
+                try:
+                    modules, channel_responses = channel_queue.get(block=True, timeout=0.5)
+                except Empty:
+                    continue
+
+                indexed_responses = []
+                for index, module in modules:
+                    indexed_responses.append((index, self.read_module(module)))
+                channel_responses.put(indexed_responses)
+
+        except RuntimeError as e:
+            _LOGGER.error(f"Run time error on {channel}: {e}")
+            return
+
+    def channels(self) -> List[str]:
+        return self._channels
+
+    def module_channel(self, module: dict) -> str:
+        module_record = self._module_manager.module(module.get('module'))
+        return None if module_record is None else module_record.get('channel')
+
+    def read_module(self, module: dict) -> List[dict]:
+        responses = []
+        module_name = module.get('module')
+        txid = module.get('arbitration_id')
+
+        did_list = []
+        data_identifiers = {}
+        for did_dict in module.get('dids'):
+            did_id = did_dict.get('did_id')
+            did_list.append(did_id)
+            data_identifiers[did_id] = did_dict.get('codec')
+        if len(did_list) == 0:
+            return responses
+
+        if not self._module_available(module_name):
+            responses.append(self._timeout_response(txid, did_list))
+            return responses
+
+        client = self._module_manager.client(module_name, data_identifiers)
+        if client is None:
+            no_connection = Response(service=None, code=0x10, data=None)
+            no_connection.valid = False
+            no_connection.invalid_reason = "module has no connection"
+            responses.append({'arbitration_id': txid, 'arbitration_id_hex': f"{txid:04X}", 'did_list': did_list, 'response': no_connection})
+            return responses
+
+        did_read = self._did_read if self._did_read > 0 else self._module_manager.did_limit(module_name)
+        while len(did_list) > 0:
+            next_read = did_list[0:did_read]
+            del did_list[0:did_read]
+            if not self._module_available(module_name):
+                # the module went to sleep during this command set, don't wait on the rest of the DIDs
+                responses.append(self._timeout_response(txid, next_read))
+                continue
+            try:
+                response = client.read_data_by_identifier(next_read)
+                responses.append({'arbitration_id': txid, 'arbitration_id_hex': f"{txid:04X}", 'response': response})
+                self._module_responded(module_name)
+            except ValueError as e:
+                _LOGGER.error(f"{txid:04X}: {e}")
+            except ConfigError as e:
+                _LOGGER.error(f"{txid:04X}: {e}")
+            except TimeoutException as e:
+                #_LOGGER.error(f"{txid:04X}: {e}")
+                responses.append(self._timeout_response(txid, next_read))
+                self._module_timed_out(module_name)
+            except (NegativeResponseException, UnexpectedResponseException, InvalidResponseException) as e:
+                _LOGGER.error(f"{txid:04X}: {e}")
+                self._module_responded(module_name)
+            except Exception as e:
+                _LOGGER.exception(f"Unexpected exception: {e}")
+        return responses
+
+    def _timeout_response(self, txid: int, did_list: List[int]) -> dict:
+        timeout = Response(service=None, code=0x10, data=None)
+        timeout.valid = False
+        timeout.invalid_reason = "request timed out"
+        return {'arbitration_id': txid, 'arbitration_id_hex': f"{txid:04X}", 'did_list': did_list, 'response': timeout}
+
+    def _module_breaker(self, module_name: str) -> dict:
+        if (breaker := self._module_breakers.get(module_name, None)) is None:
+            breaker = {'health': ModuleHealth.Responding, 'timeouts': 0, 'backoff': self._breaker_backoff, 'retry_at': 0}
+            self._module_breakers[module_name] = breaker
+        return breaker
+
+    def _set_module_health(self, module_name: str, breaker: dict, health: ModuleHealth) -> None:
+        if breaker['health'] != health:
+            if health == ModuleHealth.Sleeping:
+                _LOGGER.info(f"Module '{module_name}' changed from '{breaker['health'].name}' to '{health.name}' after {breaker['timeouts']} timeouts, retrying in {breaker['backoff']:.1f} seconds")
+            else:
+                _LOGGER.info(f"Module '{module_name}' changed from '{breaker['health'].name}' to '{health.name}'")
+            breaker['health'] = health
+            set_module_health(self._module_manager.module(module_name).get('arbitration_id'), health)
+
+    def _module_available(self, module_name: str) -> bool:
+        # Sleeping modules are skipped until the backoff expires, then a single request probes the module
+        breaker = self._module_breaker(module_name)
+        if breaker['health'] == ModuleHealth.Sleeping:
+            if time() < breaker['retry_at']:
+                return False
+            self._set_module_health(module_name, breaker, ModuleHealth.Probing)
+        return True
+
+    def _module_responded(self, module_name: str) -> None:
+        breaker = self._module_breaker(module_name)
+        breaker['timeouts'] = 0
+        breaker['backoff'] = self._breaker_backoff
+        self._set_module_health(module_name, breaker, ModuleHealth.Responding)
+
+    def _module_timed_out(self, module_name: str) -> None:
+        breaker = self._module_breaker(module_name)
+        breaker['timeouts'] += 1
+        if breaker['health'] == ModuleHealth.Probing:
+            breaker['backoff'] = min(breaker['backoff'] * 2, self._breaker_backoff_max)
+        elif breaker['timeouts'] < self._breaker_timeouts or self._breaker_timeouts == 0:
+            return
+        breaker['retry_at'] = time() + breaker['backoff']
+        self._set_module_health(module_name, breaker, ModuleHealth.Sleeping)
+
+    def module_health(self, module_name: str) -> ModuleHealth:
+        return self._module_breaker(module_name).get('health')
@@ -0,0 +1,139 @@
+import logging
+import asyncio
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+
+from typing import List
+
+from record_canmgr import RecordCanbusManager
+from record_statemgr import RecordStateManager
+from command_scheduler import coalesce_command_sets, split_responses
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+class RecordAsyncEngine:
+    """
+        Runs the Record pipeline as coroutines on a single event loop:
+            - the scheduler fires each command set when it is due
+            - each command set runs its ISO-TP transactions without waiting for the previous one,
+              up to the in-flight window of command sets at a time
+            - the responses are processed in the order the command sets were dispatched, a job that finishes
+              early waits for the jobs before it so the responses of a module are never processed out of order
+
+        udsoncan transactions are blocking so each CAN bus channel gets a one thread executor,
+        this keeps a single transaction at a time on each bus and the event loop never blocks on a read.
+    """
+    def __init__(self, canbus_manager: RecordCanbusManager, state_manager: RecordStateManager) -> None:
+        self._canbus_manager = canbus_manager
+        self._state_manager = state_manager
+        self._exit_requested = False
+        self._executors = {}
+        self._responses = None
+        self._wakeup = None
+        self._window = None
+        self._jobs = set()
+        self._loop = None
+
+    def run(self) -> None:
+        self._exit_requested = False
+        asyncio.run(self._main())
+
+    def stop(self) -> None:
+        self._exit_requested = True
+        if self._loop is not None:
+            # the scheduler may be waiting without a deadline
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass
+        for executor in self._executors.values():
+            executor.shutdown(wait=True)
+        self._executors = {}
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._responses = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._window = asyncio.Semaphore(self._state_manager.inflight_window())
+        for channel in self._canbus_manager.channels():
+            self._executors[channel] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"canbus_{channel}")
+        _LOGGER.info(f"Started the asyncio record engine on channels {list(self._executors.keys())}")
+        try:
+            await asyncio.gather(self._scheduler_task(), self._response_task())
+        finally:
+            self._loop = None
+
+    async def _scheduler_task(self) -> None:
+        # Steps done in _scheduler_task:
+        #   - wait for a free slot in the in-flight window
+        #   - start the command sets that are due as one job, the job frees the slot
+        #   - sleep until the next deadline or the state changes
+        scheduler = self._state_manager.command_scheduler()
+        while self._exit_requested == False:
+            try:
+                await asyncio.wait_for(self._window.acquire(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            if len(command_sets := scheduler.due()):
+                for _ in command_sets:
+                    self._state_manager.command_set_dispatched()
+                job = asyncio.create_task(self._job_task(command_sets))
+                # the event loop only keeps a weak reference to the tasks
+                self._jobs.add(job)
+                job.add_done_callback(self._jobs.discard)
+                await self._responses.put((command_sets, job))
+            else:
+                self._window.release()
+
+            next_deadline = scheduler.next_deadline()
+            await self._wait(timeout=None if next_deadline is None else max(next_deadline - time(), 0.0))
+
+    async def _job_task(self, command_sets: List[dict]) -> List[List[dict]]:
+        # modules in the command sets are read once and the responses split back to each command set
+        try:
+            loop = asyncio.get_running_loop()
+            reads = []
+            for module in coalesce_command_sets(command_sets):
+                executor = self._executors.get(self._canbus_manager.module_channel(module), None)
+                reads.append(loop.run_in_executor(executor, self._canbus_manager.read_module, module))
+            responses = []
+            for module_responses in await asyncio.gather(*reads, return_exceptions=True):
+                if isinstance(module_responses, Exception):
+                    _LOGGER.error(f"Unexpected exception reading a module: {module_responses}")
+                    continue
+                responses += module_responses
+            return split_responses(command_sets, responses)
+        except Exception as e:
+            _LOGGER.exception(f"Unexpected exception in a command set job: {e}")
+            return []
+        finally:
+            self._window.release()
+
+    async def _response_task(self) -> None:
+        # Steps done in _response_task:
+        #   - take the jobs in the order they were dispatched and wait for the oldest one
+        #   - process the responses of each command set and update the vehicle state
+        #   - wake the scheduler if the state changed
+        while self._exit_requested == False:
+            try:
+                command_sets, job = await asyncio.wait_for(self._responses.get(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+
+            job_responses = await job
+            current_state = self._state_manager.current_state()
+            for _ in command_sets:
+                self._state_manager.command_set_completed()
+            for responses in job_responses:
+                self._state_manager.process_responses(responses)
+            if current_state != self._state_manager.current_state():
+                self._wakeup.set()
+
+    async def _wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
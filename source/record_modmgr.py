@@ -1,13 +1,23 @@
 import logging
-from typing import List
+import os
+import json
+from threading import Lock
+from time import time
+from typing import List, Tuple
 
 import isotp
-from udsoncan.connections import PythonIsoTpConnection
+import udsoncan.configs
+from udsoncan.client import Client
+from udsoncan.connections import BaseConnection, PythonIsoTpConnection, IsoTPSocketConnection
+from udsoncan import Response
+from udsoncan.exceptions import NegativeResponseException, UnexpectedResponseException, InvalidResponseException, TimeoutException
 from can.interfaces.socketcan import SocketcanBus
 
 from module_manager import ModuleManager
 from config.configuration import Configuration
 
+from exceptions import FailedInitialization
+
 
 _LOGGER = logging.getLogger('mme')
 
@@ -23,22 +33,47 @@ class RecordModuleManager(ModuleManager):
         'tx_padding' : 0x00,                       # Will pad all transmitted CAN messages with byte 0x00.
         'rx_flowcontrol_timeout' : 2000,           # Triggers a timeout if a flow control is awaited for more than 1000 milliseconds
         'rx_consecutive_frame_timeout' : 2000,     # Triggers a timeout if a consecutive frame is awaited for more than 1000 milliseconds
-        'squash_stmin_requirement' : False,        # When sending, respect the stmin requirement of the receiver. If set to True, go as fast as possible.
+        'override_receiver_stmin' : None,          # When sending, respect the stmin requirement of the receiver (can-isotp 2.x, was squash_stmin_requirement)
         'max_frame_size' : 4095                    # Limit the size of receive frame.
     }
 
+    _did_limits_file = 'cached/did_limits.json'
+    _did_limits_retry = 300
+
     def __init__(self, config: Configuration) -> None:
         super().__init__()
-        self._bus0 = None
-        self._bus1 = None
+        self._buses = []
         self._channel = None
-        config_record = config.record
+        config_record = dict(config.record)
         RecordModuleManager.isotp_params['rx_flowcontrol_timeout'] = int(config_record.get('rx_flowcontrol_timeout', 1.0) * 1000)
         RecordModuleManager.isotp_params['rx_consecutive_frame_timeout'] = int(config_record.get('rx_consecutive_frame_timeout', 1.0) * 1000)
+        self._client_config = dict(udsoncan.configs.default_client_config)
+        self._client_config['request_timeout'] = config_record.get('request_timeout', 1.0)
+        self._client_config['p2_timeout'] = config_record.get('p2_timeout', 1.0)
+        self._client_config['p2_star_timeout'] = config_record.get('p2_star_timeout', 1.0)
+        self._client_config['logger_name'] = 'mme'
+        self._isotp_connections = {}
+        self._data_identifiers = {}
+        self._clients = {}
+        self._clients_lock = Lock()
+        self._client_hits = 0
+        self._client_misses = 0
+        self._client_errors = {}
+        self._did_read = config_record.get('did_read', 0)
+        self._did_limits = {}
+        self._did_limits_failed = {}
+        self._did_limits_lock = Lock()
+        self._isotp_backend = config_record.get('isotp_backend', 'kernel')
+        if self._isotp_backend not in ['kernel', 'python']:
+            raise FailedInitialization(f"Unsupported ISO-TP backend '{self._isotp_backend}', choose from ['kernel', 'python']")
+        if self._isotp_backend == 'kernel' and not kernel_isotp_supported():
+            _LOGGER.warning(f"Kernel ISO-TP sockets (CAN_ISOTP) are not available, using the Python ISO-TP stack")
+            self._isotp_backend = 'python'
+        _LOGGER.info(f"Using the {self._isotp_backend} ISO-TP backend")
 
-    def start(self) -> None:
-        self._bus0 = SocketcanBus(channel='can0')
-        self._bus1 = SocketcanBus(channel='can1')
+    def start(self, data_identifiers: dict = None) -> None:
+        # data_identifiers is the union of the DID codecs used by each module in all the state files
+        self._data_identifiers = {} if data_identifiers is None else data_identifiers
         self._isotp_connections = {}
         for module in self._modules:
             module_name = module.get('name')
@@ -46,18 +81,45 @@ class RecordModuleManager(ModuleManager):
             arbitration_id = module.get('arbitration_id')
             enable = module.get('enable')
             if enable:
-                tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=arbitration_id, rxid=arbitration_id + 0x8)
-                bus = self._bus0 if channel == 'can0' else self._bus1
-                stack = isotp.CanStack(bus=bus, address=tp_addr, params=RecordModuleManager.isotp_params)
-                self._isotp_connections[module_name] = PythonIsoTpConnection(stack)
+                self._isotp_connections[module_name] = self.create_connection(channel, arbitration_id)
+
+        if self._did_read == 0:
+            self._did_limits = self._load_did_limits()
+            for module_name in self._isotp_connections.keys():
+                if len(self._data_identifiers.get(module_name, {})) > 0:
+                    self.did_limit(module_name)
+
+    def create_connection(self, channel: str, arbitration_id: int) -> BaseConnection:
+        tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=arbitration_id, rxid=arbitration_id + 0x8)
+        if self._isotp_backend == 'kernel':
+            # segmentation, flow control and stmin timing are done in the kernel
+            tpsock = isotp.socket(timeout=0.1)
+            tpsock.set_opts(txpad=RecordModuleManager.isotp_params['tx_padding'])
+            tpsock.set_fc_opts(bs=RecordModuleManager.isotp_params['blocksize'], stmin=RecordModuleManager.isotp_params['stmin'], wftmax=RecordModuleManager.isotp_params['wftmax'])
+            tpsock.set_ll_opts(mtu=isotp.socket.LinkLayerProtocol.CAN, tx_dl=RecordModuleManager.isotp_params['tx_data_length'])
+            return IsoTPSocketConnection(channel, tp_addr, tpsock=tpsock)
+
+        # each module gets a filtered socket so the long-lived connections don't steal each other's frames
+        bus = SocketcanBus(channel=channel, can_filters=[{'can_id': arbitration_id + 0x8, 'can_mask': 0x7FF}])
+        self._buses.append(bus)
+        stack = isotp.CanStack(bus=bus, address=tp_addr, params=RecordModuleManager.isotp_params)
+        return PythonIsoTpConnection(stack)
+
+    def isotp_backend(self) -> str:
+        return self._isotp_backend
 
     def stop(self) -> None:
-        if self._bus0:
-            self._bus0.shutdown()
-            self._bus0 = None
-        if self._bus1:
-            self._bus1.shutdown()
-            self._bus1 = None
+        with self._clients_lock:
+            for module_name, client in self._clients.items():
+                try:
+                    client.close()
+                except Exception as e:
+                    _LOGGER.error(f"Error closing the client for module '{module_name}': {e}")
+            self._clients = {}
+        _LOGGER.info(f"Client pool: {self._client_hits} hits, {self._client_misses} misses")
+        for bus in self._buses:
+            bus.shutdown()
+        self._buses = []
 
     def name(self) -> str:
         return self._name
@@ -68,8 +130,133 @@ class RecordModuleManager(ModuleManager):
     def arbitration_id(self) -> int:
         return self._rxid
 
-    def connection(self, name: str) -> PythonIsoTpConnection:
+    def connection(self, name: str) -> BaseConnection:
         return self._isotp_connections.get(name, None)
 
+    def client(self, name: str, data_identifiers: dict) -> Client:
+        """Return the long-lived client for a module, re-keying it if it lacks any of the requested DID codecs."""
+        with self._clients_lock:
+            if client := self._clients.get(name, None):
+                client_data_identifiers = client.config['data_identifiers']
+                missing = [did_id for did_id in data_identifiers.keys() if did_id not in client_data_identifiers]
+                if len(missing) == 0:
+                    self._client_hits += 1
+                    return client
+                self._client_misses += 1
+                _LOGGER.debug(f"Adding DIDs {[f'{did_id:04X}' for did_id in missing]} to the client for module '{name}'")
+                client_data_identifiers.update(data_identifiers)
+                return client
+
+            connection = self._isotp_connections.get(name, None)
+            if connection is None:
+                return None
+            self._client_misses += 1
+            client_config = dict(self._client_config)
+            client_config['data_identifiers'] = dict(self._data_identifiers.get(name, {}))
+            client_config['data_identifiers'].update(data_identifiers)
+            client = Client(connection, config=client_config)
+            try:
+                client.open()
+            except OSError as e:
+                # a kernel ISO-TP socket can't bind to a missing or down CAN interface, retried on the next read
+                if self._client_errors.get(name, None) != str(e):
+                    _LOGGER.error(f"Module '{name}' has no connection: {e}")
+                    self._client_errors[name] = str(e)
+                return None
+            self._client_errors.pop(name, None)
+            self._clients[name] = client
+            return client
+
+    def did_limit(self, name: str) -> int:
+        """Return the most DIDs the module accepts in a single ReadDID request, probing the module if it is unknown."""
+        if self._did_read > 0:
+            return self._did_read
+        if (did_limit := self._did_limits.get(name, None)) is not None:
+            return did_limit
+        if time() - self._did_limits_failed.get(name, 0) < RecordModuleManager._did_limits_retry:
+            return 1
+
+        did_list = sorted(self._data_identifiers.get(name, {}).keys())
+        if (client := self.client(name, {})) is None or len(did_list) == 0:
+            return 1
+        did_limit = self._probe_did_limit(name, client, did_list)
+        if did_limit is None:
+            self._did_limits_failed[name] = time()
+            return 1
+
+        _LOGGER.info(f"Module '{name}' accepts up to {did_limit} DIDs per request")
+        with self._did_limits_lock:
+            self._did_limits[name] = did_limit
+            self._save_did_limits(self._did_limits)
+        return did_limit
+
+    def _probe_did_limit(self, name: str, client: Client, did_list: List[int]) -> int:
+        # doubles the DID count until the module rejects the request, then bisects between the last good and bad counts
+        def accepts(count: int) -> bool:
+            try:
+                client.read_data_by_identifier(did_list[0:count])
+                return True
+            except NegativeResponseException as e:
+                if e.response.code in [Response.Code.IncorrectMessageLengthOrInvalidFormat, Response.Code.RequestOutOfRange]:
+                    return False
+                raise
+            except (UnexpectedResponseException, InvalidResponseException):
+                return False
+
+        try:
+            if not accepts(1):
+                return None
+            good, bad = 1, None
+            while bad is None and good < len(did_list):
+                count = min(good * 2, len(did_list))
+                if accepts(count):
+                    good = count
+                else:
+                    bad = count
+            while bad is not None and bad - good > 1:
+                count = (good + bad) // 2
+                if accepts(count):
+                    good = count
+                else:
+                    bad = count
+            return good
+        except TimeoutException:
+            _LOGGER.debug(f"Module '{name}' did not respond to the DID limit probe")
+        except Exception as e:
+            _LOGGER.error(f"Unable to probe the DID limit for module '{name}': {e}")
+        return None
+
+    def _load_did_limits(self) -> dict:
+        if not os.path.exists(RecordModuleManager._did_limits_file):
+            return {}
+        with open(RecordModuleManager._did_limits_file) as infile:
+            try:
+                did_limits = json.load(infile)
+            except json.JSONDecodeError as e:
+                _LOGGER.error(f"JSON error in '{RecordModuleManager._did_limits_file}' at line {e.lineno}, probing all modules")
+                return {}
+        return did_limits
+
+    def _save_did_limits(self, did_limits: dict) -> None:
+        path = os.path.dirname(RecordModuleManager._did_limits_file)
+        if not os.path.exists(path):
+            os.mkdir(path)
+        json_did_limits = json.dumps(did_limits, indent = 4, sort_keys=True)
+        with open(RecordModuleManager._did_limits_file, "w") as outfile:
+            outfile.write(json_did_limits)
+
+    def client_pool_stats(self) -> Tuple[int, int]:
+        return self._client_hits, self._client_misses
+
     def modules(self) -> List[dict]:
         return self._modules
+
+
+def kernel_isotp_supported() -> bool:
+    # the can-isotp module only checks for the CAN_ISOTP constant, creating a socket checks the kernel module is loaded
+    try:
+        tpsock = isotp.socket()
+        tpsock.close()
+        return True
+    except Exception:
+        return False
@@ -1,17 +1,18 @@
 import logging
-from time import time, sleep
+from time import time
 
-from threading import Thread
+from threading import Thread, BoundedSemaphore, Lock
 from queue import Empty, Full, Queue
 from typing import List
 import json
 from config.configuration import Configuration
 
 from did_manager import DIDManager
-from state_engine import initialize_did_cache, get_did_cache, set_did_cache
+from state_engine import initialize_did_cache, did_cache_key, update_did_cache
 
 from record_filemgr import RecordFileManager
 from state_manager import StateManager
+from command_scheduler import coalesce_command_sets
 from influxdb import influxdb_connect, influxdb_disconnect, influxdb_write_record
 from exceptions import RuntimeError
 
@@ -30,20 +31,27 @@ class RecordStateManager(StateManager):
         self._request_queue = request_queue
         self._response_queue = response_queue
         self._did_manager = DIDManager()
-        sync_queue = Queue()
-        self._request_thread = Thread(target=self._request_task, args=(sync_queue,), name='state_request')
-        self._response_thread = Thread(target=self._response_task, args=(sync_queue,), name='state_response')
+        self._request_thread = Thread(target=self._request_task, name='state_request')
+        self._response_thread = Thread(target=self._response_task, name='state_response')
         initialize_did_cache()
         self._file_manager = RecordFileManager(config.record)
         config_record = dict(config.record)
         self._caching = config_record.get('caching', True)
+        self._inflight_window = max(config_record.get('inflight_window', 4), 1)
+        self._inflight_slots = BoundedSemaphore(self._inflight_window)
+        self._command_sets_in_flight = 0
+        self._command_sets_lock = Lock()
         _LOGGER.debug(f"Database caching is {'enabled' if self._caching else 'disabled'}")
+        _LOGGER.debug(f"Up to {self._inflight_window} command set jobs in flight")
         influxdb_connect(config.influxdb2)
 
-    def start(self) -> List[Thread]:
+    def start(self, threaded: bool = True) -> List[Thread]:
         super().start()
         self._exit_requested = False
         self._file_manager.start()
+        if not threaded:
+            # the asyncio engine drives the command queue and calls process_responses()
+            return []
         self._request_thread.start()
         self._response_thread.start()
         return [self._request_thread, self._response_thread]
@@ -53,143 +61,134 @@ class RecordStateManager(StateManager):
         influxdb_disconnect()
         self._file_manager.stop()
         self._exit_requested = True
+        self._command_scheduler.notify()
+        self._command_scheduler.log_statistics()
         if self._request_thread.is_alive():
             self._request_thread.join()
         if self._response_thread.is_alive():
             self._response_thread.join()
 
-    def _request_task(self, sync_queue: Queue) -> None:
+    def command_queue_empty(self) -> bool:
+        return super().command_queue_empty() and self._command_sets_in_flight == 0
+
+    def command_set_dispatched(self) -> None:
+        with self._command_sets_lock:
+            self._command_sets_in_flight += 1
+
+    def command_set_completed(self) -> None:
+        with self._command_sets_lock:
+            self._command_sets_in_flight -= 1
+
+    def inflight_window(self) -> int:
+        return self._inflight_window
+
+    def _request_task(self) -> None:
         # Steps done in _request_task:
-        #   - get a command set
-        #   - wait until it ready to fire
-        #   - add the command set back if runs at intervals
-        #   - wait for command set to execute
+        #   - wait for a free slot in the in-flight window
+        #   - wait until one or more command sets are due
+        #   - send the due command sets as a single job, one read per module
         try:
             while self._exit_requested == False:
-                trigger_at = None
-                while trigger_at is None:
-                    # get a command set
-                    try:
-                        with self._command_queue_lock:
-                            trigger_at, period, module_list = self._command_queue.get_nowait()
-                    except Empty:
-                        if self._exit_requested == True:
-                            return
-                        sleep(0.05)
-                        continue
-
-                    # wait until it ready to send to the request queue
-                    current_time = time()
-                    if current_time < trigger_at:
-                        sleep(trigger_at - current_time)
-                    try:
-                        self._request_queue.put(module_list)
-                    except Full:
-                        _LOGGER.error(f"no space in the request queue")
-                        self._exit_requested = True
-                        return
+                if not self._inflight_slots.acquire(timeout=0.5):
+                    continue
+                command_sets = []
+                while len(command_sets) == 0 and self._exit_requested == False:
+                    command_sets = self._command_scheduler.wait_due(timeout=0.5)
+                if len(command_sets) == 0:
+                    return
 
-                    # add the command set back if runs at intervals
-                    if self._putback_enabled and period > 0:
-                        with self._command_queue_lock:
-                            try:
-                                self._command_queue.put_nowait((time() + period, period, module_list))
-                                self._command_queue.task_done()
-                            except Full:
-                                _LOGGER.error(f"no space in the command queue")
-                                self._exit_requested = True
-                                return
-
-                    # wait for command set to be returned and processed
-                    got_sync = False
-                    while not got_sync:
-                        try:
-                            got_sync = sync_queue.get_nowait()
-                            sync_queue.task_done()
-                            #_LOGGER.debug("Command set completed processing")
-                            break
-                        except Empty:
-                            if self._exit_requested == True:
-                                return
-                            sleep(0.05)
-                            continue
+                module_list = coalesce_command_sets(command_sets)
+                try:
+                    self.command_set_dispatched()
+                    self._request_queue.put(module_list)
+                except Full:
+                    _LOGGER.error(f"no space in the request queue")
+                    self._exit_requested = True
+                    return
 
         except RuntimeError:
             raise
 
-    def _response_task(self, sync_queue: Queue) -> None:
+    def _response_task(self) -> None:
         # Steps done in _response_task:
         #   - get the responses from the command set
+        #   - free its slot in the in-flight window
         #   - process responses
         #   - update the vehicle state
         try:
             while self._exit_requested == False:
                 try:
                     responses = self._response_queue.get(timeout=0.5)
-                    sync_queue.put(True)
+                    self._inflight_slots.release()
+                    self.command_set_completed()
                 except Empty:
                     if self._exit_requested == True:
                         return
                     continue
 
-                for response_record in responses:
-                    arbitration_id = response_record.get('arbitration_id')
-                    response = response_record.get('response')
-                    if response.positive == False and response.invalid_reason == 'request timed out':
-                        did_list = response_record.get('did_list')
-                        current_time = time()
-                        for did_id in did_list:
-                            key = f"{arbitration_id:04X}:{did_id:04X}"
-                            states = self._did_manager.did_states(did_id)
-                            _, packing_length = self._did_manager.did_packing(did_id)
-                            for state in states:
-                                default_value = state.get('default_value', None)
-                                if default_value is None:
-                                    break
-                                payload = []
-                                for _ in range(packing_length):
-                                    payload.append(default_value)
-                                state_details = {'time': current_time, 'arbitration_id': arbitration_id, 'arbitration_id_hex': f"{arbitration_id:04X}", 'did_id': did_id, 'did_id_hex': f"{did_id:04X}", 'payload': payload}
-                                new_data_point = get_did_cache(key) is None or get_did_cache(key) != payload
-                                if new_data_point or self._caching == False:
-                                    set_did_cache(key, payload)
-                                    self._file_manager.write_record(state_details)
-                                    if codec := self._codec_manager.codec(did_id):
-                                        response = codec.decode(None, bytearray(payload))
-                                        decoded_payload = response.get('decoded', None)
-                                        if decoded_payload is None:
-                                            break
-                                        _LOGGER.debug(f"{arbitration_id:04X}/{did_id:04X}: {decoded_payload.get('decoded')} (default value)")
-                                    influxdb_state_data = self.update_vehicle_state(state_details)
-                                    influxdb_write_record(influxdb_state_data)
-                                else:
-                                    _LOGGER.debug(f"{arbitration_id:04X}/{did_id:04X}: {decoded_payload.get('decoded')} (default value)")
-                        continue
-
-                    for did_id in response.service_data.values:
-                        key = f"{arbitration_id:04X}:{did_id:04X}"
-                        response_packet = response.service_data.values[did_id]
-                        if response_packet is None:
-                            continue
-
-                        current_time = time()
-                        payload = response_packet.get('payload', None)
-                        state_details = {'time': current_time, 'arbitration_id': arbitration_id, 'arbitration_id_hex': f"{arbitration_id:04X}", 'did_id': did_id, 'did_id_hex': f"{did_id:04X}", 'payload': list(payload)}
-                        new_data_point = get_did_cache(key) is None or get_did_cache(key) != payload
-                        if new_data_point or self._caching == False:
-                            set_did_cache(key, payload)
-                            if new_data_point:
-                                self._file_manager.write_record(state_details)
-                                _LOGGER.debug(f"{arbitration_id:04X}/{did_id:04X}: {response_packet.get('decoded')}")
-                            decoded_state_details = {'time': current_time, 'arbitration_id': arbitration_id, 'arbitration_id_hex': f"{arbitration_id:04X}", 'did_id': did_id, 'did_id_hex': f"{did_id:04X}", 'payload': response_packet}
-                            influxdb_state_data = self.update_vehicle_state(decoded_state_details)
-                            influxdb_write_record(influxdb_state_data)
-                self._update_state_machine()
+                self.process_responses(responses)
                 self._response_queue.task_done()
 
         except RuntimeError:
             raise
 
+    def process_responses(self, responses: List[dict]) -> None:
+        # Steps done in process_responses:
+        #   - process responses
+        #   - update the vehicle state
+        for response_record in responses:
+            arbitration_id = response_record.get('arbitration_id')
+            response = response_record.get('response')
+            if response.positive == False and response.invalid_reason == 'request timed out':
+                did_list = response_record.get('did_list')
+                current_time = time()
+                for did_id in did_list:
+                    key = did_cache_key(arbitration_id, did_id)
+                    states = self._did_manager.did_states(did_id)
+                    _, packing_length = self._did_manager.did_packing(did_id)
+                    for state in states:
+                        default_value = state.get('default_value', None)
+                        if default_value is None:
+                            break
+                        payload = []
+                        for _ in range(packing_length):
+                            payload.append(default_value)
+                        state_details = {'time': current_time, 'arbitration_id': arbitration_id, 'arbitration_id_hex': f"{arbitration_id:04X}", 'did_id': did_id, 'did_id_hex': f"{did_id:04X}", 'payload': payload}
+                        new_data_point = update_did_cache(key, bytes(payload))
+                        if new_data_point or self._caching == False:
+                            self._file_manager.write_record(state_details)
+                            response = self._codec_manager.codec(did_id).decode(bytearray(payload))
+                            decoded_payload = response.get('decoded', None)
+                            if decoded_payload is None:
+                                break
+                            if _LOGGER.isEnabledFor(logging.DEBUG):
+                                _LOGGER.debug(f"{arbitration_id:04X}/{did_id:04X}: {decoded_payload} (default value)")
+                            influxdb_state_data = self.update_vehicle_state(state_details)
+                            influxdb_write_record(influxdb_state_data)
+                        elif _LOGGER.isEnabledFor(logging.DEBUG):
+                            _LOGGER.debug(f"{arbitration_id:04X}/{did_id:04X}: {payload} (default value, unchanged)")
+                continue
+
+            for did_id in response.service_data.values:
+                key = did_cache_key(arbitration_id, did_id)
+                response_packet = response.service_data.values[did_id]
+                if response_packet is None:
+                    continue
+
+                current_time = time()
+                payload = response_packet.get('payload', None)
+                state_details = {'time': current_time, 'arbitration_id': arbitration_id, 'arbitration_id_hex': f"{arbitration_id:04X}", 'did_id': did_id, 'did_id_hex': f"{did_id:04X}", 'payload': list(payload)}
+                new_data_point = update_did_cache(key, bytes(payload))
+                if new_data_point or self._caching == False:
+                    if new_data_point:
+                        self._file_manager.write_record(state_details)
+                        if _LOGGER.isEnabledFor(logging.DEBUG):
+                            _LOGGER.debug(f"{arbitration_id:04X}/{did_id:04X}: {response_packet.get('decoded')}")
+                    decoded_state_details = {'time': current_time, 'arbitration_id': arbitration_id, 'arbitration_id_hex': f"{arbitration_id:04X}", 'did_id': did_id, 'did_id_hex': f"{did_id:04X}", 'payload': response_packet}
+                    influxdb_state_data = self.update_vehicle_state(decoded_state_details)
+                    influxdb_write_record(influxdb_state_data)
+        self._update_state_machine()
+
     def _write_state_definition(self, state_dids: List, file: str) -> None:
         output_modules = []
         for module in state_dids:
@@ -0,0 +1,194 @@
+"""
+Streaming reader for the Record output files
+
+Events are read one at a time from binary ('.rec'), JSON Lines ('.jsonl') or JSON array files, so
+the memory used and the time to the first event don't grow with the length of the file.
+"""
+
+import os
+import json
+import logging
+from collections import deque
+from queue import Queue, Empty, Full
+from threading import Event, Thread
+from typing import Iterator, TextIO
+
+from record_binary import EXTENSION as BINARY_EXTENSION, BinaryRecordReader
+from exceptions import RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+_CHUNK_SIZE = 1 << 16
+_BATCH_SIZE = 32
+_WHITESPACE = ' \t\r\n'
+
+
+def _iter_json_lines(file: str, infile: TextIO) -> Iterator[dict]:
+    for line_number, line in enumerate(infile, start=1):
+        if len(line.strip()):
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                raise RuntimeError(f"JSON error in '{file}' at line {line_number}")
+
+
+def _iter_json_array(file: str, infile: TextIO) -> Iterator[dict]:
+    # the array elements are decoded one at a time from a buffer that is refilled in chunks
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    consumed = 0
+    eof = False
+    expecting = '['
+    while True:
+        while position < len(buffer) and buffer[position] in _WHITESPACE:
+            position += 1
+        if position == len(buffer) or (expecting.startswith('value') and not eof and len(buffer) - position < _CHUNK_SIZE):
+            if eof:
+                if position == len(buffer):
+                    raise RuntimeError(f"JSON error in '{file}', unexpected end of file")
+            else:
+                chunk = infile.read(_CHUNK_SIZE)
+                eof = len(chunk) == 0
+                consumed += position
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+        character = buffer[position]
+        if expecting == '[':
+            if character != '[':
+                raise RuntimeError(f"JSON error in '{file}', not a JSON array")
+            position += 1
+            expecting = 'value or ]'
+        elif character == ']' and expecting != 'value':
+            return
+        elif character == ',' and expecting == ', or ]':
+            position += 1
+            expecting = 'value'
+        elif expecting != ', or ]':
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if not eof:
+                    # an element longer than the buffer
+                    chunk = infile.read(_CHUNK_SIZE)
+                    eof = len(chunk) == 0
+                    buffer += chunk
+                    continue
+                raise RuntimeError(f"JSON error in '{file}' at character {consumed + e.pos}")
+            yield record
+            expecting = ', or ]'
+        else:
+            raise RuntimeError(f"JSON error in '{file}' at character {consumed + position}, expecting {expecting}")
+
+
+def iter_records(file: str, start_time: float = None) -> Iterator[dict]:
+    """Events of a binary, JSON Lines or JSON array file, from start_time on when it is given."""
+    if file.endswith(BINARY_EXTENSION):
+        # the binary time index skips to start_time
+        with BinaryRecordReader(file) as reader:
+            yield from reader.records(start_time)
+        return
+    try:
+        infile = open(file)
+    except FileNotFoundError as e:
+        raise RuntimeError(f"unable to open file '{file}' ({e.strerror})")
+    with infile:
+        records = _iter_json_lines(file, infile) if file.endswith('.jsonl') else _iter_json_array(file, infile)
+        if start_time is None:
+            yield from records
+        else:
+            for record in records:
+                if record.get('time') >= start_time:
+                    yield record
+
+
+class RecordStream:
+    """
+        Events of a Record output file, from start_time on when it is given, are read by the 'record_stream'
+        thread into a read-ahead queue of about read_ahead events, passed in batches to keep the queue overhead per event low.  next() returns
+        None at the end of the file, errors in the file are raised by next() once the events before them
+        have been returned.
+    """
+
+    def __init__(self, file: str, read_ahead: int = 256, start_time: float = None) -> None:
+        self._file = file
+        self._queue = Queue(maxsize=max(read_ahead // _BATCH_SIZE, 1))
+        self._batch = deque()
+        self._exit = Event()
+        self._thread = None
+        self._finished = False
+        if not os.path.exists(file):
+            raise RuntimeError(f"unable to open file '{file}' (No such file or directory)")
+        self._records = iter_records(file, start_time)
+
+    def start(self) -> Thread:
+        self._thread = Thread(target=self._stream_task, name='record_stream', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._exit.set()
+        if self._thread and self._thread.is_alive():
+            # make room for a blocked put
+            try:
+                while True:
+                    self._queue.get_nowait()
+            except Empty:
+                pass
+            self._thread.join()
+        self._close()
+
+    def next(self) -> dict:
+        if self._batch:
+            return self._batch.popleft()
+        if self._finished:
+            return None
+        if self._thread is None:
+            self.start()
+        item = self._queue.get()
+        if isinstance(item, list):
+            self._batch.extend(item)
+            return self._batch.popleft()
+        self._finished = True
+        if isinstance(item, Exception):
+            raise item
+        return None
+
+    def _stream_task(self) -> None:
+        # the first event is passed on its own so the playback can start right away
+        batch = []
+        batch_size = 1
+        try:
+            for record in self._records:
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    if not self._put(batch):
+                        return
+                    batch = []
+                    batch_size = _BATCH_SIZE
+            if batch and not self._put(batch):
+                return
+            self._put(None)
+        except RuntimeError as e:
+            if batch and not self._put(batch):
+                return
+            self._put(e)
+        except Exception as e:
+            _LOGGER.exception(f"Unexpected exception reading '{self._file}': {e}")
+            if batch and not self._put(batch):
+                return
+            self._put(RuntimeError(f"unable to read file '{self._file}' ({e})"))
+
+    def _put(self, item) -> bool:
+        while not self._exit.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _close(self) -> None:
+        self._records.close()
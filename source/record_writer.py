@@ -0,0 +1,222 @@
+"""
+Writer for the Record output files, JSON Lines ('.jsonl') or the binary format ('.rec')
+"""
+
+import os
+import json
+import logging
+from collections import deque
+from threading import Event, Thread
+from time import time, strftime, localtime
+
+from record_binary import EXTENSION as BINARY_EXTENSION, BinaryRecordEncoder, BinaryRecordReader
+from exceptions import RuntimeError
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+def format_record(record: dict) -> str:
+    """A record as one line of compact JSON, only the fields Playback uses are kept."""
+    payload = record.get('payload')
+    if isinstance(payload, (list, bytes, bytearray)):
+        return f'{{"time":{record.get("time")!r},"arbitration_id":{record.get("arbitration_id")},"did_id":{record.get("did_id")},"payload":[{",".join(map(str, payload))}]}}'
+    return json.dumps({'time': record.get('time'), 'arbitration_id': record.get('arbitration_id'), 'did_id': record.get('did_id'), 'payload': payload}, separators=(',', ':'))
+
+
+class JsonLinesEncoder:
+    """Encodes records as JSON Lines for RecordWriter."""
+
+    def header(self) -> bytes:
+        return b''
+
+    def encode(self, record: dict, offset: int) -> bytes:
+        return (format_record(record) + '\n').encode()
+
+    def footer(self, offset: int) -> bytes:
+        return b''
+
+
+def record_encoder(filename: str, index_interval: float = 60.0):
+    """The encoder for the file extension, binary for '.rec' and JSON Lines otherwise."""
+    if filename.endswith(BINARY_EXTENSION):
+        return BinaryRecordEncoder(index_interval)
+    return JsonLinesEncoder()
+
+
+def load_records(file: str) -> list:
+    """Records from a binary ('.rec') file, a JSON Lines ('.jsonl') file or a JSON array file."""
+    if file.endswith(BINARY_EXTENSION):
+        with BinaryRecordReader(file) as reader:
+            return list(reader)
+    try:
+        with open(file) as infile:
+            if not file.endswith('.jsonl'):
+                return json.load(infile)
+            records = []
+            for line_number, line in enumerate(infile, start=1):
+                if len(line.strip()):
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        raise RuntimeError(f"JSON error in '{file}' at line {line_number}")
+            return records
+    except FileNotFoundError as e:
+        raise RuntimeError(f"unable to open file '{file}' ({e.strerror})")
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"JSON error in '{file}' at line {e.lineno}")
+
+
+class RecordWriter:
+    """
+        Records are queued by the state processing and written as JSON Lines, one compact record per line, or
+        in the binary format when the filename ends in '.rec' (with an index entry every index_interval seconds),
+        through a single buffered file handle owned by the 'record_writer' thread.  The thread wakes up for
+        every flush_records records or once a second and flushes the handle after writing them, it is synced to disk every fsync_interval
+        seconds (0 only syncs when a file is closed).  The file is rotated when it reaches rotate_size bytes
+        or has been open rotate_interval seconds, rotated files get a time stamp added to their name.
+        A file that was cut short by a crash is still readable up to the last complete record.  Write errors
+        are logged and the records dropped, a file that could not be rotated is not written to anymore.
+    """
+
+    _ROTATE_TIMEOUT = 30.0
+
+    def __init__(self, filename: str, flush_records: int = 200, fsync_interval: float = 0.0, rotate_size: int = 0, rotate_interval: float = 0.0, index_interval: float = 60.0) -> None:
+        self._filename = filename
+        self._encoder = record_encoder(filename, index_interval)
+        self._flush_records = max(flush_records, 1)
+        self._fsync_interval = fsync_interval
+        self._rotate_size = rotate_size
+        self._rotate_interval = rotate_interval
+        self._records = deque()
+        self._wakeup = Event()
+        self._thread = None
+        self._outfile = None
+        self._opened = self._synced = time()
+        self._size = self._header_size = 0
+        self._unflushed = 0
+
+    def start(self) -> Thread:
+        self._open()
+        self._thread = Thread(target=self._writer_task, name='record_writer')
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        if self._thread and self._thread.is_alive():
+            self._records.append(None)
+            self._wakeup.set()
+            self._thread.join()
+        try:
+            self._close()
+        except OSError as e:
+            _LOGGER.error(f"Error closing '{self._filename}': {e}")
+
+    def write(self, record: dict) -> None:
+        self._records.append(record)
+        if len(self._records) >= self._flush_records:
+            self._wakeup.set()
+
+    def rotate(self, rename_to: str = None) -> str:
+        """Close the file once the records queued so far are written, rename it and start a new one."""
+        if self._thread is None or not self._thread.is_alive():
+            return None
+        done = Event()
+        result = {}
+        self._records.append(('rotate', rename_to, done, result))
+        self._wakeup.set()
+        deadline = time() + RecordWriter._ROTATE_TIMEOUT
+        while not done.wait(1.0):
+            if not self._thread.is_alive() or time() > deadline:
+                _LOGGER.error(f"Record writer did not rotate '{self._filename}'")
+                return None
+        return result.get('filename')
+
+    def _writer_task(self) -> None:
+        while True:
+            self._wakeup.wait(1.0)
+            self._wakeup.clear()
+            while len(self._records):
+                record = self._records.popleft()
+                if record is None:
+                    if self._unflushed:
+                        self._flush()
+                    return
+                if isinstance(record, tuple):
+                    _, rename_to, done, result = record
+                    try:
+                        result['filename'] = self._rotate(rename_to)
+                    except OSError as e:
+                        _LOGGER.error(f"Error rotating '{self._filename}', no more records are written: {e}")
+                    done.set()
+                    continue
+                if self._outfile is None:
+                    continue
+                try:
+                    encoded = self._encoder.encode(record, self._size)
+                except (TypeError, ValueError) as e:
+                    _LOGGER.error(f"Error encoding record: {e}")
+                    continue
+                try:
+                    self._outfile.write(encoded)
+                except OSError as e:
+                    _LOGGER.error(f"Error writing to '{self._filename}': {e}")
+                    continue
+                self._size += len(encoded)
+                self._unflushed += 1
+            self._idle()
+
+    def _idle(self) -> None:
+        if self._outfile is None:
+            return
+        if self._unflushed:
+            self._flush()
+        now = time()
+        try:
+            if self._fsync_interval > 0 and now - self._synced >= self._fsync_interval:
+                self._synced = now
+                os.fsync(self._outfile.fileno())
+            if (self._rotate_size > 0 and self._size >= self._rotate_size) or (self._rotate_interval > 0 and now - self._opened >= self._rotate_interval):
+                self._rotate(None)
+        except OSError as e:
+            _LOGGER.error(f"Error syncing or rotating '{self._filename}': {e}")
+
+    def _flush(self) -> None:
+        try:
+            self._outfile.flush()
+            _LOGGER.debug(f"Wrote {self._unflushed} data points to output file '{self._filename}'")
+        except OSError as e:
+            _LOGGER.error(f"Error writing {self._unflushed} data points to '{self._filename}': {e}")
+        self._unflushed = 0
+
+    def _rotate(self, rename_to: str) -> str:
+        if self._outfile is None:
+            return None
+        self._close()
+        root, extension = os.path.splitext(self._filename)
+        rotated_filename = rename_to if rename_to else f"{root}_{strftime('%Y-%m-%d_%H_%M_%S', localtime(self._opened))}{extension}"
+        if self._size > self._header_size or rename_to:
+            os.rename(self._filename, rotated_filename)
+        else:
+            rotated_filename = None
+        self._open()
+        return rotated_filename
+
+    def _open(self) -> None:
+        self._outfile = open(self._filename, 'wb', buffering=1 << 16)
+        header = self._encoder.header()
+        self._outfile.write(header)
+        self._opened = self._synced = time()
+        self._size = self._header_size = len(header)
+        self._unflushed = 0
+
+    def _close(self) -> None:
+        if self._outfile:
+            outfile, self._outfile = self._outfile, None
+            self._unflushed = 0
+            try:
+                outfile.write(self._encoder.footer(self._size))
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            finally:
+                outfile.close()
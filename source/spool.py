@@ -0,0 +1,144 @@
+"""
+Segmented spool for line protocol points
+"""
+
+import os
+import json
+import logging
+from threading import Lock
+
+from typing import List, Tuple
+
+
+_LOGGER = logging.getLogger('mme')
+
+
+class Spool:
+    """
+        Append-only spool of text lines kept in numbered segment files of about the segment size.
+
+        Lines are read back in blocks from the committed position, the position only moves when the
+        block is committed after it was written so a failed write is read again rather than appended
+        again.  Segments that have been read completely are deleted and the committed position is
+        saved in a checkpoint file, a restart resumes where the replay stopped.  Memory use is one
+        block however long the spool gets.
+    """
+
+    _checkpoint_file = 'checkpoint.json'
+    _segment_suffix = '.lp'
+
+    def __init__(self, path: str, segment_size: int = 1048576) -> None:
+        self._path = path
+        self._segment_size = segment_size
+        self._lock = Lock()
+        self._outfile = None
+        os.makedirs(path, exist_ok=True)
+
+        self._segments = sorted([int(name[:-len(Spool._segment_suffix)]) for name in os.listdir(path)
+                                 if name.endswith(Spool._segment_suffix) and name[:-len(Spool._segment_suffix)].isdigit()])
+        checkpoint = self._load_checkpoint()
+        self._sizes = {}
+        self._offset = 0
+        for segment in list(self._segments):
+            if segment < checkpoint.get('segment'):
+                self._remove_segment(segment)
+            elif segment == checkpoint.get('segment'):
+                self._offset = checkpoint.get('offset')
+        self._sizes = {segment: os.path.getsize(self._segment_file(segment)) for segment in self._segments}
+        # appends always start a new segment, a line cut short by a crash stays at the end of an old one
+        self._tail = self._segments[-1] + 1 if len(self._segments) else checkpoint.get('segment') + 1
+        if self.pending():
+            _LOGGER.info(f"Spool '{path}' has {sum(self._sizes.values()) - self._offset} bytes in {len(self._segments)} segments to replay")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._outfile:
+                self._outfile.close()
+                self._outfile = None
+
+    def append(self, lines: List[str]) -> None:
+        data = ''.join([f"{line}\n" for line in lines]).encode('utf-8')
+        with self._lock:
+            if self._outfile is None or self._sizes.get(self._tail, 0) >= self._segment_size:
+                self._open_segment()
+            self._outfile.write(data)
+            self._outfile.flush()
+            self._sizes[self._tail] += len(data)
+
+    def pending(self) -> bool:
+        segments = self._segments
+        return len(segments) > 1 or (len(segments) == 1 and self._offset < self._sizes.get(segments[0], 0))
+
+    def read_block(self, count: int) -> Tuple[List[str], Tuple[int, int]]:
+        """Up to count lines from the committed position and the position after them, the position isn't moved."""
+        lines = []
+        with self._lock:
+            if len(self._segments) == 0:
+                return lines, None
+            index = 0
+            segment = self._segments[index]
+            offset = self._offset
+            while True:
+                with open(self._segment_file(segment), 'rb') as infile:
+                    infile.seek(offset)
+                    while len(lines) < count:
+                        line = infile.readline()
+                        if len(line) == 0:
+                            break
+                        offset = infile.tell()
+                        if line[-1:] != b'\n':
+                            _LOGGER.warning(f"Dropping incomplete line at the end of spool segment {self._segment_file(segment)}")
+                            break
+                        lines.append(line[:-1].decode('utf-8'))
+                if len(lines) >= count or index + 1 >= len(self._segments):
+                    break
+                index += 1
+                segment = self._segments[index]
+                offset = 0
+        return lines, (segment, offset)
+
+    def commit(self, position: Tuple[int, int]) -> None:
+        """Move the committed position after a block was written and delete the segments before it."""
+        if position is None:
+            return
+        segment, offset = position
+        with self._lock:
+            for old_segment in [old_segment for old_segment in self._segments if old_segment < segment]:
+                self._remove_segment(old_segment)
+            self._offset = offset
+            checkpoint_file = os.path.join(self._path, Spool._checkpoint_file)
+            with open(checkpoint_file + '.tmp', 'w') as outfile:
+                json.dump({'segment': segment, 'offset': offset}, outfile)
+            os.replace(checkpoint_file + '.tmp', checkpoint_file)
+
+    def _open_segment(self) -> None:
+        if self._outfile:
+            self._outfile.close()
+            self._tail += 1
+        self._outfile = open(self._segment_file(self._tail), 'ab')
+        if self._tail not in self._sizes:
+            self._segments.append(self._tail)
+            self._sizes[self._tail] = 0
+
+    def _remove_segment(self, segment: int) -> None:
+        try:
+            os.remove(self._segment_file(segment))
+        except FileNotFoundError:
+            pass
+        self._segments.remove(segment)
+        self._sizes.pop(segment, None)
+
+    def _segment_file(self, segment: int) -> str:
+        return os.path.join(self._path, f"{segment:08d}{Spool._segment_suffix}")
+
+    def _load_checkpoint(self) -> dict:
+        checkpoint = {'segment': self._segments[0] if len(self._segments) else 0, 'offset': 0}
+        try:
+            with open(os.path.join(self._path, Spool._checkpoint_file), 'r') as infile:
+                saved = json.load(infile)
+            checkpoint = {'segment': int(saved.get('segment')), 'offset': int(saved.get('offset'))}
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            _LOGGER.error(f"Spool checkpoint in '{self._path}' is corrupt, replaying from the first segment: {e}")
+        return checkpoint
@@ -6,6 +6,7 @@ from typing import Any, Tuple
 from hash import Hash, get_hash_fields
 from did import EngineStartRemote, EngineStartNormal, EngineStartDisable, ChargePlugConnected
 from did import KeyState, ChargingStatus, EvseType, GearCommanded, InferredKey
+from vehicle_state import ModuleHealth
 
 
 _LOGGER = logging.getLogger('mme')
@@ -15,25 +16,45 @@ class StateEngine:
 
     _state = {}
     _did_cache = {}
+    _module_health = {}
+
+def did_cache_key(arbitration_id: int, did_id: int) -> int:
+    return arbitration_id << 16 | did_id
 
 def initialize_did_cache() -> None:
     StateEngine._did_cache = {}
 
-def get_did_cache(key: str) -> Any:
+def get_did_cache(key: int) -> bytes:
     return StateEngine._did_cache.get(key, None)
 
-def set_did_cache(key: str, value: Any) -> None:
+def set_did_cache(key: int, value: bytes) -> None:
+    StateEngine._did_cache[key] = value
+
+def update_did_cache(key: int, value: bytes) -> bool:
+    # stores the payload and returns True if it is new or changed, the payloads are compared once
+    if StateEngine._did_cache.get(key, None) == value:
+        return False
     StateEngine._did_cache[key] = value
+    return True
 
 def delete_did_cache(hash: Hash) -> None:
-    try:
-        arbitration_id, did_id, _ = get_hash_fields(hash)
-        key = f"{arbitration_id:04X}:{did_id:04X}"
-        StateEngine._did_cache.pop(key)
+    arbitration_id, did_id, _ = get_hash_fields(hash)
+    if StateEngine._did_cache.pop(did_cache_key(arbitration_id, did_id), None) is not None:
         _LOGGER.debug(f"Deleted DID cache entry '{hash}'")
-    except KeyError:
+    else:
         _LOGGER.debug(f"Deleting DID cache entry '{hash}' failed")
-        pass
+
+
+def get_module_health(arbitration_id: int) -> ModuleHealth:
+    return StateEngine._module_health.get(arbitration_id, ModuleHealth.Responding)
+
+def set_module_health(arbitration_id: int, health: ModuleHealth) -> None:
+    StateEngine._module_health[arbitration_id] = health
+
+def module_sleeping(hash: Hash) -> bool:
+    # the last value of a DID from a sleeping module is stale
+    arbitration_id, _, _ = get_hash_fields(hash)
+    return get_module_health(arbitration_id) == ModuleHealth.Sleeping
 
 
 def get_state_timestamp(hash: Hash) -> int:
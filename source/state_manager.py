@@ -4,22 +4,24 @@ State definitions
 
 import logging
 from operator import truediv
-from threading import Lock
-from queue import PriorityQueue
 import json
 import time
+from types import MappingProxyType
 
 from typing import List
 from config.configuration import Configuration
 
 from codec_manager import *
+from did_manager import DIDManager
+from module_manager import ModuleManager
 
 from hash import *
 from synthetics import update_synthetics
 from vehicle_state import CallType, VehicleState
-from exceptions import RuntimeError
+from exceptions import FailedInitialization, RuntimeError
 
 from state_transition import StateTransistion
+from command_scheduler import CommandScheduler
 from state_engine import set_state, get_state_value
 
 
@@ -54,10 +56,8 @@ class StateManager(StateTransistion):
         ###self._vehicle_hash = hash(config.vehicle.vin)
         self._state = None
         self._state_function = self.dummy
-        self._putback_enabled = False
         self._codec_manager = CodecManager(config.record)
-        self._command_queue = PriorityQueue()
-        self._command_queue_lock = Lock()
+        self._command_scheduler = CommandScheduler()
         record_options = dict(config.record)
         self._minimum_trip = record_options.get('trip_minimum', 0.1)
         self._minimum_charge = record_options.get('charge_minimum', 0)
@@ -83,18 +83,23 @@ class StateManager(StateTransistion):
         assert len(state_functions) == len(StateManager._state_file_lookup)
         for k, v in StateManager._state_file_lookup.items():
             v['state_function'] = state_functions.get(k)
+        self._state_plans = self._compile_state_plans()
 
     def start(self) -> None:
+        self._codec_manager.start()
         self.change_state(VehicleState.Unknown)
 
     def stop(self) -> None:
-        pass
+        self._codec_manager.stop()
 
     def current_state(self) -> VehicleState:
         return self._state
 
     def command_queue_empty(self) -> bool:
-        return self._command_queue.empty()
+        return self._command_scheduler.empty()
+
+    def command_scheduler(self) -> CommandScheduler:
+        return self._command_scheduler
 
     def _load_state_definition(self, file: str) -> List[dict]:
         with open(file) as infile:
@@ -115,6 +120,44 @@ class StateManager(StateTransistion):
                 did['codec'] = codec
         return state_definition
 
+    def _compile_state_plans(self) -> MappingProxyType:
+        # every state file is loaded and checked once at startup, a state change only swaps plans
+        module_manager = ModuleManager()
+        did_manager = DIDManager()
+        state_plans = {}
+        for state, state_lookup in StateManager._state_file_lookup.items():
+            file = state_lookup.get('state_file')
+            command_sets = []
+            data_identifiers = {}
+            for module in self._load_state_definition(file):
+                self._check_state_module(file, module, module_manager, did_manager)
+                module_dids = data_identifiers.setdefault(module.get('module'), {})
+                for did in module.get('dids'):
+                    module_dids[did.get('did_id')] = did.get('codec')
+                if module.get('enable', True):
+                    command_sets.append((module.get('offset', 0), module.get('period', 5), (module,)))
+            state_plans[state] = MappingProxyType({'state_file': file, 'command_sets': tuple(command_sets), 'data_identifiers': MappingProxyType(data_identifiers)})
+        _LOGGER.debug(f"Compiled {len(state_plans)} state plans")
+        return MappingProxyType(state_plans)
+
+    def _check_state_module(self, file: str, module: dict, module_manager: ModuleManager, did_manager: DIDManager) -> None:
+        module_name = module.get('module')
+        if (module_record := module_manager.module(module_name)) is None:
+            raise FailedInitialization(f"State file '{file}' uses module '{module_name}' which is not defined in the module file")
+        if module_record.get('arbitration_id') != module.get('arbitration_id'):
+            raise FailedInitialization(f"State file '{file}' uses arbitration ID {module.get('arbitration_id'):04X} for module '{module_name}', the module file has {module_record.get('arbitration_id'):04X}")
+        for did in module.get('dids'):
+            if did_manager.did_name(did.get('did_id')) is None:
+                raise FailedInitialization(f"State file '{file}' uses DID {did.get('did_id'):04X} which is not defined in the DID file")
+
+    def module_data_identifiers(self) -> dict:
+        # union of the DID codecs used by each module across all the state files
+        data_identifiers = {}
+        for state_plan in self._state_plans.values():
+            for module_name, module_dids in state_plan.get('data_identifiers').items():
+                data_identifiers.setdefault(module_name, {}).update(module_dids)
+        return data_identifiers
+
     def change_state(self, new_state: VehicleState) -> None:
         if self._state == new_state or new_state == VehicleState.Unchanged:
             return
@@ -129,27 +172,14 @@ class StateManager(StateTransistion):
         self._state = new_state
         self._state_time = time.time()
         self._state_function = self._get_state_function(new_state)
-        self._state_file = self._get_state_file(new_state)
-        self._queue_commands = self._load_state_definition(self._state_file)
+        self._state_plan = self._state_plans.get(new_state)
+        self._state_file = self._state_plan.get('state_file')
         self._load_queue()
         self._state_function(call_type = CallType.Incoming)
 
     def _load_queue(self) -> None:
-        with self._command_queue_lock:
-            self._putback_enabled = False
-            while not self._command_queue.empty():
-                self._command_queue.get_nowait()
-            for module in self._queue_commands:
-                enable = module.get('enable', True)
-                if enable:
-                    period = module.get('period', 5)
-                    offset = module.get('offset', 0)
-                    payload = (time.time() + offset, period, [module])
-                    self._command_queue.put(payload)
-            self._putback_enabled = True
-
-    def _get_state_file(self, state) -> List[str]:
-        return StateManager._state_file_lookup.get(state).get('state_file')
+        self._command_scheduler.log_statistics()
+        self._command_scheduler.load(self._state_plan.get('command_sets'))
 
     def _get_state_function(self, state) -> List[str]:
         return StateManager._state_file_lookup.get(state).get('state_function')
@@ -193,11 +223,11 @@ class StateManager(StateTransistion):
                 states = payload.get('states')
                 for state in states:
                     for state_name, state_value in state.items():
-                        if hash := get_hash(f"{arbitration_id:04X}:{did_id:04X}:{state_name}"):
+                        if hash := lookup_hash(arbitration_id, did_id, state_name):
                             set_state(hash, state_value)
                             update_synthetics(hash)
                             if self._saved_hash(hash):
-                                state_data.append({'arbitration_id': arbitration_id, 'did_id': did_id, 'name': state_name, 'value': state_value})
+                                state_data.append({'arbitration_id': arbitration_id, 'did_id': did_id, 'name': state_name, 'value': state_value, 'hash': hash})
             return state_data
 
     def _update_state_machine(self) -> None:
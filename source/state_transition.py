@@ -3,7 +3,7 @@ from hashlib import sha256
 
 from state_engine import get_InferredKey, get_ChargePlugConnected, get_GearCommanded, get_ChargingStatus, get_KeyState, get_VIN
 from state_engine import get_EngineStartRemote, get_EngineStartDisable, get_EngineStartNormal
-from state_engine import get_state_value, set_state
+from state_engine import get_state_value, set_state, module_sleeping
 
 from did import InferredKey, ChargePlugConnected, GearCommanded, ChargingStatus, KeyState
 from did import EngineStartRemote, EngineStartNormal, EngineStartDisable
@@ -71,7 +71,8 @@ class StateTransistion(Charging, Trip):
     def idle(self, call_type: CallType) -> VehicleState:
         new_state = VehicleState.Unchanged
         if call_type == CallType.Default:
-            if inferred_key := get_InferredKey('idle'):
+            # the key state of a sleeping module is the one it had before it went to sleep
+            if not module_sleeping(Hash.InferredKey) and (inferred_key := get_InferredKey('idle')):
                 if inferred_key == InferredKey.KeyOut:
                     if engine_start_remote := get_EngineStartRemote('idle'):
                         new_state = VehicleState.Preconditioning if engine_start_remote == EngineStartRemote.Yes else VehicleState.Idle
@@ -86,6 +87,9 @@ class StateTransistion(Charging, Trip):
     def accessory(self, call_type: CallType) -> VehicleState:
         new_state = VehicleState.Unchanged
         if call_type == CallType.Default:
+            if module_sleeping(Hash.InferredKey):
+                # the module reporting the key stopped answering, the vehicle went to sleep
+                return VehicleState.Idle
             if inferred_key := get_InferredKey('accessory'):
                 if inferred_key == InferredKey.KeyOut:
                     if engine_start_remote := get_EngineStartRemote('accessory'):
@@ -101,12 +105,15 @@ class StateTransistion(Charging, Trip):
     def on(self, call_type: CallType) -> VehicleState:
         new_state = VehicleState.Unchanged
         if call_type == CallType.Incoming:
-            if not CodecManager._gps_server_enabled:
-                _LOGGER.info(f"Checking for precise GPS server at '{CodecManager._gps_server}'")
+            if CodecManager._gps_poller is not None and not CodecManager._gps_poller.connected():
+                _LOGGER.info(f"Checking for precise GPS server at '{CodecManager._gps_poller.server()}'")
                 connect_gps_server()
             return new_state
 
         if call_type == CallType.Default:
+            if module_sleeping(Hash.InferredKey):
+                # the module reporting the key stopped answering, the vehicle went to sleep
+                return VehicleState.Idle
             if inferred_key := get_InferredKey('on'):
                 if inferred_key == InferredKey.KeyOut:
                     if engine_start_remote := get_EngineStartRemote('on'):
@@ -27,3 +27,9 @@ class VehicleState(Enum):
     Charge_DCFC = auto()            # the vehicle is DC fast charging
     Charge_Ending = auto()          # the vehicle is no longer charging
 
+
+@unique
+class ModuleHealth(Enum):
+    Responding = auto()             # the module is answering requests
+    Sleeping = auto()               # the module timed out repeatedly and is skipped until its backoff expires
+    Probing = auto()                # the backoff expired, the next request checks if the module is awake